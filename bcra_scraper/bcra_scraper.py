@@ -13,7 +13,7 @@ import time
 import click
 from pyfiglet import Figlet
 
-from bcra_scraper.exceptions import InvalidConfigurationError
+from bcra_scraper.exceptions import InvalidConfigurationError, SiteUnavailableError
 from bcra_scraper.mails import Email
 
 from bcra_scraper import (
@@ -126,6 +126,40 @@ def validate_entities_key_has_values(config):
         raise InvalidConfigurationError("No existen valores para entities")
 
 
+def get_bool_config(config, key, default=False):
+    value = config.get(key, default)
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ('true', 'false'):
+        return value.strip().lower() == 'true'
+    raise InvalidConfigurationError(
+        f"El valor de {key} debe ser true o false"
+    )
+
+
+def get_scraper_options(config):
+    """
+    Retorna las opciones de descarga, cache y parseo que comparten los
+    scrapers de todas las publicaciones, leídas de su configuración.
+    """
+    return {
+        'timeout': int(config['timeout']) if 'timeout' in config else None,
+        'tries': int(config.get('tries', 1)),
+        'transport': config.get('transport', 'http'),
+        'pool_size': int(config.get('pool_size', 1)),
+        'concurrency': int(config.get('concurrency', config.get('pool_size', 1))),
+        'requests_per_second': float(config.get('requests_per_second', 5)),
+        'backoff': float(config.get('backoff', 1)),
+        'failure_threshold': int(config.get('failure_threshold', 10)),
+        'cache_path': config.get('cache_path', 'datos/cache'),
+        'max_pages_per_driver': int(config.get('max_pages_per_driver', 500)),
+        'max_driver_rss_mb': int(config.get('max_driver_rss_mb', 1024)),
+        'html_parser': config.get('html_parser', 'html.parser'),
+        'parse_workers': int(config.get('parse_workers', 0)),
+        'fixed_point': get_bool_config(config, 'fixed_point'),
+    }
+
+
 def validate_file_path(file_path, config, file_path_key):
     try:
         file_path = file_path or config.get(file_path_key)
@@ -138,25 +172,6 @@ def validate_file_path(file_path, config, file_path_key):
         raise InvalidConfigurationError(f"Error: No hay configuración para {file_path_key}")
     return file_path
 
-def filter_parsed(parsed, csv_header):
-    for v in list(parsed.values()):
-        for r in list(v):
-            if r not in csv_header:
-                v.pop(r)
-    return parsed
-
-def get_csv_header(coin, config):
-    csv_header = ['indice_tiempo']
-    for k, v in config['entities'].items():
-        for hour, channels in v['coins'][coin].items():
-            for channel, state in channels['channels'].items():
-                if state:
-                    for flow in ['compra', 'venta']:
-                        csv_header.append(
-                            f'tc_ars_{coin}_{k}_{channel}_{flow}_{hour}hs'
-                        )
-    return csv_header
-
 def generate_dates_range(first_date, last_date):
     delta = last_date - first_date
     dates_range = []
@@ -258,23 +273,17 @@ def libor(ctx, start_date, end_date, refetch_start_date, refetch_end_date, confi
         validate_libor_rates_config(config)
         validate_libor_rates_has_values(config)
 
-        timeout = (
-            int(config.get('timeout'))
-            if 'timeout' in config.keys() else None
-        )
-        tries = int(config.get('tries', 1))
-
         scraper = BCRALiborScraper(
             url=config.get('url'),
-            timeout=timeout,
-            tries=tries,
+            **get_scraper_options(config),
             rates=config.get('rates'),
             skip_intermediate_panel_data=skip_intermediate_panel_data,
             intermediate_panel_path=intermediate_panel_path,
             skip_clean_last_dates=skip_clean_last_dates
         )
 
-        parsed = scraper.run(start_date, end_date, refetch_dates_range)
+        with scraper:
+            parsed = scraper.run(start_date, end_date, refetch_dates_range)
 
         processed_header = scraper.preprocess_header(scraper.rates)
 
@@ -292,6 +301,9 @@ def libor(ctx, start_date, end_date, refetch_start_date, refetch_end_date, confi
 
     except InvalidConfigurationError as err:
         click.echo(err)
+    except SiteUnavailableError as err:
+        click.echo(err)
+        ctx.exit(1)
 
 
 @cli.command()
@@ -392,22 +404,17 @@ def exchange_rates(ctx, start_date, end_date, refetch_start_date, refetch_end_da
         ensure_dir_exists(os.path.split(tc_file_path)[0])
         ensure_dir_exists(os.path.split(intermediate_panel_path)[0])
 
-        timeout = (
-            int(config.get('timeout'))
-            if 'timeout' in config.keys() else None
-        )
-        tries = int(config.get('tries', 1))
-
         scraper = BCRAExchangeRateScraper(
             url=config.get('url'),
-            timeout=timeout,
-            tries=tries,
+            **get_scraper_options(config),
+            stream_tables=get_bool_config(config, 'stream_tables'),
             coins=config.get('coins'),
             skip_intermediate_panel_data=skip_intermediate_panel_data,
             intermediate_panel_path=intermediate_panel_path,
             skip_clean_last_dates=skip_clean_last_dates
         )
-        parsed = scraper.run(start_date, end_date, refetch_dates_range)
+        with scraper:
+            parsed = scraper.run(start_date, end_date, refetch_dates_range)
 
         if parsed:
             coins = config.get('coins')
@@ -431,6 +438,9 @@ def exchange_rates(ctx, start_date, end_date, refetch_start_date, refetch_end_da
 
     except InvalidConfigurationError as err:
         click.echo(err)
+    except SiteUnavailableError as err:
+        click.echo(err)
+        ctx.exit(1)
 
 
 @cli.command()
@@ -530,16 +540,10 @@ def sml(ctx, config, start_date, end_date, refetch_start_date, refetch_end_date,
         ensure_dir_exists(os.path.split(real_file_path)[0])
         ensure_dir_exists(os.path.split(intermediate_panel_path)[0])
 
-        timeout = (
-            int(config.get('timeout'))
-            if 'timeout' in config.keys() else None
-        )
-        tries = int(config.get('tries', 1))
-
         scraper = BCRASMLScraper(
             url=config.get('url'),
-            timeout=timeout,
-            tries=tries,
+            **get_scraper_options(config),
+            stream_tables=get_bool_config(config, 'stream_tables'),
             coins=config.get('coins'),
             types=config.get('types'),
             skip_intermediate_panel_data=skip_intermediate_panel_data,
@@ -547,19 +551,19 @@ def sml(ctx, config, start_date, end_date, refetch_start_date, refetch_end_date,
             skip_clean_last_dates=skip_clean_last_dates
         )
 
-        parsed = scraper.run(start_date, end_date, refetch_dates_range)
+        with scraper:
+            parsed = scraper.run(start_date, end_date, refetch_dates_range)
 
         if parsed:
+            schema = scraper.get_schema()
             for k  in parsed.keys():
                 if k == 'peso_uruguayo':
-                    csv_header = ['indice_tiempo']
-                    csv_header.extend(config['types']['peso_uruguayo'].values())
+                    csv_header = schema.get_header('peso_uruguayo')
                     write_file(csv_header, parsed['peso_uruguayo'].values(), peso_uruguayo_file_path)
 
 
                 elif k == 'real':
-                    csv_header = ['indice_tiempo']
-                    csv_header.extend(config['types']['real'].values())
+                    csv_header = schema.get_header('real')
 
                     write_file(csv_header, parsed['real'].values(), real_file_path)
 
@@ -577,6 +581,9 @@ def sml(ctx, config, start_date, end_date, refetch_start_date, refetch_end_date,
         Email().send_validation_group_email(execution_start_time, execution_end_time, execution_total_time, start_date, end_date, skip_intermediate_panel_data, identifier='sml')
     except InvalidConfigurationError as err:
         click.echo(err)
+    except SiteUnavailableError as err:
+        click.echo(err)
+        ctx.exit(1)
 
 
 @cli.command()
@@ -678,34 +685,28 @@ def tce(ctx, config, start_date, end_date, refetch_start_date, refetch_end_date,
         ensure_dir_exists(os.path.split(euro_file_path)[0])
         ensure_dir_exists(os.path.split(intermediate_panel_path)[0])
 
-        timeout = (
-            int(config.get('timeout'))
-            if 'timeout' in config.keys() else None
-        )
-        tries = int(config.get('tries', 1))
-
         scraper = BCRATCEScraper(
             url=config.get('url'),
-            timeout=timeout,
-            tries=tries,
+            **get_scraper_options(config),
             coins=config.get('coins'),
             entities=config.get('entities'),
             skip_intermediate_panel_data=skip_intermediate_panel_data,
             intermediate_panel_path=intermediate_panel_path,
             skip_clean_last_dates=skip_clean_last_dates
         )
-        parsed = scraper.run(start_date, end_date, refetch_dates_range)
+        with scraper:
+            parsed = scraper.run(start_date, end_date, refetch_dates_range)
 
         if parsed:
+            schema = scraper.get_schema()
             for coin in ['dolar', 'euro']:
-                csv_header = get_csv_header(coin, config)
+                csv_header = schema.get_header(coin)
                 if coin == 'dolar':
                     csv_name = dolar_file_path
                 else:
                     csv_name = euro_file_path
 
-                filtered_parsed = filter_parsed(parsed[coin], csv_header)
-                write_file(csv_header, filtered_parsed.values(), csv_name)
+                write_file(csv_header, parsed[coin].values(), csv_name)
 
         else:
             click.echo("No se encontraron resultados")
@@ -721,3 +722,6 @@ def tce(ctx, config, start_date, end_date, refetch_start_date, refetch_end_date,
 
     except InvalidConfigurationError as err:
         click.echo(err)
+    except SiteUnavailableError as err:
+        click.echo(err)
+        ctx.exit(1)
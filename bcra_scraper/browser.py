@@ -0,0 +1,407 @@
+from contextlib import contextmanager
+import atexit
+import logging
+import os
+import queue
+import signal
+import tempfile
+import threading
+import time
+
+
+class BrowserDriverPool:
+    """
+    Pool de navegadores que se reparten entre los workers que descargan
+    los contenidos. Los navegadores se crean a medida que se necesitan,
+    hasta llegar al tamaño del pool.
+
+    Attributes
+    ----------
+    create_driver : Callable
+        Función que crea un nuevo navegador
+    size : int
+        Cantidad máxima de navegadores del pool
+    lifecycle : BrowserDriverLifecycle
+        Decide cuándo reciclar los navegadores y los cierra
+    """
+
+    def __init__(self, create_driver, size, lifecycle=None):
+        self.create_driver = create_driver
+        self.size = size
+        self.lifecycle = lifecycle
+        self.drivers = []
+        self.available = queue.Queue()
+        self.lock = threading.Lock()
+        self.created = 0
+
+    def acquire(self):
+        """
+        Retorna un navegador libre. Si no hay ninguno y el pool no está
+        completo crea uno nuevo, si no espera a que se libere alguno.
+        """
+        try:
+            return self.available.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.lock:
+            create = self.created < self.size
+            if create:
+                self.created += 1
+
+        if not create:
+            return self.available.get()
+
+        driver = self.create_driver()
+        with self.lock:
+            self.drivers.append(driver)
+        return driver
+
+    def release(self, driver):
+        """
+        Devuelve el navegador al pool. Si debe reciclarse se cierra y se
+        devuelve uno nuevo en su lugar.
+        """
+        if self.lifecycle:
+            new_driver = self.lifecycle.recycle(driver)
+            if new_driver is not driver:
+                with self.lock:
+                    self.drivers[self.drivers.index(driver)] = new_driver
+                driver = new_driver
+        self.available.put(driver)
+
+    @contextmanager
+    def driver(self):
+        """
+        Presta un navegador del pool mientras dura el bloque with.
+        """
+        driver = self.acquire()
+        try:
+            yield driver
+        finally:
+            self.release(driver)
+
+    def close(self):
+        """
+        Cierra todos los navegadores creados por el pool.
+        """
+        with self.lock:
+            drivers, self.drivers = self.drivers, []
+            self.created = 0
+        self.available = queue.Queue()
+        for driver in drivers:
+            if driver and self.lifecycle:
+                self.lifecycle.quit(driver)
+            elif driver:
+                driver.quit()
+
+
+class BrowserDriverLifecycle:
+    """
+    Administra el ciclo de vida de los navegadores: los crea, cuenta las
+    páginas que cargan, los recicla cuando superan la cantidad máxima de
+    páginas o de memoria y los cierra. Los navegadores que siguen
+    abiertos al terminar el proceso se cierran con atexit, y los que
+    quedaron abiertos por ejecuciones que terminaron de forma abrupta
+    se cierran antes de crear el primer navegador.
+
+    Attributes
+    ----------
+    create_driver : Callable
+        Función que crea un nuevo navegador
+    max_pages : int
+        Cantidad de páginas a partir de la cual se recicla un navegador
+    max_rss_mb : int
+        Memoria en MB a partir de la cual se recicla un navegador
+    rss_check_pages : int
+        Cantidad de páginas cargadas entre dos mediciones de memoria
+    rss_check_seconds : float
+        Segundos entre dos mediciones de memoria, aunque no se haya
+        llegado a rss_check_pages
+    """
+
+    def __init__(self, create_driver, max_pages=500, max_rss_mb=1024,
+                 rss_check_pages=20, rss_check_seconds=30):
+        self.create_driver = create_driver
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.rss_check_pages = rss_check_pages
+        self.rss_check_seconds = rss_check_seconds
+        self.pages = {}
+        self.rss_checks = {}
+        self.driver_pids = {}
+        self.lock = threading.Lock()
+
+    def create(self):
+        """
+        Crea un navegador y lo registra para cerrarlo al terminar.
+        """
+        reap_orphan_drivers()
+        driver = self.create_driver()
+        if driver:
+            register_driver(driver)
+            with self.lock:
+                self.pages[id(driver)] = 0
+                self.rss_checks[id(driver)] = (0, time.monotonic())
+        return driver
+
+    def count_page(self, driver):
+        with self.lock:
+            self.pages[id(driver)] = self.pages.get(id(driver), 0) + 1
+
+    def should_recycle(self, driver):
+        """
+        Indica si el navegador cargó demasiadas páginas o usa demasiada
+        memoria y debe reemplazarse por uno nuevo.
+        """
+        with self.lock:
+            pages = self.pages.get(id(driver), 0)
+            check_rss = self.max_rss_mb and self.is_rss_check_due(driver, pages)
+        if self.max_pages and pages >= self.max_pages:
+            return True
+        if check_rss:
+            return self.get_rss_mb(driver) >= self.max_rss_mb
+        return False
+
+    def is_rss_check_due(self, driver, pages):
+        """
+        Indica si corresponde medir la memoria del navegador: se mide
+        cada rss_check_pages páginas o cada rss_check_seconds segundos,
+        para no recorrer /proc en cada página. Se llama con el lock
+        tomado.
+        """
+        now = time.monotonic()
+        checked_pages, checked_at = self.rss_checks.setdefault(
+            id(driver), (0, now)
+        )
+        due = (
+            pages - checked_pages >= self.rss_check_pages
+            or now - checked_at >= self.rss_check_seconds
+        )
+        if due:
+            self.rss_checks[id(driver)] = (pages, now)
+        return due
+
+    def get_rss_mb(self, driver):
+        """
+        Mide la memoria del navegador usando los pids de sus procesos
+        de la medición anterior. Los pids se vuelven a buscar en /proc
+        solo la primera vez o cuando alguno de ellos terminó.
+        """
+        pid = get_driver_pid(driver)
+        if not pid:
+            return 0
+        pids = self.driver_pids.get(id(driver))
+        if not pids or not all(map(is_process_alive, pids)):
+            pids = [pid] + get_descendant_pids(pid)
+            self.driver_pids[id(driver)] = pids
+        return get_driver_rss_mb(driver, pids)
+
+    def recycle(self, driver):
+        """
+        Retorna el mismo navegador, o uno nuevo si debe reciclarse.
+        """
+        if not self.should_recycle(driver):
+            return driver
+        logging.info('Se reinicia el navegador para liberar memoria')
+        self.quit(driver)
+        return self.create()
+
+    def quit(self, driver):
+        with self.lock:
+            self.pages.pop(id(driver), None)
+            self.rss_checks.pop(id(driver), None)
+            self.driver_pids.pop(id(driver), None)
+        quit_driver(driver)
+
+
+_registered_drivers = {}
+_registered_drivers_lock = threading.Lock()
+_orphans_reaped = False
+
+
+def get_pids_dir():
+    return os.path.join(tempfile.gettempdir(), 'bcra_scraper', 'drivers')
+
+
+def get_driver_pid(driver):
+    """
+    Retorna el pid del proceso de chromedriver, o None si no se conoce.
+    """
+    service = getattr(driver, 'service', None)
+    process = getattr(service, 'process', None)
+    pid = getattr(process, 'pid', None)
+    return pid if isinstance(pid, int) else None
+
+
+def register_driver(driver):
+    """
+    Registra el navegador para cerrarlo al terminar el proceso, y anota
+    en disco los pids de chromedriver y chrome para poder cerrarlos si
+    el proceso termina de forma abrupta.
+    """
+    pid = get_driver_pid(driver)
+    with _registered_drivers_lock:
+        _registered_drivers[id(driver)] = driver
+    if not pid:
+        return
+
+    pids = [pid] + get_descendant_pids(pid)
+    try:
+        os.makedirs(get_pids_dir(), exist_ok=True)
+        with open(get_pids_file_path(os.getpid(), pid), 'w') as pids_file:
+            pids_file.write(' '.join(str(p) for p in pids))
+    except OSError:
+        pass
+
+
+def quit_driver(driver):
+    """
+    Cierra el navegador y deja de registrarlo.
+    """
+    pid = get_driver_pid(driver)
+    with _registered_drivers_lock:
+        _registered_drivers.pop(id(driver), None)
+    try:
+        driver.quit()
+    except Exception as e:
+        logging.warning(f'No se pudo cerrar el navegador: {e}')
+    if pid:
+        try:
+            os.remove(get_pids_file_path(os.getpid(), pid))
+        except OSError:
+            pass
+
+
+@atexit.register
+def quit_registered_drivers():
+    """
+    Cierra los navegadores que siguen abiertos.
+    """
+    with _registered_drivers_lock:
+        drivers = list(_registered_drivers.values())
+    for driver in drivers:
+        quit_driver(driver)
+
+
+def reap_orphan_drivers():
+    """
+    Cierra los procesos de chromedriver y chrome que quedaron abiertos
+    por ejecuciones anteriores que terminaron sin cerrarlos. Se hace una
+    sola vez por proceso.
+    """
+    global _orphans_reaped
+    with _registered_drivers_lock:
+        if _orphans_reaped:
+            return
+        _orphans_reaped = True
+
+    try:
+        file_names = os.listdir(get_pids_dir())
+    except OSError:
+        return
+
+    for file_name in file_names:
+        owner_pid = file_name.split('-')[0]
+        if not owner_pid.isdigit() or is_process_alive(int(owner_pid)):
+            continue
+
+        file_path = os.path.join(get_pids_dir(), file_name)
+        try:
+            with open(file_path) as pids_file:
+                pids = [int(pid) for pid in pids_file.read().split()]
+            os.remove(file_path)
+        except (OSError, ValueError):
+            continue
+
+        for pid in pids + [p for pid in pids for p in get_descendant_pids(pid)]:
+            if 'chrom' in get_process_name(pid):
+                logging.info(f'Se cierra el proceso {pid} de una ejecución anterior')
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except OSError:
+                    pass
+
+
+def get_pids_file_path(owner_pid, driver_pid):
+    return os.path.join(get_pids_dir(), f'{owner_pid}-{driver_pid}')
+
+
+def is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def get_process_name(pid):
+    try:
+        with open(f'/proc/{pid}/comm') as comm_file:
+            return comm_file.read().strip()
+    except OSError:
+        return ''
+
+
+def get_descendant_pids(pid):
+    """
+    Retorna los pids de los procesos descendientes de pid, leyendo
+    /proc. Retorna una lista vacía si /proc no está disponible.
+    """
+    children = {}
+    try:
+        proc_pids = [int(name) for name in os.listdir('/proc') if name.isdigit()]
+    except OSError:
+        return []
+
+    for proc_pid in proc_pids:
+        try:
+            with open(f'/proc/{proc_pid}/stat') as stat_file:
+                stat = stat_file.read()
+        except OSError:
+            continue
+        # El nombre del proceso puede tener espacios, el ppid es el
+        # segundo campo después del paréntesis que lo cierra.
+        ppid = int(stat[stat.rindex(')') + 2:].split()[1])
+        children.setdefault(ppid, []).append(proc_pid)
+
+    descendants = []
+    pending = [pid]
+    while pending:
+        for child in children.get(pending.pop(), []):
+            descendants.append(child)
+            pending.append(child)
+    return descendants
+
+
+def get_driver_rss_mb(driver, pids=None):
+    """
+    Retorna la memoria en MB que usan chromedriver y los procesos de
+    chrome que creó. Retorna 0 si no se puede medir.
+
+    Parameters
+    ----------
+    driver : WebDriver
+        Navegador a medir
+    pids : list
+        Pids de chromedriver y sus descendientes ya conocidos. Si no se
+        indican se buscan en /proc.
+    """
+    if pids is None:
+        pid = get_driver_pid(driver)
+        if not pid:
+            return 0
+        pids = [pid] + get_descendant_pids(pid)
+
+    rss_kb = 0
+    for process_pid in pids:
+        try:
+            with open(f'/proc/{process_pid}/status') as status_file:
+                for line in status_file:
+                    if line.startswith('VmRSS:'):
+                        rss_kb += int(line.split()[1])
+        except OSError:
+            continue
+    return rss_kb / 1024
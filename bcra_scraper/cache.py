@@ -0,0 +1,317 @@
+from collections import OrderedDict
+from datetime import date
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+def make_key(source, url, params):
+    """
+    Retorna la clave de una página, que la identifica por la
+    publicación, la url y los valores enviados en el formulario.
+
+    Parameters
+    ----------
+    source : str
+        Nombre de la publicación, por ejemplo 'libor'
+    url : str
+        Url del formulario
+    params : Dict
+        Valores enviados en el formulario
+    """
+    data = json.dumps([source, url, params], sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache en disco de las páginas descargadas. Cada página se guarda
+    comprimida con gzip y se identifica por la publicación, la url y los
+    parámetros del formulario enviado.
+
+    Junto con cada página se guardan los validadores de la respuesta
+    (ETag y Last-Modified), que permiten revalidarla con un request
+    condicional cuando vence.
+
+    El tiempo de vida de una página depende de la antigüedad que tenía la
+    fecha pedida cuando se guardó: las páginas guardadas cuando la fecha
+    ya era vieja prácticamente no cambian, las guardadas cuando era
+    reciente pueden corregirse y las guardadas el mismo día siempre se
+    vuelven a pedir, aunque hoy su fecha sea vieja.
+
+    Attributes
+    ----------
+    path : str
+        Directorio donde se guardan las páginas
+    recent_days : int
+        Antigüedad en días a partir de la cual una fecha se considera vieja
+    recent_ttl : int
+        Tiempo de vida en segundos de las páginas de fechas recientes
+    """
+
+    def __init__(self, path, recent_days=21, recent_ttl=24 * 60 * 60):
+        self.path = path
+        self.recent_days = recent_days
+        self.recent_ttl = recent_ttl
+
+    def get_ttl(self, single_date=None, stored_on=None):
+        """
+        Retorna el tiempo de vida en segundos de la página de una fecha,
+        o None si no vence. Las páginas que no corresponden a una fecha,
+        como las que tienen toda la serie de una moneda, se tratan como
+        páginas del día.
+
+        Parameters
+        ----------
+        single_date : date
+            Fecha de la página
+        stored_on : date
+            Día en que se guardó la página, por defecto hoy
+        """
+        if single_date is None:
+            return 0
+        age = ((stored_on or date.today()) - single_date).days
+        if age <= 0:
+            return 0
+        if age <= self.recent_days:
+            return self.recent_ttl
+        return None
+
+    def get(self, key, ttl=None):
+        """
+        Retorna el contenido guardado para la clave, o None si no existe
+        o venció.
+
+        Parameters
+        ----------
+        key : str
+            Clave de la página, retornada por make_key
+        ttl : int
+            Tiempo de vida en segundos, None si no vence
+        """
+        file_path = self._get_file_path(key)
+        try:
+            if ttl is not None and time.time() - os.path.getmtime(file_path) >= ttl:
+                return None
+            with gzip.open(file_path, 'rt', encoding='utf-8') as cache_file:
+                return cache_file.read()
+        except (OSError, EOFError):
+            return None
+
+    def get_fresh(self, key, single_date=None):
+        """
+        Retorna el contenido guardado para la clave si no venció según
+        la antigüedad que tenía la fecha cuando se guardó, o None.
+
+        Parameters
+        ----------
+        key : str
+            Clave de la página, retornada por make_key
+        single_date : date
+            Fecha de la página, None si tiene toda la serie
+        """
+        try:
+            stored_at = os.path.getmtime(self._get_file_path(key))
+        except OSError:
+            return None
+        return self.get(key, self.get_ttl(single_date, date.fromtimestamp(stored_at)))
+
+    def get_validators(self, key):
+        """
+        Retorna los validadores (ETag y Last-Modified) guardados con la
+        página, o None si no tiene.
+        """
+        try:
+            with open(self._get_file_path(key, '.json'), encoding='utf-8') as validators_file:
+                validators = json.load(validators_file)
+        except (OSError, ValueError):
+            return None
+        if not any(validators.values()):
+            return None
+        return validators
+
+    def set(self, key, content, validators=None):
+        """
+        Guarda el contenido de la página y sus validadores. Los archivos
+        se escriben completos antes de reemplazar a los anteriores, de
+        modo que nunca se lee una página a medio escribir.
+        """
+        self._write(
+            self._get_file_path(key),
+            lambda cache_file: self._write_content(cache_file, content)
+        )
+        validators_path = self._get_file_path(key, '.json')
+        if validators:
+            self._write(
+                validators_path,
+                lambda cache_file: cache_file.write(json.dumps(validators).encode('utf-8'))
+            )
+        elif os.path.exists(validators_path):
+            os.remove(validators_path)
+
+    def touch(self, key):
+        """
+        Marca la página como recién descargada, por ejemplo cuando el
+        sitio responde que no cambió.
+        """
+        try:
+            os.utime(self._get_file_path(key))
+        except OSError:
+            pass
+
+    def _write(self, file_path, write):
+        directory = os.path.dirname(file_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                write(tmp_file)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def _write_content(self, tmp_file, content):
+        with gzip.GzipFile(fileobj=tmp_file, mode='wb') as cache_file:
+            cache_file.write(content.encode('utf-8'))
+
+    def _get_file_path(self, key, extension='.html.gz'):
+        return os.path.join(self.path, key[:2], f'{key}{extension}')
+
+
+class ExtractedDocument:
+    """
+    Filas extraídas de un documento, que reemplazan a su html en los
+    contenidos descargados. parse_document las retorna sin volver a
+    parsear, de modo que el html se descarta apenas se descarga.
+
+    Attributes
+    ----------
+    rows : object
+        Resultado de la función de extracción del scraper
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+
+class ParsedDocumentCache:
+    """
+    Cache LRU en memoria de lo que se extrae de cada documento. Los
+    documentos se identifican por un hash de su contenido, de modo que un
+    mismo html se parsea una sola vez aunque se use para varias monedas o
+    fechas, o vuelva a llegar en el pase de refetch. No se guarda el html
+    ni el árbol parseado, solo las filas que retorna la función de
+    extracción.
+
+    Attributes
+    ----------
+    max_size : int
+        Cantidad máxima de documentos guardados. Al superarla se descarta
+        el usado hace más tiempo
+    hits : int
+        Cantidad de documentos que se tomaron del cache
+    misses : int
+        Cantidad de documentos que se tuvieron que parsear
+    """
+
+    def __init__(self, max_size=512):
+        self.max_size = max_size
+        self.documents = OrderedDict()
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def get(self, content, parse):
+        """
+        Retorna el resultado de parse para el contenido, parseándolo solo
+        si no está en el cache. Los contenidos que no son html se parsean
+        siempre.
+
+        Parameters
+        ----------
+        content : str
+            Html del documento
+        parse : Callable
+            Función que recibe el html y retorna las filas extraídas
+        """
+        if not isinstance(content, (str, bytes)):
+            return parse(content)
+        key = self._make_key(content, parse)
+        with self.lock:
+            if key in self.documents:
+                self.documents.move_to_end(key)
+                self.hits += 1
+                return self.documents[key]
+            self.misses += 1
+            pending = self.pending.pop(key, None)
+        result = None
+        if pending is not None:
+            try:
+                result = pending.result()
+            except Exception:
+                # El proceso que lo parseaba falló o se canceló
+                pending = None
+        if pending is None:
+            result = parse(content)
+        self._store(key, result)
+        return result
+
+    def put(self, content, parse, pending):
+        """
+        Guarda el resultado todavía no disponible del parseo del
+        contenido, por ejemplo el de un pool de procesos. La primera vez
+        que se pide el documento se espera ese resultado en lugar de
+        parsearlo. Los resultados pendientes no cuentan para `max_size`,
+        de modo que no se descartan antes de usarse.
+
+        Parameters
+        ----------
+        content : str
+            Html del documento
+        parse : Callable
+            Función de extracción con la que se va a pedir el documento
+        pending : Future
+            Resultado pendiente de la extracción
+        """
+        with self.lock:
+            self.pending[self._make_key(content, parse)] = pending
+
+    def contains(self, content, parse):
+        """
+        Retorna True si el documento ya está en el cache, parseado o
+        con su parseo pendiente.
+        """
+        if not isinstance(content, (str, bytes)):
+            return False
+        key = self._make_key(content, parse)
+        with self.lock:
+            return key in self.documents or key in self.pending
+
+    def _make_key(self, content, parse):
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        return (parse, hashlib.sha1(data).hexdigest())
+
+    def _store(self, key, result):
+        with self.lock:
+            self.documents[key] = result
+            while len(self.documents) > self.max_size:
+                self.documents.popitem(last=False)
+
+    def clear(self):
+        """
+        Vacía el cache y reinicia los contadores.
+        """
+        with self.lock:
+            self.documents.clear()
+            self.pending.clear()
+            self.hits = 0
+            self.misses = 0
@@ -1,3 +1,18 @@
 class InvalidConfigurationError(Exception):
     """Base class for exceptions in this module."""
     pass
+
+
+class InvalidFormFieldError(Exception):
+    """El campo o la opción no existe en el formulario de la página."""
+    pass
+
+
+class SiteUnavailableError(Exception):
+    """El sitio no responde y se interrumpe la ejecución."""
+    pass
+
+
+class FetchStopped(Exception):
+    """Se dejaron de consumir los contenidos y se interrumpen las descargas."""
+    pass
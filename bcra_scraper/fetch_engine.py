@@ -0,0 +1,66 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+
+
+class FetchEngine:
+    """
+    Motor de descargas basado en asyncio. Recibe un conjunto de tareas
+    independientes, por ejemplo (moneda, fecha), y las ejecuta manteniendo
+    como máximo `concurrency` descargas en curso. Los resultados se
+    entregan a medida que terminan, sin esperar al resto de las tareas.
+
+    Las funciones de descarga de los transportes son bloqueantes, por lo
+    que se ejecutan en un executor de `concurrency` threads: la cantidad
+    de threads depende del límite de concurrencia y no de la cantidad de
+    tareas.
+
+    Attributes
+    ----------
+    fetch : Callable
+        Función que recibe una tarea y retorna su contenido
+    concurrency : int
+        Cantidad máxima de descargas en curso
+    on_progress : Callable
+        Función que recibe la cantidad de tareas terminadas y el total
+    """
+
+    def __init__(self, fetch, concurrency=1, on_progress=None):
+        self.fetch = fetch
+        self.concurrency = max(concurrency, 1)
+        self.on_progress = on_progress
+
+    def run(self, tasks, on_result):
+        """
+        Ejecuta todas las tareas y llama a on_result(tarea, contenido)
+        por cada una a medida que termina.
+
+        Parameters
+        ----------
+        tasks : Iterable
+            Tareas a descargar
+        on_result : Callable
+            Función que recibe la tarea y su contenido
+        """
+        asyncio.run(self._run(list(tasks), on_result))
+
+    async def _run(self, tasks, on_result):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            # El contenido se entrega dentro de la tarea y no se retorna,
+            # de modo que los futures no lo retienen hasta el final
+            async def fetch_task(task):
+                async with semaphore:
+                    content = await loop.run_in_executor(executor, self.fetch, task)
+                on_result(task, content)
+
+            futures = [asyncio.ensure_future(fetch_task(task)) for task in tasks]
+            try:
+                for done, future in enumerate(asyncio.as_completed(futures), 1):
+                    await future
+                    if self.on_progress:
+                        self.on_progress(done, len(tasks))
+            finally:
+                for future in futures:
+                    future.cancel()
@@ -0,0 +1,205 @@
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from bcra_scraper.records import Record, get_record_schema
+
+
+PLAIN_NUMBER = r'-?\d+(?:\.\d+)?'
+
+# Con hasta 15 dígitos los enteros también son exactos en float64, el
+# tipo que usa pandas en la tabla pivot si faltan combinaciones.
+FIXED_POINT_DIGITS = 15
+
+
+def to_decimals(values, thousands=False, scale=None, blank=None,
+                dashes=False, other=None):
+    """
+    Convierte en una sola pasada una columna de strings con números en
+    formato es-AR (coma decimal) a Decimal. Los reemplazos y las marcas
+    se resuelven con operaciones vectorizadas de pandas sobre los strings
+    distintos de la columna, y cada uno se convierte a Decimal una sola
+    vez: en las páginas del BCRA un mismo valor se repite en muchas
+    celdas.
+
+    Parameters
+    ----------
+    values : list
+        Valores a convertir
+    thousands : bool
+        Si es True se quitan los puntos, que separan los miles
+    scale : int
+        Divisor que se aplica a cada valor, por ejemplo 100 para pasar
+        de porcentaje a proporción
+    blank : object
+        Valor que se retorna para los strings vacíos
+    dashes : bool
+        Si es True los strings con un guión, que el BCRA usa para las
+        fechas sin cotización, se convierten a None
+    other : Callable
+        Función que se aplica a los valores que no son strings. Por
+        defecto se retornan sin cambios
+    """
+    if not values:
+        return []
+    values = pd.Series(values, dtype=object)
+    if pd.api.types.infer_dtype(values, skipna=False) == 'string':
+        strings = values
+    else:
+        strings = values[values.map(type) == str]
+    result = values.to_numpy(copy=True)
+
+    if len(strings):
+        codes, uniques = pd.factorize(strings)
+        uniques = pd.Series(uniques, dtype=object)
+        numbers = uniques
+        if thousands:
+            numbers = numbers.str.replace('.', '', regex=False)
+        numbers = numbers.str.replace(',', '.', regex=False)
+        blanks = (uniques == '').to_numpy()
+        if dashes:
+            nulls = uniques.str.contains('-', regex=False).to_numpy()
+        else:
+            nulls = np.zeros(len(uniques), dtype=bool)
+        decimals = [
+            blank if is_blank else None if is_null else Decimal(number)
+            for number, is_blank, is_null in zip(numbers, blanks, nulls)
+        ]
+        if scale is not None:
+            decimals = [
+                value / scale if isinstance(value, Decimal) else value
+                for value in decimals
+            ]
+        converted = np.empty(len(decimals), dtype=object)
+        converted[:] = decimals
+        result[strings.index.to_numpy()] = converted[codes]
+
+    if other is not None and len(strings) < len(values):
+        for i in np.flatnonzero(values.map(type).to_numpy() != str):
+            result[i] = other(result[i])
+    return result.tolist()
+
+
+def normalize_rows(rows, skip=(), **options):
+    """
+    Retorna una lista con un registro por fila, en el que los valores se
+    convirtieron con to_decimals. Los valores de todas las filas se
+    convierten juntos, y cada registro mantiene el orden de las claves de
+    su fila; las filas con las mismas claves comparten el esquema.
+
+    Parameters
+    ----------
+    rows : list
+        Lista de diccionarios o registros
+    skip : Iterable
+        Claves cuyos valores se copian sin convertir
+    options : Dict
+        Opciones de to_decimals
+    """
+    schemas = [
+        row.schema if isinstance(row, Record) else get_record_schema(row)
+        for row in rows
+    ]
+    cells = [list(row.values()) for row in rows]
+    positions = {}
+    for schema in schemas:
+        if schema not in positions:
+            positions[schema] = [
+                i for i, column in enumerate(schema.columns) if column not in skip
+            ]
+    values = iter(to_decimals([
+        row_cells[i]
+        for row_cells, schema in zip(cells, schemas)
+        for i in positions[schema]
+    ], **options))
+    for row_cells, schema in zip(cells, schemas):
+        for i in positions[schema]:
+            row_cells[i] = next(values)
+    return [Record(schema, row_cells) for schema, row_cells in zip(schemas, cells)]
+
+
+def to_fixed_point(values, series):
+    """
+    Convierte una columna de números en texto, como los escribe el panel
+    intermedio, a enteros int64 escalados por 10 ** escala. La escala de
+    cada serie es la cantidad de decimales con la que el BCRA publica sus
+    valores. Los textos vacíos y los ceros se convierten a 0. Las
+    operaciones de texto se hacen una sola vez por cada valor distinto.
+
+    Retorna una tupla con la columna de enteros y un diccionario con la
+    escala de cada serie, o None si algún valor no se puede representar
+    exacto y con el mismo texto: si no es un número sin exponente, si una
+    serie publica valores con distinta cantidad de decimales o si tiene
+    más de FIXED_POINT_DIGITS dígitos.
+
+    Parameters
+    ----------
+    values : Series
+        Valores en texto, con NaN o '' para los vacíos
+    series : Series o list
+        Columna, o lista de columnas, que identifican la serie de cada valor
+    """
+    codes, uniques = pd.factorize(values)
+    text = pd.Series(uniques, dtype=object)
+    if not text.map(type).eq(str).all():
+        return None
+    blank = text == ''
+    if not text[~blank].str.match(rf'(?:{PLAIN_NUMBER})\Z').all():
+        return None
+    parts = text.str.partition('.')
+    digits = parts[0] + parts[2]
+    significant = digits.str.lstrip('-').str.lstrip('0')
+    if (significant.str.len() > FIXED_POINT_DIGITS).any():
+        return None
+
+    nonzero = (significant != '').to_numpy()
+    unique_fixed = np.zeros(len(uniques) + 1, dtype=np.int64)
+    unique_fixed[:-1][nonzero] = digits[nonzero].astype(np.int64).to_numpy()
+    unique_decimals = np.full(len(uniques) + 1, -1)
+    unique_decimals[:-1][nonzero] = parts[2][nonzero].str.len().to_numpy()
+
+    # Los NaN tienen código -1, que apunta al último elemento: 0 y sin escala.
+    row_decimals = pd.Series(unique_decimals[codes], index=values.index)
+    scaled = row_decimals >= 0
+    if isinstance(series, list):
+        keys = [column[scaled] for column in series]
+    else:
+        keys = series[scaled]
+    decimals = row_decimals[scaled].groupby(keys).agg(['min', 'max'])
+    if (decimals['min'] != decimals['max']).any():
+        return None
+    return (
+        pd.Series(unique_fixed[codes], index=values.index),
+        decimals['max'].to_dict(),
+    )
+
+
+def from_fixed_point(values, scales):
+    """
+    Retorna una matriz de objetos con el Decimal de cada entero escalado,
+    con el mismo texto que el valor leído del panel. Los ceros se
+    convierten a None y los NaN, que la tabla pivot usa para las
+    combinaciones que no están en el panel, se mantienen. Cada Decimal
+    se crea una sola vez por valor y escala.
+
+    Parameters
+    ----------
+    values : ndarray
+        Matriz de enteros escalados, con una columna por serie
+    scales : list
+        Cantidad de decimales de cada columna
+    """
+    scales = np.asarray(scales)
+    converted = np.empty(values.shape, dtype=object)
+    for scale in np.unique(scales):
+        columns = np.flatnonzero(scales == scale)
+        codes, uniques = pd.factorize(values[:, columns].ravel())
+        decimals = np.empty(len(uniques) + 1, dtype=object)
+        decimals[:-1] = [
+            None if value == 0 else Decimal(int(value)).scaleb(-int(scale))
+            for value in uniques
+        ]
+        decimals[-1] = np.nan
+        converted[:, columns] = decimals[codes].reshape(len(values), len(columns))
+    return converted
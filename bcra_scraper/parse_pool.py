@@ -0,0 +1,140 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import threading
+
+from bcra_scraper.parsers import get_html_parser
+
+
+class ExtractionContext:
+    """
+    Reemplazo del scraper dentro de los procesos del pool. Los métodos
+    de extracción de filas de los scrapers solo usan el backend de
+    parseo y los atributos que retorna get_extraction_settings, por lo
+    que se ejecutan con este objeto como self.
+
+    Attributes
+    ----------
+    html_parser : SoupParser o LxmlParser
+        Backend de parseo de html
+    """
+
+    def __init__(self, html_parser, **settings):
+        self.html_parser = html_parser
+        self.__dict__.update(settings)
+
+
+_html_parsers = {}
+
+
+def extract_document(extract, html_parser, content, settings=None):
+    """
+    Ejecuta en un proceso del pool la función de extracción sobre el
+    html. El backend de parseo se crea una sola vez por proceso.
+
+    Parameters
+    ----------
+    extract : Callable
+        Método de extracción de la clase del scraper, por ejemplo
+        BCRALiborScraper.parse_rates_table
+    html_parser : str
+        Nombre del backend de parseo
+    content : str
+        Html del documento
+    settings : Dict
+        Atributos del scraper que usa la función de extracción
+    """
+    if html_parser not in _html_parsers:
+        _html_parsers[html_parser] = get_html_parser(html_parser)
+    return extract(ExtractionContext(_html_parsers[html_parser], **(settings or {})), content)
+
+
+class ParsePool:
+    """
+    Pool de procesos que extrae las filas de los documentos a medida
+    que se descargan, de modo que el parseo del html, que usa la CPU,
+    avanza en paralelo con las descargas. En el pool solo se extrae el
+    texto de las celdas: la conversión de los valores y el armado de
+    los registros se hacen en el proceso principal, por lotes.
+
+    La cantidad de documentos enviados al pool que todavía no se
+    parsearon está acotada por `max_pending`: al alcanzarla, la descarga
+    que entrega el documento siguiente espera a que se libere un lugar.
+
+    Los procesos se crean con 'spawn', ya que se inician mientras los
+    threads de las descargas están en curso.
+
+    Attributes
+    ----------
+    html_parser : str
+        Nombre del backend de parseo que usan los procesos
+    workers : int
+        Cantidad de procesos del pool
+    max_pending : int
+        Cantidad máxima de documentos en cola o en parseo. Por defecto
+        es el doble de la cantidad de procesos
+    futures : set
+        Futures de los documentos enviados que todavía no terminaron
+    """
+
+    def __init__(self, html_parser, workers=1, max_pending=None):
+        self.html_parser = html_parser
+        self.workers = max(int(workers), 1)
+        self.max_pending = max(int(max_pending or 2 * self.workers), 1)
+        self.pending = threading.BoundedSemaphore(self.max_pending)
+        self.executor = None
+        self.futures = set()
+        self.futures_lock = threading.Lock()
+
+    def get_executor(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return self.executor
+
+    def submit(self, extract, content, settings=None):
+        """
+        Envía el documento al pool y retorna un Future con las filas
+        extraídas. Espera si hay `max_pending` documentos sin parsear.
+
+        Parameters
+        ----------
+        extract : Callable
+            Método de extracción de la clase del scraper
+        content : str
+            Html del documento
+        settings : Dict
+            Atributos del scraper que usa la función de extracción
+        """
+        self.pending.acquire()
+        try:
+            future = self.get_executor().submit(
+                extract_document, extract, self.html_parser, content, settings
+            )
+        except BaseException:
+            self.pending.release()
+            raise
+        with self.futures_lock:
+            self.futures.add(future)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        with self.futures_lock:
+            self.futures.discard(future)
+        self.pending.release()
+
+    def close(self):
+        """
+        Cancela los documentos que todavía no empezaron a parsearse y
+        termina los procesos del pool. Se vuelven a crear la próxima vez
+        que se envía un documento.
+        """
+        with self.futures_lock:
+            futures = list(self.futures)
+        for future in futures:
+            future.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
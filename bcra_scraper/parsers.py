@@ -0,0 +1,202 @@
+from bs4 import BeautifulSoup
+from lxml import etree
+import lxml.html
+
+from bcra_scraper.exceptions import InvalidConfigurationError
+from bcra_scraper.table_stream import collapse_whitespace
+
+
+# Etiquetas que cierran las celdas, filas o secciones de tabla que
+# quedaron abiertas, como lo hacen lxml y los navegadores. Para cada
+# etiqueta se indican las que cierra y las que limitan la búsqueda.
+IMPLIED_END_TAGS = {
+    'td': (('td', 'th'), ('tr', 'table')),
+    'th': (('td', 'th'), ('tr', 'table')),
+    'tr': (('td', 'th', 'tr'), ('thead', 'tbody', 'tfoot', 'table')),
+    'thead': (('td', 'th', 'tr', 'thead', 'tbody', 'tfoot'), ('table',)),
+    'tbody': (('td', 'th', 'tr', 'thead', 'tbody', 'tfoot'), ('table',)),
+    'tfoot': (('td', 'th', 'tr', 'thead', 'tbody', 'tfoot'), ('table',)),
+}
+
+
+class TableSoup(BeautifulSoup):
+    """
+    BeautifulSoup con html.parser que cierra las celdas y filas de las
+    tablas que no tienen etiqueta de cierre. html.parser no conoce esas
+    reglas y anida cada <td> sin cerrar dentro del anterior, por lo que
+    sin este cierre las filas no coinciden con las de lxml.
+    """
+
+    def handle_starttag(self, name, *args, **kwargs):
+        if name in IMPLIED_END_TAGS:
+            self.close_implied_tags(*IMPLIED_END_TAGS[name])
+        return super(TableSoup, self).handle_starttag(name, *args, **kwargs)
+
+    def close_implied_tags(self, closed, scope):
+        while True:
+            open_tag = next(
+                (tag for tag in reversed(self.tagStack) if tag.name in closed or tag.name in scope),
+                None
+            )
+            if open_tag is None or open_tag.name in scope:
+                return
+            self.handle_endtag(open_tag.name)
+
+
+class SoupParser:
+    """
+    Backend de parseo de html basado en BeautifulSoup con html.parser.
+
+    Los backends exponen las mismas operaciones sobre el documento, de
+    modo que los métodos parse_* de los scrapers recorren las tablas de
+    la misma forma con cualquiera de ellos.
+    """
+
+    name = 'html.parser'
+
+    def parse(self, content):
+        """
+        Retorna el documento parseado a partir del html.
+        """
+        return TableSoup(content, 'html.parser')
+
+    def find(self, node, tag, class_=None):
+        """
+        Retorna el primer descendiente del nodo con la etiqueta y la
+        clase recibidas, o None si no existe. Si la etiqueta es None se
+        busca en todas las etiquetas.
+        """
+        if class_ is None:
+            return node.find(tag)
+        return node.find(tag, class_=class_)
+
+    def find_all(self, node, tag):
+        """
+        Retorna todos los descendientes del nodo con la etiqueta recibida.
+        """
+        return node.find_all(tag)
+
+    def get_text(self, node):
+        """
+        Retorna el texto del nodo y de todos sus descendientes.
+        """
+        return node.text
+
+    def get_string(self, node):
+        """
+        Retorna el texto del nodo si tiene un único texto, o None si no
+        tiene texto o tiene varios hijos.
+        """
+        string = node.string
+        return None if string is None else str(string)
+
+    def get_parent(self, node):
+        return node.parent
+
+    def is_empty(self, node):
+        """
+        Retorna True si el nodo no existe o no tiene hijos.
+        """
+        return node is None or not node.contents
+
+
+class LxmlParser:
+    """
+    Backend de parseo de html basado en lxml. Las búsquedas se hacen con
+    expresiones XPath compiladas una sola vez por etiqueta y clase, y el
+    texto de los nodos sigue las mismas reglas que BeautifulSoup.
+    """
+
+    name = 'lxml'
+
+    texts = etree.XPath('descendant::text()', smart_strings=False)
+
+    def __init__(self):
+        self.xpaths = {}
+
+    def parse(self, content):
+        if not isinstance(content, (str, bytes)):
+            raise TypeError(f'El contenido {content!r} no es un html')
+        try:
+            return lxml.html.document_fromstring(content)
+        except etree.ParserError:
+            # Documento vacío
+            return lxml.html.Element('html')
+        except ValueError:
+            # lxml no acepta strings con declaración de encoding
+            return lxml.html.document_fromstring(content.encode('utf-8'))
+
+    def find(self, node, tag, class_=None):
+        found = self.get_xpath(tag, class_, first=True)(node, class_=class_ or '')
+        return found[0] if found else None
+
+    def find_all(self, node, tag):
+        return self.get_xpath(tag)(node, class_='')
+
+    def get_text(self, node):
+        return ''.join(collapse_whitespace(text) for text in self.texts(node))
+
+    def get_string(self, node):
+        while True:
+            children = list(node)
+            if node.text:
+                return None if children else collapse_whitespace(str(node.text))
+            if len(children) != 1 or children[0].tail:
+                return None
+            node = children[0]
+            if not isinstance(node.tag, str):
+                return collapse_whitespace(str(node.text)) if node.text else None
+
+    def get_parent(self, node):
+        return node.getparent()
+
+    def is_empty(self, node):
+        return node is None or (not node.text and len(node) == 0)
+
+    def get_xpath(self, tag, class_=None, first=False):
+        """
+        Retorna la expresión XPath compilada que busca los descendientes
+        con la etiqueta y la clase recibidas. Una clase con espacios se
+        compara con el atributo completo y una sin espacios con cada una
+        de las clases del atributo, igual que en BeautifulSoup.
+        """
+        if class_ is None:
+            match = None
+        elif ' ' in class_.strip():
+            match = 'attribute'
+        else:
+            match = 'class'
+        key = (tag, match, first)
+        if key not in self.xpaths:
+            predicates = {
+                None: '',
+                'attribute': '[normalize-space(@class)=normalize-space($class_)]',
+                'class': (
+                    "[contains(concat(' ', normalize-space(@class), ' '), "
+                    "concat(' ', $class_, ' '))]"
+                ),
+            }[match]
+            if first:
+                predicates += '[1]'
+            self.xpaths[key] = etree.XPath(f'descendant::{tag or "*"}{predicates}')
+        return self.xpaths[key]
+
+
+HTML_PARSERS = {
+    SoupParser.name: SoupParser,
+    LxmlParser.name: LxmlParser,
+}
+
+
+def get_html_parser(name):
+    """
+    Retorna el backend de parseo de html con el nombre recibido.
+
+    Parameters
+    ----------
+    name : str
+        Nombre del backend, 'html.parser' o 'lxml'
+    """
+    if name not in HTML_PARSERS:
+        raise InvalidConfigurationError(f'El parser {name} no es válido')
+    return HTML_PARSERS[name]()
@@ -0,0 +1,161 @@
+from urllib.parse import urlparse
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Limita la cantidad de requests por segundo. El balde se llena a razón
+    de `rate` tokens por segundo hasta `capacity` tokens, y cada request
+    consume uno.
+
+    Attributes
+    ----------
+    rate : float
+        Cantidad de tokens que se agregan por segundo
+    capacity : float
+        Cantidad máxima de tokens acumulados
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Consume un token, esperando lo necesario si el balde está vacío.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveRateLimiter:
+    """
+    Regula los requests a un host. Cada request consume un token del
+    TokenBucket y además ocupa un lugar de un límite de concurrencia que
+    se ajusta con AIMD: aumenta de a uno mientras la latencia se mantiene
+    cerca de la mejor observada y se reduce a la mitad ante timeouts o
+    errores 5xx.
+
+    Attributes
+    ----------
+    bucket : TokenBucket
+        Limita la cantidad de requests por segundo
+    limit : float
+        Cantidad de requests en curso permitida en este momento
+    max_concurrency : int
+        Límite máximo de requests en curso
+    """
+
+    LATENCY_TOLERANCE = 2
+    LATENCY_SLACK = 0.05
+    DECREASE_FACTOR = 0.5
+
+    def __init__(self, requests_per_second=5, max_concurrency=8, min_concurrency=1):
+        self.bucket = TokenBucket(requests_per_second)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max(max_concurrency, min_concurrency)
+        self.limit = float(min_concurrency)
+        self.in_flight = 0
+        self.healthy_responses = 0
+        self.best_latency = None
+        self.last_decrease = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Espera un lugar dentro del límite de concurrencia y un token.
+        Retorna el momento de inicio del request.
+        """
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+        self.bucket.acquire()
+        return time.monotonic()
+
+    def release(self, started_at, overloaded=False):
+        """
+        Libera el lugar ocupado por un request y ajusta el límite de
+        concurrencia según su resultado.
+
+        Parameters
+        ----------
+        started_at : float
+            Momento de inicio del request, retornado por acquire
+        overloaded : bool
+            Indica si el request terminó con un timeout o un error 5xx
+        """
+        now = time.monotonic()
+        latency = now - started_at
+        with self.condition:
+            self.in_flight -= 1
+            if overloaded:
+                self._decrease(now)
+            else:
+                self._increase(latency)
+            self.condition.notify_all()
+
+    def _increase(self, latency):
+        if self.best_latency is None or latency < self.best_latency:
+            self.best_latency = latency
+
+        if latency > self.best_latency * self.LATENCY_TOLERANCE + self.LATENCY_SLACK:
+            self.healthy_responses = 0
+            return
+
+        self.healthy_responses += 1
+        # Se suma uno por cada ventana completa de respuestas sanas.
+        if self.healthy_responses >= int(self.limit):
+            self.limit = min(self.limit + 1, self.max_concurrency)
+            self.healthy_responses = 0
+
+    def _decrease(self, now):
+        # Los errores de requests que ya estaban en curso cuando se redujo
+        # el límite no lo vuelven a reducir.
+        cooldown = self.best_latency or 0
+        if now - self.last_decrease < cooldown:
+            return
+        self.limit = max(self.limit * self.DECREASE_FACTOR, self.min_concurrency)
+        self.healthy_responses = 0
+        self.last_decrease = now
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(url, **kwargs):
+    """
+    Retorna el limitador compartido por todos los scrapers que acceden
+    al host de la url con los mismos parámetros. Un scraper configurado
+    con otros parámetros usa su propio limitador.
+    """
+    key = (urlparse(url).netloc, tuple(sorted(kwargs.items())))
+    with _rate_limiters_lock:
+        if key not in _rate_limiters:
+            _rate_limiters[key] = AdaptiveRateLimiter(**kwargs)
+        return _rate_limiters[key]
+
+
+def reset_rate_limiters():
+    """
+    Descarta los limitadores creados, junto con el estado que ajustaron
+    según las respuestas del sitio.
+    """
+    with _rate_limiters_lock:
+        _rate_limiters.clear()
@@ -0,0 +1,127 @@
+from collections.abc import Mapping
+
+import pandas as pd
+
+
+class RecordSchema:
+    """
+    Orden de las columnas que comparten los registros de una serie. Los
+    nombres de las columnas se guardan una sola vez en el esquema, y
+    cada registro guarda solo sus valores.
+
+    Attributes
+    ----------
+    columns : tuple
+        Nombres de las columnas, en orden
+    positions : Dict
+        Posición de cada columna en los valores de los registros
+    """
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+        self.positions = {column: i for i, column in enumerate(self.columns)}
+
+
+_record_schemas = {}
+
+
+def get_record_schema(columns):
+    """
+    Retorna el esquema de las columnas. Se crea uno solo por cada orden
+    de columnas, que comparten todos los registros con esas columnas.
+
+    Parameters
+    ----------
+    columns : Iterable
+        Nombres de las columnas, en orden
+    """
+    columns = tuple(columns)
+    if columns not in _record_schemas:
+        _record_schemas[columns] = RecordSchema(columns)
+    return _record_schemas[columns]
+
+
+class Record(Mapping):
+    """
+    Registro de un día de una serie, con la interfaz de un diccionario
+    de solo las columnas de su esquema. Se puede escribir con DictWriter
+    y comparar con diccionarios, y ocupa bastante menos memoria que un
+    diccionario con las mismas claves.
+
+    Attributes
+    ----------
+    schema : RecordSchema
+        Esquema compartido con las columnas del registro
+    cells : list
+        Valores del registro, en el orden de las columnas del esquema
+    """
+
+    __slots__ = ('schema', 'cells')
+
+    def __init__(self, schema, cells):
+        self.schema = schema
+        self.cells = cells
+
+    def __getitem__(self, column):
+        return self.cells[self.schema.positions[column]]
+
+    def __setitem__(self, column, value):
+        """
+        Cambia el valor de una columna del esquema. No se pueden agregar
+        columnas, ya que el esquema es compartido.
+        """
+        self.cells[self.schema.positions[column]] = value
+
+    def __contains__(self, column):
+        return column in self.schema.positions
+
+    def __iter__(self):
+        return iter(self.schema.columns)
+
+    def __len__(self):
+        return len(self.schema.columns)
+
+    def __repr__(self):
+        return f'Record({dict(self)!r})'
+
+
+def records_to_frame(records):
+    """
+    Retorna un dataframe con una fila por registro. Si todos comparten
+    el esquema el dataframe se arma directamente con sus valores; si no,
+    igual que con una lista de diccionarios.
+
+    Parameters
+    ----------
+    records : Iterable
+        Registros o diccionarios
+    """
+    records = list(records)
+    if records and all(
+        isinstance(record, Record) and record.schema is records[0].schema
+        for record in records
+    ):
+        return pd.DataFrame(
+            [record.cells for record in records],
+            columns=list(records[0].schema.columns),
+        )
+    return pd.DataFrame([
+        record if isinstance(record, dict) else dict(record) for record in records
+    ])
+
+
+def frame_to_records(df):
+    """
+    Retorna un diccionario con el índice de cada fila del dataframe como
+    clave y un registro con sus valores como valor, igual que
+    to_dict(orient="index") pero con un único esquema para todas las filas.
+
+    Parameters
+    ----------
+    df : DataFrame
+    """
+    schema = get_record_schema(df.columns)
+    return {
+        key: Record(schema, cells)
+        for key, cells in zip(df.index, df.to_numpy(dtype=object).tolist())
+    }
@@ -0,0 +1,148 @@
+import logging
+import random
+import threading
+import time
+
+from requests.exceptions import HTTPError, RequestException
+from selenium.common.exceptions import NoSuchElementException, WebDriverException
+
+from bcra_scraper.exceptions import InvalidFormFieldError, SiteUnavailableError
+
+
+def is_retryable_error(error):
+    """
+    Indica si vale la pena reintentar un request que falló con el error
+    recibido: errores de conexión, timeouts y respuestas 5xx o 429.
+    Un campo o una opción que no existe en el formulario, o una respuesta
+    4xx, no se resuelven reintentando.
+    """
+    if isinstance(error, (InvalidFormFieldError, NoSuchElementException)):
+        return False
+    if isinstance(error, HTTPError) and error.response is not None:
+        return error.response.status_code >= 500 or error.response.status_code == 429
+    return isinstance(error, (RequestException, WebDriverException))
+
+
+class CircuitBreaker:
+    """
+    Detecta que el sitio está caído: si se acumulan `failure_threshold`
+    fallas seguidas sin ninguna respuesta exitosa el circuito se abre y
+    todos los requests siguientes fallan inmediatamente, hasta que se
+    cierra con reset.
+
+    Attributes
+    ----------
+    failure_threshold : int
+        Cantidad de fallas seguidas que abren el circuito
+    """
+
+    def __init__(self, failure_threshold=10):
+        self.failure_threshold = failure_threshold
+        self.failures = 0
+        self.is_open = False
+        self.lock = threading.Lock()
+
+    def check(self):
+        if self.is_open:
+            raise SiteUnavailableError(
+                f'El sitio no responde: se produjeron {self.failures} fallas seguidas. '
+                'Se interrumpe la ejecución.'
+            )
+
+    def reset(self):
+        """
+        Cierra el circuito y descarta las fallas acumuladas.
+        """
+        with self.lock:
+            self.failures = 0
+            self.is_open = False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.is_open = True
+
+
+class RetryPolicy:
+    """
+    Política de reintentos de los scrapers. Los errores que se pueden
+    reintentar se reintentan hasta `tries` veces, esperando entre cada
+    intento un tiempo que crece exponencialmente, con jitter para que
+    los workers no reintenten todos a la vez.
+
+    Attributes
+    ----------
+    tries : int
+        Cantidad de intentos para cada request
+    backoff : float
+        Espera en segundos antes del primer reintento
+    max_backoff : float
+        Espera máxima en segundos entre dos intentos
+    circuit_breaker : CircuitBreaker
+        Detecta que el sitio está caído
+    """
+
+    def __init__(self, tries=1, backoff=1, max_backoff=60, circuit_breaker=None):
+        self.tries = max(tries, 1)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+
+    def get_delay(self, attempt):
+        """
+        Retorna la espera antes del reintento número `attempt`, elegida
+        al azar entre cero y el backoff exponencial (full jitter).
+        """
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def call(self, fetch, description, default='', on_exhausted=None):
+        """
+        Ejecuta fetch aplicando la política de reintentos. Si el error no
+        se puede reintentar o se agotan los intentos retorna default.
+
+        Parameters
+        ----------
+        fetch : Callable
+            Función sin parámetros que hace el request
+        description : str
+            Descripción del request para los mensajes, por ejemplo
+            'la fecha 2019-03-04'
+        default : object
+            Valor que se retorna si el request no se pudo hacer
+        on_exhausted : Callable
+            Función sin parámetros que se llama si se agotan los intentos
+        Raises
+        ------
+        SiteUnavailableError
+            si el circuito está abierto porque el sitio no responde
+        """
+        for attempt in range(1, self.tries + 1):
+            self.circuit_breaker.check()
+            try:
+                content = fetch()
+            except (RequestException, WebDriverException, InvalidFormFieldError) as e:
+                if not is_retryable_error(e):
+                    logging.warning(f'No se encontró {description}: {e}')
+                    return default
+                self.circuit_breaker.record_failure()
+                self.circuit_breaker.check()
+                if attempt == self.tries:
+                    logging.warning(
+                        f'Cantidad máxima de intentos alcanzada para {description}'
+                    )
+                    if on_exhausted:
+                        on_exhausted()
+                    return default
+                logging.warning(
+                    f'La conexion de internet ha fallado para {description}. Reintentando...'
+                )
+                time.sleep(self.get_delay(attempt))
+            else:
+                self.circuit_breaker.record_success()
+                return content
+        return default
@@ -0,0 +1,269 @@
+import re
+
+from bcra_scraper.exceptions import InvalidConfigurationError
+
+
+LIBOR_COLUMN_PATTERN = re.compile(r'libor_(.+)_dias')
+
+TCE_HOURS = ['11', '13', '15']
+
+TCE_CHANNELS = ['mostrador', 'electronico']
+
+TCE_FLOWS = ['compra', 'venta']
+
+TCE_COLUMN_INDEXES = {
+    ('mostrador', 'compra', '11'): 1,
+    ('mostrador', 'compra', '13'): 5,
+    ('mostrador', 'compra', '15'): 9,
+    ('electronico', 'compra', '11'): 3,
+    ('electronico', 'compra', '13'): 7,
+    ('electronico', 'compra', '15'): 11,
+    ('mostrador', 'venta', '11'): 2,
+    ('mostrador', 'venta', '13'): 6,
+    ('mostrador', 'venta', '15'): 10,
+    ('electronico', 'venta', '11'): 4,
+    ('electronico', 'venta', '13'): 8,
+    ('electronico', 'venta', '15'): 12
+}
+
+
+class LiborSchema:
+    """
+    Esquema de columnas de la tasa Libor, compilado una vez a partir
+    de los plazos de la configuración.
+
+    Attributes
+    ----------
+    rates : Dict
+        Diccionario con el plazo en días como clave y el nombre de la
+        columna como valor
+    columns : list
+        Nombres de las columnas de los plazos, en el orden de salida
+    header : list
+        Encabezado del csv de salida
+    panel_keys : Dict
+        Tipo del panel intermedio que corresponde a cada columna
+    valid_rates : set
+        Plazos cuya columna está en la configuración
+    """
+
+    def __init__(self, rates):
+        self.rates = rates
+        self.columns = list(rates.values())
+        self.header = ['indice_tiempo'] + self.columns
+        self.panel_keys = {}
+        for column in self.columns:
+            match = LIBOR_COLUMN_PATTERN.fullmatch(column)
+            if match:
+                self.panel_keys[column] = match.group(1)
+        self.column_names = {
+            panel_key: column for column, panel_key in self.panel_keys.items()
+        }
+        self.valid_rates = set(self.column_names)
+
+    def is_valid_rate(self, rate):
+        """
+        Retorna True si la columna del plazo está en la configuración.
+        """
+        return rate in self.valid_rates
+
+    def get_panel_key(self, column):
+        """
+        Retorna el tipo del panel intermedio de una columna.
+        """
+        if column not in self.panel_keys:
+            _, panel_key, _ = column.split('_')
+            self.panel_keys[column] = panel_key
+        return self.panel_keys[column]
+
+    def get_column(self, panel_key):
+        """
+        Retorna el nombre de la columna de un tipo del panel intermedio.
+        """
+        if panel_key not in self.column_names:
+            self.column_names[panel_key] = f'libor_{panel_key}_dias'
+        return self.column_names[panel_key]
+
+
+class SMLSchema:
+    """
+    Esquema de columnas del Sistema de Moneda Local, compilado una vez
+    a partir de los tipos de cambio de la configuración.
+
+    Attributes
+    ----------
+    types : Dict
+        Diccionario con cada moneda como clave y como valor otro
+        diccionario con el encabezado de la página y el nombre de la
+        columna de cada tipo de cambio
+    """
+
+    def __init__(self, types):
+        self.types = types
+        self.columns = {
+            coin: list(coin_types.items()) for coin, coin_types in (types or {}).items()
+        }
+        self.headers = {
+            coin: ['indice_tiempo'] + [column for _, column in columns]
+            for coin, columns in self.columns.items()
+        }
+
+    def get_columns(self, coin):
+        """
+        Retorna una lista de tuplas con el encabezado de la página y el
+        nombre de la columna de cada tipo de cambio de la moneda.
+        """
+        return self.columns.get(coin, [])
+
+    def get_header(self, coin):
+        """
+        Retorna el encabezado del csv de salida de la moneda.
+        """
+        return self.headers[coin]
+
+
+class TCESchema:
+    """
+    Esquema de columnas del tipo de cambio de entidades bancarias,
+    compilado a partir de la configuración de entidades. Cada parte se
+    arma una sola vez, la primera vez que se pide, y la comparten el
+    parseo, el panel intermedio y el encabezado del csv.
+
+    Las columnas se llaman tc_ars_{moneda}_{entidad}_{canal}_{flujo}_{hora}
+    y su clave en el panel intermedio es la tupla
+    (moneda, entidad, canal, flujo, hora).
+
+    Attributes
+    ----------
+    entities : Dict
+        Diccionario que contiene el nombre de los bancos y la
+        configuración de sus canales
+    """
+
+    def __init__(self, entities):
+        self.entities = entities
+        self.matchers = None
+        self.columns = {}
+        self.entity_columns = {}
+        self.headers = {}
+        self.panel_keys = {}
+        self.panel_key_sets = {}
+        self.column_names = {}
+
+    def get_matchers(self):
+        """
+        Retorna una lista con la clave, la configuración y la expresión
+        regular compilada del nombre de cada entidad.
+        """
+        if self.matchers is None:
+            self.matchers = [
+                (k, v, re.compile(re.escape(v.get('name'))))
+                for k, v in self.entities.items()
+            ]
+        return self.matchers
+
+    def get_channel_keys(self, entity, coin):
+        """
+        Retorna la lista de tuplas (canal, flujo, hora) habilitadas en la
+        configuración de la entidad para la moneda, en el orden de la
+        configuración. Los canales u horas que no tienen celda en la
+        tabla de la página se ignoran, y si la entidad no cotiza la
+        moneda la lista es vacía. Es el único recorrido de la
+        configuración: las columnas del parseo, del panel y del
+        encabezado salen de esta lista.
+
+        Raises
+        ------
+        InvalidConfigurationError
+            Si la configuración de la entidad no indica los canales de
+            cada hora de la moneda
+        """
+        try:
+            hours = self.entities[entity]['coins'].get(coin, {})
+            return [
+                (channel, flow, hour)
+                for hour, channels in hours.items()
+                for channel, state in channels['channels'].items()
+                if state
+                for flow in TCE_FLOWS
+                if (channel, flow, hour) in TCE_COLUMN_INDEXES
+            ]
+        except (KeyError, TypeError, AttributeError):
+            raise InvalidConfigurationError(
+                f'La configuración de la entidad {entity} para {coin} no es válida'
+            )
+
+    def get_columns(self, coin):
+        """
+        Retorna los nombres de las columnas habilitadas de la moneda. Los
+        canales deshabilitados en la configuración no tienen columna, de
+        modo que nunca se parsean, preprocesan ni guardan en el panel. El
+        encabezado del csv se arma con la misma lista.
+        """
+        if coin not in self.columns:
+            self.columns[coin] = [
+                self.get_column((coin, entity, channel, flow, f'{hour}hs'))
+                for entity in self.entities.keys()
+                for channel, flow, hour in self.get_channel_keys(entity, coin)
+            ]
+        return self.columns[coin]
+
+    def get_panel_keys(self, coin):
+        """
+        Retorna el conjunto de tuplas (entidad, canal, flujo, hora) de
+        las columnas habilitadas de la moneda, con las que se proyecta el
+        panel intermedio.
+        """
+        if coin not in self.panel_key_sets:
+            self.panel_key_sets[coin] = {
+                self.get_panel_key(column)[1:] for column in self.get_columns(coin)
+            }
+        return self.panel_key_sets[coin]
+
+    def get_entity_columns(self, entity, coin):
+        """
+        Retorna la lista de columnas habilitadas a completar para la
+        entidad y la moneda, cada una con el índice de su celda en la
+        fila.
+        """
+        key = (entity, coin)
+        if key not in self.entity_columns:
+            self.entity_columns[key] = [
+                (
+                    self.get_column((coin, entity, channel, flow, f'{hour}hs')),
+                    TCE_COLUMN_INDEXES[(channel, flow, hour)]
+                )
+                for channel, flow, hour in self.get_channel_keys(entity, coin)
+            ]
+        return self.entity_columns[key]
+
+    def get_header(self, coin):
+        """
+        Retorna el encabezado del csv de salida de la moneda, con las
+        mismas columnas que get_columns.
+        """
+        if coin not in self.headers:
+            self.headers[coin] = ['indice_tiempo'] + self.get_columns(coin)
+        return self.headers[coin]
+
+    def get_panel_key(self, column):
+        """
+        Retorna la tupla (moneda, entidad, canal, flujo, hora) de una
+        columna.
+        """
+        if column not in self.panel_keys:
+            _, _, coin, entity, channel, flow, hour = column.split('_')
+            self.panel_keys[column] = (coin, entity, channel, flow, hour)
+            self.column_names[self.panel_keys[column]] = column
+        return self.panel_keys[column]
+
+    def get_column(self, panel_key):
+        """
+        Retorna el nombre de la columna de una tupla
+        (moneda, entidad, canal, flujo, hora).
+        """
+        if panel_key not in self.column_names:
+            column = 'tc_ars_{}_{}_{}_{}_{}'.format(*panel_key)
+            self.column_names[panel_key] = column
+            self.panel_keys[column] = panel_key
+        return self.column_names[panel_key]
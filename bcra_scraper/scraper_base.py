@@ -1,9 +1,281 @@
 from datetime import date, datetime, timedelta
+from decimal import Decimal
 from selenium import webdriver
 from shutil import which
+from urllib.parse import urljoin
 
+from contextlib import contextmanager
+import logging
+import queue
 import string
 import random
+import threading
+
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from selenium.common.exceptions import TimeoutException
+import pandas as pd
+import progressbar
+import requests
+
+from bcra_scraper.browser import BrowserDriverLifecycle, BrowserDriverPool
+from bcra_scraper.cache import ExtractedDocument, ParsedDocumentCache, ResponseCache, make_key
+from bcra_scraper.fetch_engine import FetchEngine
+from bcra_scraper.normalize import from_fixed_point, to_fixed_point
+from bcra_scraper.parse_pool import ParsePool
+from bcra_scraper.parsers import get_html_parser
+from bcra_scraper.rate_limiter import get_rate_limiter
+from bcra_scraper.retry import CircuitBreaker, RetryPolicy
+from bcra_scraper.single_flight import SingleFlight
+from bcra_scraper.exceptions import FetchStopped, InvalidConfigurationError, InvalidFormFieldError
+
+
+TRANSPORTS = ['http', 'browser']
+
+
+class HTMLForm:
+    """
+    Representa el formulario de una página del BCRA, con los valores
+    por defecto de sus campos y las opciones de cada select.
+
+    Attributes
+    ----------
+    action : str
+        Url a la que se envía el formulario
+    method : str
+        Método HTTP con el que se envía el formulario
+    fields : Dict
+        Valores por defecto de los campos del formulario
+    options : Dict
+        Diccionario que tiene como clave el nombre de cada select y como
+        valor otro diccionario con el texto y el valor de cada opción
+    """
+
+    def __init__(self, action, method, fields, options):
+        self.action = action
+        self.method = method
+        self.fields = fields
+        self.options = options
+
+    @classmethod
+    def from_content(cls, url, content, field_names):
+        """
+        Busca en el html el formulario que contiene los campos recibidos
+        y lo devuelve como un HTMLForm.
+
+        Parameters
+        ----------
+        url : str
+            Url de la página, usada para resolver la acción del formulario
+        content : str
+            Html de la página
+        field_names : Iterable
+            Nombres de los campos que debe contener el formulario
+        """
+        soup = BeautifulSoup(content, "html.parser")
+        for form in soup.find_all('form'):
+            names = {
+                element.get('name')
+                for element in form.find_all(['input', 'select', 'textarea'])
+            }
+            if set(field_names) & names:
+                return cls._from_form_element(url, form)
+        raise InvalidFormFieldError(
+            f'No se encontró un formulario con los campos {", ".join(field_names)} en {url}'
+        )
+
+    @classmethod
+    def _from_form_element(cls, url, form):
+        fields, options = {}, {}
+        submit_added = False
+        for element in form.find_all(['input', 'select', 'textarea']):
+            name = element.get('name')
+            if not name:
+                continue
+            if element.name == 'select':
+                options[name] = {}
+                selected = None
+                for option in element.find_all('option'):
+                    text = option.get_text(strip=True)
+                    value = option.get('value', text)
+                    options[name][text] = value
+                    if selected is None or option.has_attr('selected'):
+                        selected = value
+                fields[name] = selected or ''
+            elif element.get('type', 'text').lower() in ['submit', 'image']:
+                # Se envía solo el primer botón, como si se hiciera click en él.
+                if not submit_added:
+                    fields[name] = element.get('value', '')
+                    submit_added = True
+            elif element.get('type', 'text').lower() in ['checkbox', 'radio']:
+                if element.has_attr('checked'):
+                    fields[name] = element.get('value', 'on')
+            elif element.get('type', 'text').lower() not in ['button', 'reset', 'file']:
+                fields[name] = element.get('value', '') if element.name == 'input' else element.text
+        action = urljoin(url, form.get('action') or url)
+        method = (form.get('method') or 'get').upper()
+        return cls(action, method, fields, options)
+
+    def get_options(self, name):
+        """
+        Retorna los textos de las opciones de un select del formulario.
+        """
+        if name not in self.options:
+            raise InvalidFormFieldError(f'No se encontró el campo {name}')
+        return list(self.options[name].keys())
+
+    def fill(self, values):
+        """
+        Retorna los datos a enviar con el formulario, completando sus
+        campos con los valores recibidos. Para los select el valor es el
+        texto de la opción, tal como lo ve el usuario en la página.
+
+        Parameters
+        ----------
+        values : Dict
+            Diccionario con el nombre del campo como clave y el valor a
+            completar como valor
+        """
+        data = dict(self.fields)
+        for name, value in values.items():
+            if name in self.options:
+                if value not in self.options[name]:
+                    raise InvalidFormFieldError(
+                        f'No se encontró la opción {value} en el campo {name}'
+                    )
+                data[name] = self.options[name][value]
+            elif name in self.fields:
+                data[name] = value
+            else:
+                raise InvalidFormFieldError(f'No se encontró el campo {name}')
+        return data
+
+
+class HTTPTransport:
+    """
+    Transporte que envía los formularios de las páginas del BCRA
+    directamente por HTTP, sin necesidad de un navegador. Las conexiones
+    se mantienen abiertas y se reutilizan entre requests.
+
+    Attributes
+    ----------
+    timeout : int
+        Tiempo de intervalo para cada request
+    session : requests.Session
+        Sesión que mantiene el pool de conexiones
+    """
+
+    def __init__(self, timeout=None, pool_size=10):
+        """
+        Parameters
+        ----------
+        timeout : int
+            Tiempo de intervalo para cada request.
+        pool_size : int
+            Cantidad de conexiones que se mantienen abiertas por host.
+        """
+        self.timeout = timeout
+        self.forms = {}
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+        })
+
+    def get(self, url, **kwargs):
+        response = self.session.get(url, timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def get_form(self, url, field_names):
+        """
+        Descarga la página y retorna el formulario que contiene los campos
+        recibidos. El formulario se descarga una sola vez por url.
+
+        Parameters
+        ----------
+        url : str
+            Url de la página que contiene el formulario
+        field_names : Iterable
+            Nombres de los campos que debe contener el formulario
+        """
+        key = (url, tuple(sorted(field_names)))
+        if key not in self.forms:
+            response = self.get(url)
+            self.forms[key] = HTMLForm.from_content(
+                url, self.decode(response), field_names
+            )
+        return self.forms[key]
+
+    def submit_form(self, url, values):
+        """
+        Completa el formulario de la página con los valores recibidos,
+        lo envía y retorna el html de la respuesta.
+
+        Parameters
+        ----------
+        url : str
+            Url de la página que contiene el formulario
+        values : Dict
+            Diccionario con el nombre del campo como clave y el valor a
+            completar como valor
+        """
+        response = self._send_form(url, values)
+        return self.decode(response)
+
+    def submit_form_conditional(self, url, values, validators=None):
+        """
+        Envía el formulario como un request condicional con los
+        validadores (ETag y Last-Modified) de una respuesta anterior.
+        Retorna una tupla con el html de la respuesta, o None si la
+        página no cambió, y los validadores de la respuesta.
+
+        Parameters
+        ----------
+        url : str
+            Url de la página que contiene el formulario
+        values : Dict
+            Diccionario con el nombre del campo como clave y el valor a
+            completar como valor
+        validators : Dict
+            Validadores de la respuesta anterior, con las claves 'etag'
+            y 'last_modified'
+        """
+        headers = {}
+        if validators and validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators and validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+        response = self._send_form(url, values, headers=headers)
+        response_validators = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+        if response.status_code == 304:
+            return None, validators
+        return self.decode(response), response_validators
+
+    def _send_form(self, url, values, headers=None):
+        form = self.get_form(url, values.keys())
+        data = form.fill(values)
+        if form.method == 'POST':
+            response = self.session.post(form.action, data=data, headers=headers, timeout=self.timeout)
+        else:
+            response = self.session.get(form.action, params=data, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    def decode(self, response):
+        if 'charset' not in response.headers.get('Content-Type', '').lower():
+            response.encoding = response.apparent_encoding
+        return response.text
+
+    def close(self):
+        self.session.close()
 
 
 class BCRAScraper:
@@ -20,6 +292,10 @@ class BCRAScraper:
     use_intermediate_panel : bool
         Flag para indicar si se debe generar o leer un archivo intermedio
         con formato panel
+    document_parser : str
+        Nombre del método que extrae las filas de una página. El método
+        solo puede usar el backend de parseo, ya que con parse_workers
+        se ejecuta en otro proceso
 
     Methods
     -------
@@ -35,6 +311,16 @@ class BCRAScraper:
         y los devuelve en un iterable
     """
 
+    DEFERRED_TIMEOUT_FACTOR = 2
+
+    PREPROCESS_BATCH_SIZE = 256
+
+    PARSED_DOCUMENTS_CACHE_SIZE = 512
+
+    source = None
+
+    document_parser = None
+
     def __init__(self, url, *args, **kwargs):
         """
         Parameters
@@ -47,18 +333,94 @@ class BCRAScraper:
             Tiempo de intervalo para cada request.
         tries: int
             Cantidad de intentos de request para cada fecha.
+        backoff : float
+            Espera en segundos antes del primer reintento. Las esperas
+            siguientes crecen exponencialmente.
+        failure_threshold : int
+            Cantidad de fallas seguidas a partir de la cual se considera
+            que el sitio está caído y se interrumpe la ejecución.
         skip_intermediate_panel_data : bool
             Flag para indicar si se debe saltear o leer un archivo intermedio
             con formato panel.
         skip_clean_dates : bool
             Flag para indicar si se deben limpiar las últimas fechas del panel intermedio o no.
+        transport : str
+            Forma en la que se obtienen las páginas: 'http' envía los
+            formularios directamente y 'browser' usa el navegador.
+        pool_size : int
+            Cantidad de navegadores del pool, usados con el transporte
+            'browser'.
+        concurrency : int
+            Cantidad máxima de descargas en curso. Por defecto es igual
+            a pool_size.
+        requests_per_second : float
+            Cantidad máxima de requests por segundo al host de la url.
+        cache_path : str
+            Directorio del cache de páginas descargadas. Si no se indica
+            no se usa el cache.
+        max_pages_per_driver : int
+            Cantidad de páginas a partir de la cual se reinicia un
+            navegador.
+        max_driver_rss_mb : int
+            Memoria en MB a partir de la cual se reinicia un navegador.
+        html_parser : str
+            Backend con el que se parsean las páginas: 'html.parser'
+            (BeautifulSoup) o 'lxml'.
+        parse_workers : int
+            Cantidad de procesos que extraen las filas del html de las
+            páginas mientras se descargan las siguientes. Con 0, el valor
+            por defecto, se extraen en el proceso principal. El
+            preprocesamiento de los valores siempre se hace en el
+            proceso principal.
+        fixed_point : bool
+            Si es True los valores del panel intermedio se suman como
+            enteros int64 escalados en lugar de objetos Decimal.
         """
         self.browser_driver = None
+        self.browser_driver_pool = None
+        self.browser_driver_lifecycle = None
+        self.http_transport = None
+        self.local = threading.local()
+        self.deferred_tasks = []
+        self.deferred_tasks_lock = threading.Lock()
+        self.single_flight = SingleFlight(keep=lambda result: bool(result[0]))
+        self.parsed_documents = ParsedDocumentCache(self.PARSED_DOCUMENTS_CACHE_SIZE)
         self.url = url
         self.timeout = kwargs.get('timeout', None)
         self.tries = kwargs.get('tries', 1)
+        self.retry_policy = RetryPolicy(
+            tries=self.tries,
+            backoff=float(kwargs.get('backoff') or 1),
+            circuit_breaker=CircuitBreaker(int(kwargs.get('failure_threshold') or 10)),
+        )
         self.skip_intermediate_panel_data = kwargs.get('skip_intermediate_panel_data')
         self.skip_clean_last_dates = kwargs.get('skip_clean_last_dates')
+        self.transport = kwargs.get('transport') or 'browser'
+        self.pool_size = max(int(kwargs.get('pool_size') or 1), 1)
+        self.concurrency = max(int(kwargs.get('concurrency') or self.pool_size), 1)
+        self.requests_per_second = float(kwargs.get('requests_per_second') or 5)
+        self.max_pages_per_driver = int(kwargs.get('max_pages_per_driver') or 500)
+        self.max_driver_rss_mb = int(kwargs.get('max_driver_rss_mb') or 1024)
+        cache_path = kwargs.get('cache_path')
+        self.cache = ResponseCache(cache_path) if cache_path else None
+        self.html_parser = get_html_parser(kwargs.get('html_parser') or 'html.parser')
+        self.parse_workers = max(int(kwargs.get('parse_workers') or 0), 0)
+        self.fixed_point = bool(kwargs.get('fixed_point'))
+        self.parse_pool = None
+        self.streaming = False
+        self.date_window = None
+
+        if self.transport not in TRANSPORTS:
+            raise InvalidConfigurationError(
+                f'El transporte {self.transport} no es válido'
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close_transports()
+        self.close_parse_pool()
 
     def _create_browser_driver(self):
         """
@@ -81,12 +443,485 @@ class BCRAScraper:
         """
         Método que verifica la existencia del navegador, en caso
         de que no exista llama a la función que lo crea.
+        Si el método se llama desde un worker del pool, retorna el
+        navegador que tiene asignado ese worker.
+        Cada llamada cuenta como una página cargada, y si el navegador
+        debe reciclarse se reemplaza por uno nuevo.
         """
+        lifecycle = self.get_browser_driver_lifecycle()
+        browser_driver = getattr(self.local, 'browser_driver', None)
+        if browser_driver:
+            lifecycle.count_page(browser_driver)
+            return browser_driver
+
         if not self.browser_driver:
-            self.browser_driver = self._create_browser_driver()
+            self.browser_driver = lifecycle.create()
+        else:
+            self.browser_driver = lifecycle.recycle(self.browser_driver)
+        lifecycle.count_page(self.browser_driver)
 
         return self.browser_driver
 
+    def get_browser_driver_lifecycle(self):
+        """
+        Método que verifica la existencia del administrador del ciclo de
+        vida de los navegadores, en caso de que no exista lo crea.
+        """
+        if not self.browser_driver_lifecycle:
+            self.browser_driver_lifecycle = BrowserDriverLifecycle(
+                self._create_browser_driver,
+                max_pages=self.max_pages_per_driver,
+                max_rss_mb=self.max_driver_rss_mb,
+            )
+
+        return self.browser_driver_lifecycle
+
+    def get_browser_driver_pool(self):
+        """
+        Método que verifica la existencia del pool de navegadores, en caso
+        de que no exista lo crea.
+        """
+        if not self.browser_driver_pool:
+            lifecycle = self.get_browser_driver_lifecycle()
+            self.browser_driver_pool = BrowserDriverPool(
+                lifecycle.create, self.pool_size, lifecycle=lifecycle
+            )
+
+        return self.browser_driver_pool
+
+    def get_http_transport(self):
+        """
+        Método que verifica la existencia del transporte HTTP, en caso
+        de que no exista lo crea.
+        """
+        if not self.http_transport:
+            self.http_transport = HTTPTransport(
+                timeout=self.timeout, pool_size=max(self.concurrency, 10)
+            )
+
+        return self.http_transport
+
+    def fetch_with_retry(self, fetch, description, default=''):
+        """
+        Ejecuta fetch aplicando la política de reintentos del scraper.
+        Retorna el contenido, o default si no se pudo obtener.
+
+        Parameters
+        ----------
+        fetch : Callable
+            Función sin parámetros que hace el request
+        description : str
+            Descripción del request para los mensajes
+        default : object
+            Valor que se retorna si el request no se pudo hacer
+        """
+        return self.retry_policy.call(
+            fetch, description, default, on_exhausted=self._mark_exhausted
+        )
+
+    def fetch_cached(self, params, fetch, single_date=None, revalidate=False):
+        """
+        Retorna la página guardada en el cache para los parámetros del
+        formulario si no venció. Si no, la obtiene con fetch y la guarda.
+
+        Los pedidos concurrentes de la misma página comparten un único
+        request y su resultado, y las páginas con toda la serie se
+        reutilizan durante el resto de la ejecución, por ejemplo en el
+        refetch. Dentro de streaming_pass, de esas páginas se retienen
+        solo las filas extraídas y no el html.
+
+        Con revalidate, si la página venció pero tiene validadores (ETag
+        o Last-Modified), el formulario se envía como un request
+        condicional y, si el sitio responde que no cambió, se reutiliza
+        la página guardada.
+
+        Parameters
+        ----------
+        params : Dict
+            Valores enviados en el formulario
+        fetch : Callable
+            Función sin parámetros que obtiene la página
+        single_date : date
+            Fecha de la página, usada para calcular su tiempo de vida.
+            None si la página tiene toda la serie.
+        revalidate : bool
+            Indica si se deben enviar requests condicionales
+        """
+        key = make_key(self.source, self.url, params)
+
+        def fetch_page():
+            content, exhausted = self._fetch_cached(key, fetch, single_date, revalidate)
+            if single_date is None and self.streaming and content:
+                content = self.extract_fetched(content)
+            return content, exhausted
+
+        content, exhausted = self.single_flight.do(key, fetch_page)
+        if single_date is not None:
+            # Las páginas de una fecha no se vuelven a pedir en el refetch,
+            # por lo que no se retienen durante toda la ejecución
+            self.single_flight.forget(key)
+        if exhausted:
+            self._mark_exhausted()
+        return content
+
+    def _fetch_cached(self, key, fetch, single_date, revalidate):
+        self.local.exhausted = False
+        if not self.cache:
+            return fetch(), self.local.exhausted
+
+        content = self.cache.get_fresh(key, single_date)
+        if content is not None:
+            return content, False
+
+        validators = self.cache.get_validators(key) if revalidate else None
+        stale_content = self.cache.get(key) if validators else None
+        if stale_content is None:
+            validators = None
+        self.local.revalidation = (validators, stale_content) if revalidate else None
+        self.local.response_validators = None
+        try:
+            content = fetch()
+        finally:
+            self.local.revalidation = None
+
+        if content and content is stale_content:
+            self.cache.touch(key)
+        elif content:
+            self.cache.set(key, content, self.local.response_validators)
+        return content, self.local.exhausted
+
+    def _mark_exhausted(self):
+        self.local.exhausted = True
+
+    def get_rate_limiter(self):
+        """
+        Retorna el limitador de requests compartido por todos los
+        scrapers que acceden al host de la url.
+        """
+        return get_rate_limiter(
+            self.url,
+            requests_per_second=self.requests_per_second,
+            max_concurrency=self.get_concurrency(),
+        )
+
+    @contextmanager
+    def throttled(self):
+        """
+        Ejecuta el bloque with como un request regulado por el limitador
+        del host. Los timeouts y los errores 5xx reducen la concurrencia.
+        """
+        rate_limiter = self.get_rate_limiter()
+        started_at = rate_limiter.acquire()
+        try:
+            yield
+        except Exception as e:
+            rate_limiter.release(started_at, overloaded=self.is_overload_error(e))
+            raise
+        else:
+            rate_limiter.release(started_at)
+
+    def is_overload_error(self, error):
+        """
+        Indica si el error muestra que el sitio está sobrecargado: un
+        timeout, una conexión rechazada o una respuesta 5xx o 429.
+        """
+        if isinstance(error, (TimeoutException, requests.Timeout, requests.ConnectionError)):
+            return True
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            return error.response.status_code >= 500 or error.response.status_code == 429
+        return False
+
+    def submit_form(self, values):
+        """
+        Envía por HTTP el formulario de la url del scraper completado con
+        los valores recibidos y retorna el html de la respuesta.
+        Si se está revalidando una página del cache el request es
+        condicional, y si la página no cambió se retorna la guardada.
+
+        Parameters
+        ----------
+        values : Dict
+            Diccionario con el nombre del campo como clave y el valor a
+            completar como valor
+        """
+        revalidation = getattr(self.local, 'revalidation', None)
+        if not revalidation:
+            return self.get_http_transport().submit_form(self.url, values)
+
+        validators, stale_content = revalidation
+        content, self.local.response_validators = self.get_http_transport()\
+            .submit_form_conditional(self.url, values, validators)
+        if content is None:
+            logging.info('La página no cambió, se usa la guardada en el cache')
+            return stale_content
+        return content
+
+    def fetch_tasks(self, tasks, fetch):
+        """
+        Descarga el contenido de cada tarea a través del motor de descargas,
+        con como máximo `concurrency` descargas en curso. Retorna un
+        diccionario que tiene como clave cada tarea y como valor el
+        contenido descargado.
+
+        Dentro de streaming_pass, cada html se reemplaza apenas llega por
+        las filas que extrae el scraper, de modo que el diccionario no
+        retiene los html de todo el rango de fechas.
+
+        Parameters
+        ----------
+        tasks : list
+            Lista de tareas, por ejemplo tuplas (moneda, fecha)
+        fetch : Callable
+            Función que recibe una tarea y retorna su contenido
+        """
+        contents = {}
+        for task, content in self.iter_fetch_tasks(tasks, fetch):
+            contents[task] = self.extract_fetched(content) if self.streaming else content
+        return contents
+
+    def iter_fetch_tasks(self, tasks, fetch):
+        """
+        Generador que descarga el contenido de cada tarea y entrega tuplas
+        (tarea, contenido) a medida que terminan. El motor de descargas
+        corre en otro thread y entrega los contenidos por una cola de
+        `concurrency` lugares: si quien consume el generador se atrasa,
+        las descargas esperan, de modo que la cantidad de html en memoria
+        depende de la concurrencia y no de la cantidad de tareas.
+
+        Las tareas que agotaron sus intentos se vuelven a entregar al
+        final con el contenido de retry_deferred_tasks.
+
+        Parameters
+        ----------
+        tasks : list
+            Lista de tareas, por ejemplo tuplas (moneda, fecha)
+        fetch : Callable
+            Función que recibe una tarea y retorna su contenido
+        """
+        results = queue.Queue(maxsize=self.get_concurrency())
+        stopped = threading.Event()
+        finished = object()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def on_result(task, content):
+            self.prefetch_document(content)
+            if not put((task, content)):
+                raise FetchStopped()
+
+        def run_engine():
+            error = None
+            try:
+                engine.run(tasks, on_result=on_result)
+            except FetchStopped:
+                pass
+            except BaseException as e:
+                error = e
+            put((finished, error))
+
+        bar = progressbar.ProgressBar(max_value=len(tasks), redirect_stdout=True,
+                                      widgets=[progressbar.Bar('=', '[', ']'), '', progressbar.Percentage()])
+        bar.start()
+        engine = FetchEngine(
+            lambda task: self._fetch_task_in_worker(fetch, task),
+            concurrency=self.get_concurrency(),
+            on_progress=lambda done, total: bar.update(done),
+        )
+        thread = threading.Thread(target=run_engine, daemon=True)
+        thread.start()
+        try:
+            while True:
+                task, content = results.get()
+                if task is finished:
+                    if content is not None:
+                        raise content
+                    break
+                yield task, content
+        finally:
+            stopped.set()
+            thread.join()
+        bar.finish()
+
+        if self.deferred_tasks:
+            yield from self.retry_deferred_tasks(fetch)
+
+    def retry_deferred_tasks(self, fetch):
+        """
+        Generador que vuelve a descargar, una vez más y de a una, las
+        tareas que agotaron sus intentos durante la descarga principal, y
+        entrega tuplas (tarea, contenido). Se usan un navegador o una
+        sesión nuevos y un timeout más largo, y el contenido obtenido
+        reemplaza al de la descarga principal.
+
+        Parameters
+        ----------
+        fetch : Callable
+            Función que recibe una tarea y retorna su contenido
+        """
+        tasks, self.deferred_tasks = self.deferred_tasks, []
+        logging.warning(
+            f'Se reintentan al final de la ejecución {len(tasks)} descargas que fallaron'
+        )
+        with self.deferred_pass():
+            for task in tasks:
+                self.local.exhausted = False
+                content = fetch(task)
+                self.prefetch_document(content)
+                if self.local.exhausted:
+                    logging.warning(f'No se pudo obtener el contenido de {task}')
+                yield task, content
+
+    @contextmanager
+    def streaming_pass(self):
+        """
+        Mientras dura el bloque with, las páginas que se descargan se
+        reemplazan por sus filas extraídas apenas llegan y se descarta su
+        html.
+        """
+        self.streaming = True
+        try:
+            yield
+        finally:
+            self.streaming = False
+
+    def extract_fetched(self, content):
+        """
+        Retorna las filas extraídas del html recién descargado, o el
+        contenido sin cambios si no es un html o el scraper no indica su
+        método de extracción en `document_parser`.
+        """
+        if self.document_parser is None or not isinstance(content, str):
+            return content
+        return ExtractedDocument(
+            self.parse_document(content, getattr(self, self.document_parser))
+        )
+
+    @contextmanager
+    def deferred_pass(self):
+        """
+        Cierra los navegadores y la sesión HTTP y aumenta el timeout
+        mientras dura el bloque with, de modo que los requests se hagan
+        con conexiones nuevas. Cada request se intenta una sola vez, y
+        las fallas de la descarga principal no cuentan para el circuito
+        de los nuevos intentos.
+        """
+        timeout = self.timeout
+        if timeout:
+            self.timeout = timeout * self.DEFERRED_TIMEOUT_FACTOR
+        retry_policy = self.retry_policy
+        self.retry_policy = RetryPolicy(
+            tries=1,
+            backoff=retry_policy.backoff,
+            max_backoff=retry_policy.max_backoff,
+            circuit_breaker=retry_policy.circuit_breaker,
+        )
+        self.close_transports()
+        self.retry_policy.circuit_breaker.reset()
+        try:
+            yield
+        finally:
+            self.timeout = timeout
+            self.retry_policy = retry_policy
+            self.close_transports()
+
+    def close_transports(self):
+        """
+        Cierra los navegadores y la sesión HTTP abiertos. Se vuelven a
+        crear la próxima vez que se necesitan.
+        """
+        if self.browser_driver:
+            self.get_browser_driver_lifecycle().quit(self.browser_driver)
+            self.browser_driver = None
+        if self.browser_driver_pool:
+            self.browser_driver_pool.close()
+            self.browser_driver_pool = None
+        if self.http_transport:
+            self.http_transport.close()
+            self.http_transport = None
+
+    def get_concurrency(self):
+        """
+        Retorna la cantidad máxima de descargas en curso. Con el transporte
+        'browser' no puede haber más descargas que navegadores en el pool.
+        """
+        if self.transport == 'browser':
+            return min(self.concurrency, self.pool_size)
+        return self.concurrency
+
+    def get_parse_pool(self):
+        """
+        Retorna el pool de procesos que parsea las páginas, creándolo si
+        no existe.
+        """
+        if self.parse_pool is None:
+            self.parse_pool = ParsePool(self.html_parser.name, workers=self.parse_workers)
+        return self.parse_pool
+
+    def close_parse_pool(self):
+        if self.parse_pool:
+            self.parse_pool.close()
+            self.parse_pool = None
+
+    def prefetch_document(self, content):
+        """
+        Envía al pool de procesos el html recién descargado, de modo que
+        sus filas se extraigan mientras continúan las descargas. Cuando
+        se pide el documento con parse_document, se toman las filas
+        extraídas por el pool; el resto del parseo de la página se hace
+        en el proceso principal. No hace nada si no se configuraron procesos, si el
+        scraper no indica su método de extracción en `document_parser` o
+        si el documento ya se parseó.
+
+        Parameters
+        ----------
+        content : str
+            Html del documento
+        """
+        if not self.parse_workers or self.document_parser is None:
+            return
+        parse = getattr(self, self.document_parser)
+        if not isinstance(content, str) or self.parsed_documents.contains(content, parse):
+            return
+        extract = getattr(type(self), self.document_parser)
+        self.parsed_documents.put(
+            content, parse,
+            self.get_parse_pool().submit(extract, content, self.get_extraction_settings())
+        )
+
+    def get_extraction_settings(self):
+        """
+        Retorna los atributos del scraper que usa su método de
+        extracción, además del backend de parseo, para pasarlos a los
+        procesos del pool.
+        """
+        return {'date_window': self.date_window}
+
+    def _fetch_task_in_worker(self, fetch, task):
+        self.local.exhausted = False
+        content = self._fetch_task_with_driver(fetch, task)
+        if self.local.exhausted:
+            with self.deferred_tasks_lock:
+                self.deferred_tasks.append(task)
+        return content
+
+    def _fetch_task_with_driver(self, fetch, task):
+        if self.transport != 'browser' or self.pool_size == 1:
+            return fetch(task)
+
+        with self.get_browser_driver_pool().driver() as browser_driver:
+            self.local.browser_driver = browser_driver
+            try:
+                return fetch(task)
+            finally:
+                self.local.browser_driver = None
+
     def fetch_contents(self, start_date, end_date):
         """
         Retorna un iterable donde cada elemento es un String, o una lista
@@ -125,6 +960,225 @@ class BCRAScraper:
 
         raise NotImplementedError
 
+    def parse_document(self, content, parse):
+        """
+        Retorna el resultado de parse para el contenido. Los documentos
+        idénticos se parsean una sola vez por ejecución, aunque se usen
+        para muchas fechas o monedas, y los que fetch_tasks ya reemplazó
+        por sus filas no se vuelven a parsear.
+
+        Parameters
+        ----------
+        content : str
+            Html del documento
+        parse : Callable
+            Función que recibe el html y retorna las filas extraídas
+        """
+        if isinstance(content, ExtractedDocument):
+            return content.rows
+        return self.parsed_documents.get(content, parse)
+
+    def get_missing_dates(self, start_date, end_date, intermediate_panel_data, fetched_contents):
+        """
+        Retorna la lista de fechas del rango que no están en el panel
+        intermedio ni se descargaron en el primer ciclo.
+
+        Parameters
+        ----------
+        start_date : date
+            fecha de inicio que va a tomar como referencia el scraper
+        end_date: date
+            fecha de fin que va a tomar como referencia el scraper
+        intermediate_panel_data : Dict
+            Datos del panel intermedio
+        fetched_contents : Dict
+            Contenidos descargados en el primer ciclo
+        """
+        dates = []
+        day_count = max((end_date - start_date).days + 1, 0)
+        for single_date in (start_date + timedelta(n)
+                            for n in range(day_count)):
+            if not self.day_in_fetched_contents(fetched_contents, single_date):
+                in_panel, _ = self.day_content_in_panel(intermediate_panel_data, single_date)
+                if not in_panel:
+                    dates.append(single_date)
+            else:
+                logging.warning(f'La fecha {single_date} fue descargada en el primer ciclo.')
+        return dates
+
+    def get_fetch_tasks(self, dates):
+        """
+        Retorna una tupla con la lista de tareas a descargar para las
+        fechas y la función que recibe una tarea y retorna su contenido.
+
+        Raises
+        ------
+        NotImplementedError
+            si no se encuentra la función o sus parámetros dentro de la clase
+        """
+        raise NotImplementedError
+
+    def get_fetched_pages(self, task, content, dates):
+        """
+        Retorna un iterable de tuplas (clave, contenido) con las páginas
+        a parsear a partir del contenido de una tarea. Por defecto cada
+        tarea es una página; los scrapers cuya página tiene toda la serie
+        la usan para cada fecha.
+        """
+        return [(task, content)]
+
+    def scrape_contents(self, start_date, end_date, intermediate_panel_data, fetched_contents):
+        """
+        Descarga y parsea las fechas del rango que faltan. Cada página se
+        parsea apenas llega y se descarta, y sus filas se preprocesan y
+        se agregan a los contenidos parseados y al panel intermedio de a
+        `PREPROCESS_BATCH_SIZE`, de modo que lo que se retiene mientras se
+        descarga no depende de la cantidad de fechas. Las fechas
+        descargadas se anotan en fetched_contents, para que el refetch no
+        las vuelva a pedir.
+
+        Retorna una tupla con los contenidos parseados y el panel
+        intermedio.
+
+        Parameters
+        ----------
+        start_date : date
+            fecha de inicio que va a tomar como referencia el scraper
+        end_date: date
+            fecha de fin que va a tomar como referencia el scraper
+        intermediate_panel_data : Dict
+            Datos del panel intermedio
+        fetched_contents : Dict
+            Contenidos descargados en el primer ciclo
+        """
+        dates = self.get_missing_dates(start_date, end_date, intermediate_panel_data, fetched_contents)
+        tasks, fetch = self.get_fetch_tasks(dates)
+        with self.streaming_pass():
+            pages = (
+                page
+                for task, content in (self.iter_fetch_tasks(tasks, fetch) if tasks else [])
+                for page in self.get_fetched_pages(task, self.extract_fetched(content), dates)
+            )
+            parsed = self.parse_pages(pages, start_date, end_date, intermediate_panel_data)
+        self.add_fetched_dates(fetched_contents, dates)
+        return parsed
+
+    def parse_pages(self, pages, start_date, end_date, intermediate_panel_data):
+        """
+        Parsea cada página a medida que la entrega el iterable y agrega
+        sus filas preprocesadas a los contenidos parseados, que empiezan
+        con las fechas del panel intermedio, y al panel. Retorna una
+        tupla con los contenidos parseados ordenados por fecha y el panel
+        intermedio.
+
+        Parameters
+        ----------
+        pages : Iterable
+            Tuplas (clave, contenido) de cada página
+        start_date : date
+            fecha de inicio que va a tomar como referencia el scraper
+        end_date: date
+            fecha de fin que va a tomar como referencia el scraper
+        intermediate_panel_data : Dict
+            Datos del panel intermedio
+        """
+        parsed_contents = self.get_panel_contents(start_date, end_date, intermediate_panel_data)
+        keys, rows = [], []
+        for key, content in pages:
+            keys.append(key)
+            rows.append(self.parse_page(key, content))
+            if len(rows) >= self.PREPROCESS_BATCH_SIZE:
+                self.merge_pages(parsed_contents, intermediate_panel_data, keys, rows)
+                keys, rows = [], []
+        self.merge_pages(parsed_contents, intermediate_panel_data, keys, rows)
+        return self.sort_parsed(parsed_contents), intermediate_panel_data
+
+    def merge_pages(self, parsed_contents, intermediate_panel_data, keys, rows):
+        """
+        Preprocesa juntas las filas parseadas de varias páginas y las
+        agrega a los contenidos parseados y al panel intermedio.
+        """
+        if not rows:
+            return
+        for key, row in zip(keys, self.preprocess_pages(rows)):
+            self.merge_page(parsed_contents, intermediate_panel_data, key, row)
+
+    def parse_page(self, key, content):
+        """
+        Retorna la fila parseada de la página identificada por la clave.
+
+        Raises
+        ------
+        NotImplementedError
+            si no se encuentra la función o sus parámetros dentro de la clase
+        """
+        raise NotImplementedError
+
+    def preprocess_pages(self, rows):
+        """
+        Retorna la lista de filas preprocesadas.
+
+        Raises
+        ------
+        NotImplementedError
+            si no se encuentra la función o sus parámetros dentro de la clase
+        """
+        raise NotImplementedError
+
+    def merge_page(self, parsed_contents, intermediate_panel_data, key, row):
+        """
+        Agrega la fila preprocesada de la página a los contenidos
+        parseados y al panel intermedio.
+
+        Raises
+        ------
+        NotImplementedError
+            si no se encuentra la función o sus parámetros dentro de la clase
+        """
+        raise NotImplementedError
+
+    def get_panel_contents(self, start_date, end_date, intermediate_panel_data):
+        """
+        Retorna los contenidos parseados de las fechas del rango que ya
+        están en el panel intermedio, por moneda o tipo de cambio.
+        """
+        parsed_contents = self.empty_refetch_data()
+        day_count = max((end_date - start_date).days + 1, 0)
+        for single_date in (start_date + timedelta(n)
+                            for n in range(day_count)):
+            in_panel, parsed = self.day_content_in_panel(intermediate_panel_data, single_date)
+            if in_panel:
+                for key, value in parsed.items():
+                    parsed_contents[key][single_date] = value
+        return parsed_contents
+
+    def sort_parsed(self, parsed_contents):
+        """
+        Retorna los contenidos parseados de cada moneda o tipo de cambio
+        ordenados por fecha.
+        """
+        return {key: dict(sorted(rows.items())) for key, rows in parsed_contents.items()}
+
+    def add_fetched_dates(self, fetched_contents, dates):
+        """
+        Anota las fechas descargadas en fetched_contents, sin su
+        contenido.
+        """
+        for contents in fetched_contents.values():
+            contents.update(dict.fromkeys(dates))
+
+    def get_date_window(self, start_date, end_date, refetch_dates_range):
+        """
+        Retorna una tupla con la primera y la última fecha que se
+        parsean en la ejecución, contando el rango de refetch. Los
+        extractores incrementales dejan de leer una página al pasarla.
+        """
+        dates = [start_date, end_date]
+        if refetch_dates_range:
+            dates.extend([refetch_dates_range[0], refetch_dates_range[-1]])
+        dates = [d.date() if isinstance(d, datetime) else d for d in dates]
+        return min(dates), max(dates)
+
     def preprocess_start_date(self, start_date, end_date):
         return start_date
 
@@ -170,6 +1224,104 @@ class BCRAScraper:
             refetch_end_date = refetch_end_date - timedelta(days=1)
         return refetch_end_date
 
+    def read_panel_csv(self, converters, value_column):
+        """
+        Lee el csv del panel intermedio. Con fixed_point la columna de
+        valores se lee como texto, y pivot_panel la convierte a enteros
+        escalados; si no, se convierte a Decimal al leerla.
+
+        Parameters
+        ----------
+        converters : Dict
+            Funciones que convierten cada columna del csv
+        value_column : str
+            Nombre de la columna de valores
+        """
+        if self.fixed_point:
+            converters = {
+                column: convert for column, convert in converters.items()
+                if column != value_column
+            }
+            return pd.read_csv(
+                self.intermediate_panel_path,
+                converters=converters,
+                dtype={value_column: str},
+            )
+        return pd.read_csv(self.intermediate_panel_path, converters=converters)
+
+    def pivot_panel(self, df_panel, columns, value_column):
+        """
+        Retorna la tabla pivot del panel intermedio, con una fila por
+        fecha y una columna por serie. Los ceros y los valores vacíos se
+        convierten a None.
+
+        Con fixed_point la suma de la tabla se hace sobre enteros int64
+        escalados, con la escala de cada serie, y solo el resultado se
+        convierte a Decimal, con el mismo texto que tenía en el panel. Si
+        algún valor no se puede representar exacto se usa Decimal para
+        todo el panel.
+
+        Parameters
+        ----------
+        df_panel : DataFrame
+            Filas del panel intermedio
+        columns : list
+            Columnas que identifican cada serie
+        value_column : str
+            Nombre de la columna de valores
+        """
+        fixed = None
+        if self.fixed_point:
+            series = [df_panel[column] for column in columns]
+            fixed = to_fixed_point(
+                df_panel[value_column], series if len(series) > 1 else series[0]
+            )
+            if fixed is None:
+                logging.info('Los valores del panel no se pueden representar con punto fijo; se usa Decimal')
+                df_panel = df_panel.assign(**{
+                    value_column: [
+                        (Decimal(value) if value else None) if isinstance(value, str)
+                        else None if pd.isna(value) else value
+                        for value in df_panel[value_column]
+                    ]
+                })
+        if fixed is None:
+            df_pivot = df_panel.pivot_table(
+                index="indice_tiempo",
+                columns=columns,
+                values=value_column,
+                aggfunc=sum,
+                dropna=False
+            )
+            return df_pivot.replace([0], [None])
+
+        values, scales = fixed
+        df_pivot = df_panel.assign(**{value_column: values}).pivot_table(
+            index="indice_tiempo",
+            columns=columns,
+            values=value_column,
+            aggfunc=sum,
+            dropna=False
+        )
+        return pd.DataFrame(
+            from_fixed_point(
+                df_pivot.to_numpy(),
+                [scales.get(column, 0) for column in df_pivot.columns]
+            ),
+            index=df_pivot.index,
+            columns=df_pivot.columns,
+        )
+
+    def reset_run_state(self):
+        """
+        Descarta el estado que dejó una ejecución anterior del scraper:
+        el circuito del sitio, las páginas compartidas entre descargas y
+        los documentos parseados.
+        """
+        self.retry_policy.circuit_breaker.reset()
+        self.single_flight.clear()
+        self.parsed_documents.clear()
+
     def run(self, start_date, end_date, refetch_dates_range):
         """
         Inicializa un iterable. Llama a los métodos para obtener y scrapear
@@ -188,8 +1340,10 @@ class BCRAScraper:
         """
 
         parsed = []
+        self.reset_run_state()
         start_date = self.preprocess_start_date(start_date, end_date)
         end_date = self.preprocess_end_date(end_date)
+        self.date_window = self.get_date_window(start_date, end_date, refetch_dates_range)
         fetched_contents = self.empty_fetched_contents()
         refetch_intermediate_panel_data = self.empty_refetch_data()
         intermediate_panel_data = [] if self.skip_intermediate_panel_data else self.parse_from_intermediate_panel()
@@ -198,17 +1352,20 @@ class BCRAScraper:
 
         if not self.skip_clean_last_dates:
             intermediate_panel_data, refetch_end_date = self.clean_last_dates_values_in_panel(intermediate_panel_data, start_date, end_date, refetch_end_date)
-        contents = self.fetch_contents(start_date, end_date, intermediate_panel_data, fetched_contents)
-        parsed, intermediate_panel_data = self.parse_contents(contents, start_date, end_date, intermediate_panel_data)
+        parsed, intermediate_panel_data = self.scrape_contents(start_date, end_date, intermediate_panel_data, fetched_contents)
 
         if refetch_dates_range:
-            refetched_contents = self.fetch_contents(refetch_start_date, refetch_end_date, refetch_intermediate_panel_data, contents)
-            refetched_parsed, refetch_intermediate_panel_data = self.parse_contents(refetched_contents, refetch_start_date, refetch_end_date, refetch_intermediate_panel_data)
+            refetched_parsed, refetch_intermediate_panel_data = self.scrape_contents(refetch_start_date, refetch_end_date, refetch_intermediate_panel_data, fetched_contents)
 
-            contents.update(refetched_contents)
             parsed = self.merge_parsed(parsed, refetched_parsed)
             intermediate_panel_data = self.merge_parsed(intermediate_panel_data, refetch_intermediate_panel_data)
 
+        self.close_parse_pool()
+        logging.info(
+            f'Cache de documentos parseados: {self.parsed_documents.hits} aciertos, '
+            f'{self.parsed_documents.misses} fallos'
+        )
+
         if not self.skip_intermediate_panel_data:
             self.save_intermediate_panel(intermediate_panel_data)
         return parsed
@@ -5,16 +5,56 @@ from functools import reduce
 import logging
 import re
 
-from bs4 import BeautifulSoup
 import pandas as pd
-import progressbar
 
 from bcra_scraper.scraper_base import BCRAScraper
-from bcra_scraper.exceptions import InvalidConfigurationError
+from bcra_scraper.exceptions import InvalidConfigurationError, InvalidFormFieldError
+from bcra_scraper.normalize import normalize_rows
+from bcra_scraper.records import frame_to_records, records_to_frame
+from bcra_scraper.table_stream import TableStream, iter_window_rows
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
+
+
+def stream_coin_history(content, date_window=None):
+    """
+    Lee la tabla de la página de una moneda con un extractor
+    incremental y retorna lo mismo que
+    BCRAExchangeRateScraper.parse_coin_history. Con una ventana de
+    fechas, solo guarda las filas de esas fechas y deja de leer la
+    página al pasarlas.
+
+    Parameters
+    ----------
+    content: str
+        Html de la moneda
+    date_window : tuple
+        Fechas de inicio y de fin de la ejecución
+    """
+    stream = TableStream()
+    history = {}
+
+    def dated_rows():
+        for section, cells in stream.iter_rows(content):
+            cols = [cell for cell in cells if cell.tag == 'td']
+            if section != 'tbody' or len(cols) < 3:
+                continue
+            try:
+                row_date = datetime.strptime(cols[0].text.strip(), "%d/%m/%Y").date()
+            except ValueError:
+                continue
+            yield row_date, cols
+
+    for row_date, cols in iter_window_rows(dated_rows(), date_window):
+        history.setdefault(row_date, (
+            cols[1].text.strip(),
+            cols[2].text.strip()
+        ))
+
+    if 'thead' not in stream.sections:
+        return {}
+    return history
 
 
 class BCRAExchangeRateScraper(BCRAScraper):
@@ -30,6 +70,9 @@ class BCRAExchangeRateScraper(BCRAScraper):
         el contenido a ser scrapeado
     coins : Dict
         Diccionario que contiene las monedas que serán utilizadas
+    stream_tables : bool
+        Indica si la tabla de la página se lee con el extractor
+        incremental
 
     Methods
     -------
@@ -51,6 +94,10 @@ class BCRAExchangeRateScraper(BCRAScraper):
         y los devuelve en un iterable
     """
 
+    source = 'exchange-rates'
+
+    document_parser = 'parse_coin_history'
+
     def __init__(self, url, coins, intermediate_panel_path, *args, **kwargs):
         """
         Parameters
@@ -61,17 +108,26 @@ class BCRAExchangeRateScraper(BCRAScraper):
             contenido no está vacio.
         coins : Dict
             Diccionario que contiene los plazos en días de la tasa Libor
+        stream_tables : bool
+            Si es True, la tabla de la página se lee con un extractor
+            incremental, sin armar el árbol del documento, y se deja de
+            leer al pasar las fechas de la ejecución.
         """
         self.coins = coins
         self.intermediate_panel_path = intermediate_panel_path
+        self.available_dates = ''
+        self.history_start_date = None
+        self.stream_tables = bool(kwargs.get('stream_tables'))
         super(BCRAExchangeRateScraper, self)\
             .__init__(url, *args, **kwargs)
 
     def fetch_contents(self, start_date, end_date, intermediate_panel_data, fetched_contents):
         """
-        A través de un loop llama a un método.
-        Retorna un diccionario en donde las claves son las monedas y
-        los valores son los html correspondientes a cada una
+        Descarga una vez la página de cada moneda, desde la primera fecha
+        que falta, y la usa para todas las fechas.
+        Retorna un diccionario con 'tc_local' y 'tp_usd' como claves, y
+        como valores diccionarios con cada fecha como clave y un
+        diccionario con el html de cada moneda como valor.
 
         Parameters
         ----------
@@ -81,30 +137,67 @@ class BCRAExchangeRateScraper(BCRAScraper):
             fecha de fin que va a tomar como referencia el scraper
         """
         contents = {'tc_local': {}, 'tp_usd': {}}
-        day_count = (end_date - start_date).days + 1
-        if day_count < 0:
-            day_count = 0
-        cont = 0
-        bar = progressbar.ProgressBar(max_value=day_count, redirect_stdout=True, \
-            widgets=[progressbar.Bar('=', '[', ']'), '', progressbar.Percentage()])
-        bar.start()
-        for single_date in (start_date + timedelta(n)
-                            for n in range(day_count)):
-            if not self.day_in_fetched_contents(fetched_contents, single_date):
-                in_panel, day_content = self.day_content_in_panel(intermediate_panel_data, single_date)
-                if not in_panel:
-                    for k, v in self.coins.items():
-                        fetched = self.fetch_content(start_date, v)
-                        contents['tc_local'][single_date] = fetched
-                        contents['tp_usd'][single_date] = fetched
-            else:
-                logging.warning(f'La fecha {single_date} fue descargada en el primer ciclo.')
-            cont += 1
-            bar.update(cont)
-        bar.finish()
+        dates = self.get_missing_dates(start_date, end_date, intermediate_panel_data, fetched_contents)
+        if not dates:
+            return contents
+
+        coin_contents = self.fetch_tasks(*self.get_fetch_tasks(dates))
+        for single_date in dates:
+            day_contents = {coin: coin_contents[coin] for coin in self.coins.keys()}
+            contents['tc_local'][single_date] = day_contents
+            contents['tp_usd'][single_date] = day_contents
 
         return contents
 
+    def get_fetch_tasks(self, dates):
+        """
+        Retorna una tupla con las monedas a descargar y la función que
+        descarga la página de cada una.
+
+        La página de cada moneda tiene todas las cotizaciones desde la
+        fecha enviada hasta hoy, por lo que alcanza con pedirla una vez
+        desde la primera fecha que falta. Si ya se pidió desde una fecha
+        anterior, por ejemplo en el primer ciclo, se reutiliza.
+        """
+        if not dates:
+            return [], None
+        fetch_start_date = self.get_fetch_start_date(dates[0])
+        if self.history_start_date and self.history_start_date <= fetch_start_date:
+            fetch_start_date = self.history_start_date
+        self.history_start_date = fetch_start_date
+        return (
+            list(self.coins.keys()),
+            lambda coin: self.fetch_content(fetch_start_date, self.coins[coin])
+        )
+
+    def get_fetched_pages(self, coin, content, dates):
+        return [
+            ((exchange_type, coin, single_date), content)
+            for single_date in dates
+            for exchange_type in ['tc_local', 'tp_usd']
+        ]
+
+    def reset_run_state(self):
+        """
+        Además del estado de la ejecución anterior, descarta la fecha
+        desde la que se pidieron las páginas de las monedas.
+        """
+        super(BCRAExchangeRateScraper, self).reset_run_state()
+        self.history_start_date = None
+
+    def get_fetch_start_date(self, single_date):
+        """
+        Retorna la última fecha disponible en el formulario que no es
+        posterior a la fecha recibida. Si no se conocen las fechas
+        disponibles retorna la misma fecha.
+        """
+        available_dates = [
+            datetime.strptime(available_date, "%d/%m/%Y").date()
+            for available_date in re.findall(r'\d{2}/\d{2}/\d{4}', self.available_dates)
+        ]
+        previous_dates = [d for d in available_dates if d <= single_date]
+        return max(previous_dates) if previous_dates else single_date
+
     def empty_fetched_contents(self):
         return {'tc_local': {}, 'tp_usd': {}}
 
@@ -145,7 +238,8 @@ class BCRAExchangeRateScraper(BCRAScraper):
 
     def fetch_content(self, start_date, coin):
         """
-        Ingresa al navegador utilizando la fecha y la moneda que recibe.
+        Envía el formulario, por HTTP o a través del navegador, utilizando
+        la fecha y la moneda que recibe.
         La fecha por default es hoy, en caso de pasarle otra fecha
         va a traer el contenido desde esa fecha hasta hoy.
         Retorna un string que contiene el html obtenido.
@@ -158,12 +252,14 @@ class BCRAExchangeRateScraper(BCRAScraper):
         coin: str
             Nombre de cada moneda
         """
-        content = ''
-        counter = 1
-        tries = self.tries
+        def fetch():
+            with self.throttled():
+                if self.transport == 'http':
+                    return self.submit_form({
+                        'Fecha': start_date.strftime("%d/%m/%Y"),
+                        'Moneda': coin,
+                    })
 
-        while counter <= tries and not content:
-            try:
                 browser_driver = self.get_browser_driver()
                 browser_driver.get(self.url)
                 element_present = EC.presence_of_element_located(
@@ -176,30 +272,19 @@ class BCRAExchangeRateScraper(BCRAScraper):
                 options = element.find_elements_by_tag_name('option')
 
                 valid = self.validate_coin_in_configuration_file(coin, options)
-                if valid:
-                    element.send_keys(coin)
-                    submit_button = browser_driver.find_element_by_class_name(
-                        'btn-primary')
-                    submit_button.click()
-                    content = browser_driver.page_source
-
-            except NoSuchElementException:
-                logging.warning(
-                    f'No se encontró la moneda: {coin}. Reintentando...'
-                )
-                counter = counter + 1
-            except (TimeoutException, WebDriverException):
-                if counter < tries:
-                    logging.warning(
-                        f'La conexion de internet ha fallado para la moneda {coin}. Reintentando...'
-                    )
-                    counter = counter + 1
-                else:
-                    logging.warning(
-                        f'Cantidad máxima de intentos alcanzada para la moneda {coin}'
-                    )
-                    return content
-        return content
+                if not valid:
+                    raise InvalidFormFieldError(f'No se encontró la opción {coin} en el campo Moneda')
+                element.send_keys(coin)
+                submit_button = browser_driver.find_element_by_class_name(
+                    'btn-primary')
+                submit_button.click()
+                return browser_driver.page_source
+
+        return self.fetch_cached(
+            {'Fecha': start_date, 'Moneda': coin},
+            lambda: self.fetch_with_retry(fetch, f'la moneda {coin}'),
+            revalidate=True,
+        )
 
     def parse_contents(self, contents, start_date, end_date, intermediate_panel_data):
         """
@@ -216,41 +301,41 @@ class BCRAExchangeRateScraper(BCRAScraper):
         end_date : date
             fecha de fin que va a tomar como referencia el scraper
         """
-        parsed_contents = {'tc_local': {}, 'tp_usd': {}}
         day_count = (end_date - start_date).days + 1
+        pages = (
+            ((exchange_type, k, single_date), day_contents[k])
+            for single_date in (start_date + timedelta(n)
+                                for n in range(day_count))
+            if not self.day_content_in_panel(intermediate_panel_data, single_date)[0]
+            for exchange_type in ['tc_local', 'tp_usd']
+            for day_contents in [contents[exchange_type].get(single_date)]
+            if day_contents
+            for k in self.coins.keys()
+        )
+        return self.parse_pages(pages, start_date, end_date, intermediate_panel_data)
 
-        for single_date in (start_date + timedelta(n)
-                            for n in range(day_count)):
-            in_panel, parsed = self.day_content_in_panel(intermediate_panel_data, single_date)
-            if in_panel:
-                parsed_contents['tc_local'][single_date] = parsed['tc_local']
-                parsed_contents['tp_usd'][single_date] = parsed['tp_usd']
-            else:
-                for exchange_type in ['tc_local', 'tp_usd']:
-                    if contents[exchange_type]:
-                        for k in self.coins.keys():
-                            parsed = self.parse_coin(contents[exchange_type][single_date], single_date, k)
-                            preprocess_dict = {}
-                            preprocess_dict = self.preprocess_rows([parsed])
-                            for d in preprocess_dict:
-                                if d['indice_tiempo'] not in parsed_contents[exchange_type].keys():
-                                    parsed_contents[exchange_type][d['indice_tiempo']] = {}
-                                parsed_contents[exchange_type][d['indice_tiempo']][d['moneda']] =\
-                                    d[exchange_type]
-                                parsed_contents[exchange_type][d['indice_tiempo']]['indice_tiempo'] = d['indice_tiempo']
-
-                                if d['indice_tiempo'] not in intermediate_panel_data[exchange_type].keys():
-                                    intermediate_panel_data[exchange_type][d['indice_tiempo']] = {}
-                                intermediate_panel_data[exchange_type][d['indice_tiempo']][d['moneda']] =\
-                                    d[exchange_type]
-                                intermediate_panel_data[exchange_type][d['indice_tiempo']]['indice_tiempo'] = d['indice_tiempo']
-
-        return parsed_contents, intermediate_panel_data
+    def parse_page(self, task, content):
+        _, coin, single_date = task
+        return self.parse_coin(content, single_date, coin)
+
+    def preprocess_pages(self, rows):
+        return self.preprocess_rows(rows)
+
+    def merge_page(self, parsed_contents, intermediate_panel_data, task, row):
+        exchange_type, _, _ = task
+        for data in [parsed_contents, intermediate_panel_data]:
+            if row['indice_tiempo'] not in data[exchange_type].keys():
+                data[exchange_type][row['indice_tiempo']] = {}
+            data[exchange_type][row['indice_tiempo']][row['moneda']] =\
+                row[exchange_type]
+            data[exchange_type][row['indice_tiempo']]['indice_tiempo'] = row['indice_tiempo']
 
     def parse_coin(self, content, single_date, coin):
         """
         Retorna un iterable con el contenido scrapeado cuyo formato
-        posee el indice de tiempo y los tipos de pase y cambio de cada moneda
+        posee el indice de tiempo y los tipos de pase y cambio de cada moneda.
+        La página se parsea una sola vez, y cada fecha se busca en el
+        índice que retorna parse_coin_history.
 
         Parameters
         ----------
@@ -264,42 +349,69 @@ class BCRAExchangeRateScraper(BCRAScraper):
             Nombre de la moneda
         """
 
-        soup = BeautifulSoup(content, "html.parser")
         parsed = {}
         parsed['moneda'] = coin
         parsed['indice_tiempo'] = single_date
         parsed['tp_usd'] = ''
         parsed['tc_local'] = ''
-        try:
-            table = soup.find('table')
 
-            if not table:
-                return parsed
+        if isinstance(single_date, datetime):
+            single_date = single_date.date()
+        history = self.parse_document(content, self.parse_coin_history)
+        if single_date in history:
+            parsed['tp_usd'], parsed['tc_local'] = history[single_date]
+
+        return parsed
+
+    def parse_coin_history(self, content):
+        """
+        Recorre una vez la tabla de la página de una moneda y retorna un
+        diccionario con cada fecha como clave y una tupla con el tipo de
+        pase y el tipo de cambio como valor.
+
+        Parameters
+        ----------
+        content: str
+            Html de la moneda
+        """
+        history = {}
+        if not isinstance(content, str):
+            return history
+
+        if self.stream_tables:
+            return stream_coin_history(content, self.date_window)
 
-            head = table.find('thead')
+        parser = self.html_parser
+        document = parser.parse(content)
+        table = parser.find(document, 'table')
 
-            if not head:
-                return parsed
+        if table is None or parser.find(table, 'thead') is None:
+            return history
 
-            body = table.find('tbody')
+        body = parser.find(table, 'tbody')
 
-            if not body:
-                return parsed
+        if body is None:
+            return history
 
-            day = single_date.strftime("%d/%m/%Y")
+        for row in parser.find_all(body, 'tr'):
+            cols = parser.find_all(row, 'td')
+            if len(cols) < 3:
+                continue
+            try:
+                row_date = datetime.strptime(parser.get_text(cols[0]).strip(), "%d/%m/%Y").date()
+            except ValueError:
+                continue
+            history.setdefault(row_date, (
+                parser.get_text(cols[1]).strip(),
+                parser.get_text(cols[2]).strip()
+            ))
 
-            if body.find('td', text=re.compile(day)):
-                if day == body.find('td', text=re.compile(day)).text.strip():
-                    row = body.find('td', text=re.compile(day)).parent
-                    cols = row.find_all('td')
-                    parsed['moneda'] = coin
-                    parsed['indice_tiempo'] = single_date
-                    parsed['tp_usd'] = cols[1].text[5:].strip()
-                    parsed['tc_local'] = cols[2].text[5:].strip()
+        return history
 
-            return parsed
-        except:
-            return parsed
+    def get_extraction_settings(self):
+        settings = super(BCRAExchangeRateScraper, self).get_extraction_settings()
+        settings['stream_tables'] = self.stream_tables
+        return settings
 
     def _preprocess_rows(self, parsed):
         parsed['tc_local'] = self.preprocess_rows(parsed['tc_local'])
@@ -314,44 +426,22 @@ class BCRAExchangeRateScraper(BCRAScraper):
         ----------
         rows : list
         """
-        preprocessed_rows = []
-
-        for row in rows:
-            preprocessed_row = {}
-
-            for k in row.keys():
-                if k != 'moneda':
-                    if k == 'indice_tiempo':
-                        if type(row[k]) == str:
-                            if '/' in row[k]:
-                                _ = row[k].split('/')
-                                preprocessed_date = date.fromisoformat(
-                                    '-'.join([_[2], _[1], _[0]])
-                                )
-                            else:
-                                preprocessed_date = date.fromisoformat(row[k])
-                        else:
-                            preprocessed_date = row[k]
-                        preprocessed_row['indice_tiempo'] = preprocessed_date
-                    else:
-                        if '-' in str(row[k]):
-                            preprocessed_row[k] = None
-                        else:
-                            if row[k]:
-                                if not type(row[k]) == Decimal:
-                                    if '.' in row[k]:
-                                        row[k] = row[k].replace('.', '')
-                                    preprocessed_row[k] = (
-                                            Decimal((row[k]).replace(',', '.'))
-                                            if isinstance(row[k], str)
-                                            else row[k]
-                                        )
-                            else:
-                                preprocessed_row[k] = row[k]
-                else:
-                    preprocessed_row[k] = row[k]
+        preprocessed_rows = normalize_rows(
+            rows, skip=('moneda', 'indice_tiempo'), thousands=True, blank='',
+            dashes=True, other=lambda value: None if '-' in str(value) else value
+        )
 
-            preprocessed_rows.append(preprocessed_row)
+        for preprocessed_row in preprocessed_rows:
+            if type(preprocessed_row.get('indice_tiempo')) == str:
+                if '/' in preprocessed_row['indice_tiempo']:
+                    _ = preprocessed_row['indice_tiempo'].split('/')
+                    preprocessed_row['indice_tiempo'] = date.fromisoformat(
+                        '-'.join([_[2], _[1], _[0]])
+                    )
+                else:
+                    preprocessed_row['indice_tiempo'] = date.fromisoformat(
+                        preprocessed_row['indice_tiempo']
+                    )
 
         return preprocessed_rows
 
@@ -400,7 +490,7 @@ class BCRAExchangeRateScraper(BCRAScraper):
         ----------
         parsed_by_currency: lista de diccionarios por día de una moneda.
         """
-        df = pd.DataFrame(parsed.values()).set_index("indice_tiempo")
+        df = records_to_frame(parsed.values()).set_index("indice_tiempo")
         df.sort_index(inplace=True)
         df_panel = df.stack([-1], dropna=False).reset_index()
         df_panel["type"] = exchange_type
@@ -461,21 +551,14 @@ class BCRAExchangeRateScraper(BCRAScraper):
         """
         df_panel.columns = ['indice_tiempo', 'coin', 'type',
                             'value']
-        df_pivot_coin = df_panel[df_panel.type == exchange_type].pivot_table(
-            index="indice_tiempo",
-            columns=["coin"],
-            values="value",
-            aggfunc=sum,
-            dropna=False
-        )
-        df_pivot_coin = df_pivot_coin.replace([0], [None])
+        df_pivot_coin = self.pivot_panel(df_panel[df_panel.type == exchange_type], ["coin"], "value")
         df_pivot_coin.reset_index(inplace=True)
         df_pivot_coin['indice_tiempo'] = pd.to_datetime(df_pivot_coin['indice_tiempo'], format="%Y-%m-%d", errors='ignore', infer_datetime_format=True)
         # Se pasa primero a datetime y después a date porque si se trata de pasar directo a date rompe.
         df_pivot_coin['indice_tiempo'] = df_pivot_coin['indice_tiempo'].dt.date
         df_pivot_coin['index'] = df_pivot_coin['indice_tiempo']
         df_pivot_coin.set_index(['index'], inplace=True)
-        parsed_by_currency = df_pivot_coin.to_dict(orient="index")
+        parsed_by_currency = frame_to_records(df_pivot_coin)
         return parsed_by_currency
 
     def read_intermediate_panel_dataframe(self):
@@ -497,45 +580,48 @@ class BCRAExchangeRateScraper(BCRAScraper):
         self.write_intermediate_panel(rows, self.intermediate_panel_path)
 
     def create_intermediate_panel_dataframe(self):
-        intermediate_panel_dataframe = pd.read_csv(
-            self.intermediate_panel_path,
-            converters={
+        intermediate_panel_dataframe = self.read_panel_csv(
+            {
                 'serie_tiempo': lambda _: _,
                 'coin': lambda _: str(_),
                 'type': lambda _: str(_),
                 'value': lambda _: Decimal(_) if _ else None
-            }
+            },
+            'value'
         )
         return intermediate_panel_dataframe
 
     def preprocess_start_date(self, start_date, end_date):
-        counter = 1
-        tries = self.tries
+        def fetch():
+            with self.throttled():
+                if self.transport == 'http':
+                    return self.get_http_transport().get_form(
+                        self.url, ['Fecha']
+                    ).get_options('Fecha')
 
-        while counter <= tries:
-            try:
                 browser_driver = self.get_browser_driver()
                 browser_driver.get(self.url)
                 element_present = EC.presence_of_element_located(
                     (By.NAME, 'Fecha')
                 )
                 elem = WebDriverWait(browser_driver, 0).until(element_present)
+                return elem.text
 
-                if not start_date.strftime("%d/%m/%Y") in elem.text:
-                    logging.warning(f'La fecha {start_date.strftime("%d/%m/%Y")} no existe')
-                    if start_date < end_date:
-                        start_date = start_date + timedelta(days=1)
-                        logging.warning(f'La nueva fecha de inicio es {start_date}')
-                    else:
-                        raise InvalidConfigurationError('La fecha de inicio no puede ser mayor a la fecha de fin')
-                return start_date
-
-            except (TimeoutException, WebDriverException):
-                if counter <= tries:
-                    logging.warning(
-                        f'La conexion de internet ha fallado para la fecha {start_date}. Reintentando...'
-                    )
-                    counter = counter + 1
+        available_dates = self.fetch_with_retry(
+            fetch, f'la fecha {start_date}', default=None
+        )
+        if available_dates is None:
+            return start_date
+        self.available_dates = ' '.join(available_dates) if isinstance(available_dates, list) else available_dates
+
+        if not start_date.strftime("%d/%m/%Y") in available_dates:
+            logging.warning(f'La fecha {start_date.strftime("%d/%m/%Y")} no existe')
+            if start_date < end_date:
+                start_date = start_date + timedelta(days=1)
+                logging.warning(f'La nueva fecha de inicio es {start_date}')
+            else:
+                raise InvalidConfigurationError('La fecha de inicio no puede ser mayor a la fecha de fin')
+        return start_date
 
     def delete_date_from_panel(self, intermediate_panel_data, single_date):
         for coin in ['tc_local', 'tp_usd']:
@@ -2,20 +2,19 @@ from csv import DictWriter
 from datetime import date, timedelta, datetime
 from decimal import Decimal
 from functools import reduce
-import logging
 import os
 
-from bs4 import BeautifulSoup
 from selenium.webdriver.common.keys import Keys
 import pandas as pd
-import progressbar
 
 from bcra_scraper.scraper_base import BCRAScraper
 from bcra_scraper.exceptions import InvalidConfigurationError
+from bcra_scraper.normalize import to_decimals
+from bcra_scraper.records import Record, frame_to_records, get_record_schema, records_to_frame
+from bcra_scraper.schema import LiborSchema
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
 
 
 class BCRALiborScraper(BCRAScraper):
@@ -31,6 +30,8 @@ class BCRALiborScraper(BCRAScraper):
         el contenido a ser scrapeado
     rates : Dict
         Diccionario que contiene los plazos en días de la tasa Libor
+    schema : LiborSchema
+        Esquema de columnas compilado a partir de rates
 
     Methods
     -------
@@ -52,6 +53,10 @@ class BCRALiborScraper(BCRAScraper):
         de la tasa y un iterable con los contenidos scrapeados, y devuelve
         un iterable con la información normalizada
 
+    preprocess_rows_batch(rates, rows_list)
+        Igual que preprocess_rows, para una lista con los contenidos
+        scrapeados de varias fechas
+
     preprocess_header(self, rates, header)
         Recibe un diccionario con los valores para los plazos en días
         de la tasa y una lista con los header que seran estandarizados
@@ -61,6 +66,10 @@ class BCRALiborScraper(BCRAScraper):
         y los devuelve en un iterable
     """
 
+    source = 'libor'
+
+    document_parser = 'parse_rates_table'
+
     def __init__(self, url, rates, intermediate_panel_path, *args, **kwargs):
         """
         Parameters
@@ -73,6 +82,7 @@ class BCRALiborScraper(BCRAScraper):
             Diccionario que contiene los plazos en días de la tasa Libor
         """
         self.rates = rates
+        self.schema = None
         self.intermediate_panel_path = intermediate_panel_path
 
         super(BCRALiborScraper, self).__init__(url, *args, **kwargs)
@@ -90,28 +100,31 @@ class BCRALiborScraper(BCRAScraper):
         end_date: date
             fecha de fin que va a tomar como referencia el scraper
         """
-        contents = {}
-        day_count = (end_date - start_date).days + 1
-        cont = 0
-        bar = progressbar.ProgressBar(max_value=day_count, redirect_stdout=True, \
-            widgets=[progressbar.Bar('=', '[', ']'), '', progressbar.Percentage()])
-        bar.start()
-        for single_date in (start_date + timedelta(n)
-                            for n in range(day_count)):
-            if single_date not in fetched_contents:
-                in_panel, day_content = self.day_content_in_panel(intermediate_panel_data, single_date)
-                if not in_panel:
-                    contents[single_date] = self.fetch_day_content(single_date)
-            else:
-                logging.warning(f'La fecha {single_date} fue descargada en el primer ciclo.')
-            cont += 1
-            bar.update(cont)
-        bar.finish()
+        dates = self.get_missing_dates(start_date, end_date, intermediate_panel_data, fetched_contents)
+        contents = self.fetch_tasks(*self.get_fetch_tasks(dates))
         return contents
 
+    def get_fetch_tasks(self, dates):
+        """
+        Retorna una tupla con las fechas a descargar y la función que
+        descarga la página de cada una.
+        """
+        return dates, self.fetch_day_content
+
     def empty_fetched_contents(self):
         return {}
 
+    def day_in_fetched_contents(self, fetched_contents, single_date):
+        """
+        Chequea si la fecha se encuentra en los contenidos
+        descargados en el primer ciclo,
+        y devuelve el booleano correspondiente.
+        """
+        return single_date in fetched_contents
+
+    def add_fetched_dates(self, fetched_contents, dates):
+        fetched_contents.update(dict.fromkeys(dates))
+
     def day_content_in_panel(self, intermediate_panel_data, single_date):
         """
         Recibe la data del panel intermedio y una fecha.
@@ -130,20 +143,21 @@ class BCRALiborScraper(BCRAScraper):
 
     def fetch_day_content(self, single_date):
         """
-        Ingresa al navegador y retorna un html correspondiente a la fecha
-        que recibe
+        Envía el formulario con la fecha que recibe, por HTTP o a través
+        del navegador, y retorna el html correspondiente
 
         Parameters
         ----------
         single_date : date
             fecha que va a tomar como referencia el scraper
         """
-        content = ''
-        counter = 1
-        tries = self.tries
+        def fetch():
+            with self.throttled():
+                if self.transport == 'http':
+                    return self.submit_form(
+                        {'fecha': single_date.strftime("%d/%m/%Y")}
+                    )
 
-        while counter <= tries and not content:
-            try:
                 browser_driver = self.get_browser_driver()
                 browser_driver.get(self.url)
                 element_present = EC.presence_of_element_located(
@@ -151,25 +165,13 @@ class BCRALiborScraper(BCRAScraper):
                 )
                 element = WebDriverWait(browser_driver, 0).until(element_present)
                 element.send_keys(single_date.strftime("%d/%m/%Y") + Keys.RETURN)
-                content = browser_driver.page_source
-            
-            except NoSuchElementException:
-                logging.warning(
-                    f'No se encontró la fecha {single_date}. Reintentando...'
-                )
-                counter = counter + 1
-            except (TimeoutException, WebDriverException):
-                if counter < tries:
-                    logging.warning(
-                        f'La conexion de internet ha fallado para la fecha {single_date}. Reintentando...'
-                    )
-                    counter = counter + 1
-                else:
-                    logging.warning(
-                        f'Cantidad máxima de intentos alcanzada para la fecha {single_date}'
-                    )
-                    return content
-        return content
+                return browser_driver.page_source
+
+        return self.fetch_cached(
+            {'fecha': single_date},
+            lambda: self.fetch_with_retry(fetch, f'la fecha {single_date}'),
+            single_date,
+        )
 
     def parse_contents(self, contents, start_date, end_date, intermediate_panel_data):
         """
@@ -181,21 +183,38 @@ class BCRALiborScraper(BCRAScraper):
         contents : Iterable
             Contenidos que van a ser parseados
         """
-        parsed_contents = {}
         day_count = (end_date - start_date).days + 1
+        pages = (
+            (single_date, contents[single_date])
+            for single_date in (start_date + timedelta(n)
+                                for n in range(day_count))
+            if single_date in contents
+            and not self.day_content_in_panel(intermediate_panel_data, single_date)[0]
+        )
+        return self.parse_pages(pages, start_date, end_date, intermediate_panel_data)
+
+    def parse_page(self, single_date, content):
+        return self.parse_day_content(single_date, content)
+
+    def preprocess_pages(self, rows):
+        return self.preprocess_rows_batch(self.rates, rows)
+
+    def merge_page(self, parsed_contents, intermediate_panel_data, single_date, row):
+        parsed_contents[single_date] = row
+        intermediate_panel_data[single_date] = row
 
+    def get_panel_contents(self, start_date, end_date, intermediate_panel_data):
+        parsed_contents = {}
+        day_count = (end_date - start_date).days + 1
         for single_date in (start_date + timedelta(n)
                             for n in range(day_count)):
             in_panel, parsed = self.day_content_in_panel(intermediate_panel_data, single_date)
             if in_panel:
                 parsed_contents[single_date] = parsed
-            else:
-                if single_date in contents:
-                    parsed = self.parse_day_content(single_date, contents[single_date])
-                    _parsed = self._preprocess_rows(parsed)
-                    parsed_contents[single_date] = _parsed
-                    intermediate_panel_data[single_date] = _parsed
-        return parsed_contents, intermediate_panel_data
+        return parsed_contents
+
+    def sort_parsed(self, parsed_contents):
+        return dict(sorted(parsed_contents.items()))
 
     def parse_day_content(self, single_date, content):
         """
@@ -207,30 +226,56 @@ class BCRALiborScraper(BCRAScraper):
         content : str
             Recibe un string con la información que será parseada
         """
-        soup = BeautifulSoup(content, "html.parser")
+        rows = self.parse_document(content, self.parse_rates_table)
         parsed = {'indice_tiempo': single_date, '30': '', '60': '', '90': '', '180': '', '360': ''}
         try:
-            table = soup.find('table')
-            body = table.find('tbody')
-
-            rows = body.find_all('tr')
-
-            for row in rows:
+            for cols in rows:
                 validation_list = {}
-                cols = row.find_all('td')
-                if cols[0].text in self.rates.keys():
-                    validation_list[cols[0].text] = cols[1].text
+                if cols[0] in self.rates.keys():
+                    validation_list[cols[0]] = cols[1]
 
                     for r in validation_list.keys():
                         valid = self.rates_config_validator(r, self.rates)
                         if valid:
-                            parsed[cols[0].text] = cols[1].text
+                            parsed[cols[0]] = cols[1]
                         else:
                             continue
             return parsed
         except:
             return parsed
 
+    def parse_rates_table(self, content):
+        """
+        Retorna una lista con el texto de las celdas de cada fila de la
+        tabla de tasas, o una lista vacía si la página no tiene la tabla.
+
+        Parameters
+        ----------
+        content : str
+            Html de la fecha
+        """
+        parser = self.html_parser
+        document = parser.parse(content)
+        table = parser.find(document, 'table')
+        body = parser.find(table, 'tbody') if table is not None else None
+        if body is None:
+            return []
+        return [
+            [parser.get_text(col) for col in parser.find_all(row, 'td')]
+            for row in parser.find_all(body, 'tr')
+        ]
+
+    def get_schema(self, rates=None):
+        """
+        Retorna el esquema de columnas compilado para los plazos, por
+        defecto los del scraper. El esquema se compila una sola vez por
+        configuración.
+        """
+        rates = self.rates if rates is None else rates
+        if self.schema is None or self.schema.rates is not rates:
+            self.schema = LiborSchema(rates)
+        return self.schema
+
     def rates_config_validator(self, parsed, rates):
         """Valida que parsed exista dentro de
         los valores de rates en el archivo de
@@ -243,7 +288,7 @@ class BCRALiborScraper(BCRAScraper):
         rates : Dict
             Diccionario que contiene los plazos en días de la tasa Libor
         """
-        if f'libor_{parsed}_dias' in rates.values():
+        if self.get_schema(rates).is_valid_rate(parsed):
             return True
         else:
             raise InvalidConfigurationError(
@@ -267,26 +312,46 @@ class BCRALiborScraper(BCRAScraper):
         rows : Iterable
             Iterable que contiene la información scrapeada
         """
-        preprocessed_row = {}
-        if type(rows['indice_tiempo']) == str:
-            preprocessed_row['indice_tiempo'] = date.fromisoformat(
-                rows['indice_tiempo']
-            )
-        else:
-            preprocessed_row['indice_tiempo'] = rows['indice_tiempo']
-
-        for rate in rates:
-            if rate in rows:
-                if rows[rate]:
-                    preprocessed_row[rates[rate]] = Decimal(
-                        str(rows[rate]).replace(',', '.')
-                    )/100
-                else:
-                    preprocessed_row[rates[rate]] = None
+        return self.preprocess_rows_batch(rates, [rows])[0]
+
+    def preprocess_rows_batch(self, rates, rows_list):
+        """
+        Retorna una lista con el contenido estandarizado de cada fecha,
+        igual que preprocess_rows. Las tasas de todas las fechas se
+        convierten juntas, pasando de porcentaje a proporción.
+
+        Parameters
+        ----------
+        rates : Dict
+            Diccionario que contiene los plazos en días de la tasa Libor
+
+        rows_list : list
+            Lista con la información scrapeada de cada fecha
+        """
+        values = iter(to_decimals(
+            [rows[rate] for rows in rows_list for rate in rates if rate in rows],
+            scale=100,
+            other=lambda value: (
+                Decimal(str(value).replace(',', '.'))/100 if value else None
+            ),
+        ))
+        record_schema = get_record_schema(['indice_tiempo'] + list(rates.values()))
+        preprocessed_rows = []
+        for rows in rows_list:
+            if type(rows['indice_tiempo']) == str:
+                cells = [date.fromisoformat(rows['indice_tiempo'])]
             else:
-                preprocessed_row[rates[rate]] = rows[rates[rate]]
+                cells = [rows['indice_tiempo']]
+
+            for rate, column in rates.items():
+                if rate in rows:
+                    cells.append(next(values))
+                else:
+                    cells.append(rows[column])
+
+            preprocessed_rows.append(Record(record_schema, cells))
 
-        return preprocessed_row
+        return preprocessed_rows
 
     def preprocess_header(self, rates):
         """
@@ -297,13 +362,7 @@ class BCRALiborScraper(BCRAScraper):
         rates : Dict
             Diccionario que contiene los plazos en días de la tasa Libor
         """
-        preprocessed_header = []
-
-        preprocessed_header.append('indice_tiempo')
-
-        for value in rates.values():
-            preprocessed_header.append(value)
-        return preprocessed_header
+        return list(self.get_schema(rates).header)
 
     def get_intermediate_panel_data_from_parsed(self, parsed):
         """
@@ -327,16 +386,11 @@ class BCRALiborScraper(BCRAScraper):
         ----------
         parsed: dict
         """
-        def create_multi_index_column(field_title):
-            """Crea multi index desarmando el título de un campo."""
-            libor, day_type, days = field_title.split("_")
-            return (day_type, days)
-
-        df = pd.DataFrame(parsed.values()).set_index("indice_tiempo")
-        df = df[['libor_30_dias', 'libor_60_dias', 'libor_90_dias', 'libor_180_dias', 'libor_360_dias']]
+        schema = self.get_schema()
+        df = records_to_frame(parsed.values()).set_index("indice_tiempo")
+        df = df[schema.columns]
         df.sort_index(inplace=True)
-        df.columns = pd.MultiIndex.from_tuples([create_multi_index_column(col) for col in df.columns])
-        df.columns = df.columns.droplevel(level=1)
+        df.columns = [schema.get_panel_key(col) for col in df.columns]
         df_panel = df.stack([-1], dropna=False).reset_index()
         df_panel.columns = ["indice_tiempo", "type", "value"]
         df_panel["indice_tiempo"] = df_panel["indice_tiempo"].apply(lambda x: x)
@@ -400,26 +454,13 @@ class BCRALiborScraper(BCRAScraper):
         ----------
         df_panel: dataframe con los datos del panel intermedio.
         """
-        def create_field_title(col_multi_index):
-            """Convierte columnas multi index a nombre de campo plano."""
-            type = col_multi_index
-            field_title = "libor_{type}_dias".format(
-                type=type
-            )
-            return field_title
+        schema = self.get_schema()
         _parsed = {}
         columns = ['indice_tiempo']
         columns.extend([v for v in self.rates.values()])
         if not df_panel.empty:
-            df_pivot = df_panel.pivot_table(
-                index="indice_tiempo",
-                columns=["type"],
-                values="value",
-                aggfunc=sum,
-                dropna=False
-            )
-            df_pivot = df_pivot.replace([0], [None])
-            flatten_columns = [create_field_title(col) for col in df_pivot.columns]
+            df_pivot = self.pivot_panel(df_panel, ["type"], "value")
+            flatten_columns = [schema.get_column(col) for col in df_pivot.columns]
             df_pivot.columns = flatten_columns
             df_pivot.reset_index(inplace=True)
             df_pivot['indice_tiempo'] = pd.to_datetime(df_pivot['indice_tiempo'], format="%Y-%m-%d", errors='ignore', infer_datetime_format=True)
@@ -427,7 +468,7 @@ class BCRALiborScraper(BCRAScraper):
             df_pivot['indice_tiempo'] = df_pivot['indice_tiempo'].dt.date
             df_pivot['index'] = df_pivot['indice_tiempo']
             df_pivot.set_index(['index'], inplace=True)
-            _parsed = df_pivot.to_dict(orient="index")
+            _parsed = frame_to_records(df_pivot)
         return _parsed
 
     def read_intermediate_panel_dataframe(self):
@@ -449,14 +490,14 @@ class BCRALiborScraper(BCRAScraper):
         self.write_intermediate_panel(rows, self.intermediate_panel_path)
 
     def create_intermediate_panel_dataframe(self):
-        intermediate_panel_dataframe = pd.read_csv(
-            self.intermediate_panel_path,
-            converters={
+        intermediate_panel_dataframe = self.read_panel_csv(
+            {
                 'serie_tiempo': lambda _: _,
                 'coin': lambda _: str(_),
                 'type': lambda _: str(_),
                 'value': lambda _: Decimal(_) if _ else None
-            }
+            },
+            'value'
         )
         return intermediate_panel_dataframe
 
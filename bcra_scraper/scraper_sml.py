@@ -3,17 +3,65 @@ from datetime import date, datetime, timedelta
 from decimal import Decimal
 from functools import reduce
 import logging
+import re
 
-from bs4 import BeautifulSoup
 import pandas as pd
-import progressbar
 
-from bcra_scraper.exceptions import InvalidConfigurationError
+from bcra_scraper.exceptions import InvalidConfigurationError, InvalidFormFieldError
 from bcra_scraper.scraper_base import BCRAScraper
+from bcra_scraper.schema import SMLSchema
+from bcra_scraper.normalize import normalize_rows
+from bcra_scraper.records import Record, frame_to_records, get_record_schema, records_to_frame
+from bcra_scraper.table_stream import TableStream, iter_window_rows
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
+
+
+DATE_PATTERN = re.compile(r'\d{2}/\d{2}/\d{4}')
+
+
+def stream_table(content, date_window=None):
+    """
+    Lee la tabla de la página de una moneda con un extractor
+    incremental y retorna lo mismo que BCRASMLScraper.parse_table. Con
+    una ventana de fechas, solo guarda las filas de esas fechas y deja
+    de leer la página al pasarlas.
+
+    Parameters
+    ----------
+    content: str
+        Html de la moneda
+    date_window : tuple
+        Fechas de inicio y de fin de la ejecución
+    """
+    stream = TableStream()
+    headers_rows, rows = [], {}
+
+    def dated_rows():
+        for section, cells in stream.iter_rows(content):
+            if section == 'thead':
+                headers_rows.append([cell.text for cell in cells if cell.tag == 'th'])
+                continue
+            cols = [cell for cell in cells if cell.tag == 'td']
+            for col in cols:
+                day = col.string
+                if day and DATE_PATTERN.fullmatch(day):
+                    if date_window is None:
+                        yield None, (day, cols)
+                        break
+                    try:
+                        yield datetime.strptime(day, '%d/%m/%Y').date(), (day, cols)
+                    except ValueError:
+                        pass
+                    break
+
+    for _, (day, cols) in iter_window_rows(dated_rows(), date_window):
+        rows.setdefault(day, [col.text.strip() for col in cols])
+
+    if not stream.sections.get('thead') or not stream.sections.get('tbody'):
+        return [], {}
+    return headers_rows, rows
 
 
 class BCRASMLScraper(BCRAScraper):
@@ -30,6 +78,13 @@ class BCRASMLScraper(BCRAScraper):
         el contenido a ser scrapeado
     coins : Dict
         Diccionario que contiene las monedas que serán utilizadas
+    types : Dict
+        Diccionario que contiene los tipos de cambio de cada moneda
+    schema : SMLSchema
+        Esquema de columnas compilado a partir de types
+    stream_tables : bool
+        Indica si la tabla de la página se lee con el extractor
+        incremental
 
     Methods
     -------
@@ -51,6 +106,10 @@ class BCRASMLScraper(BCRAScraper):
         y los devuelve en un iterable
     """
 
+    source = 'sml'
+
+    document_parser = 'parse_table'
+
     def __init__(self, url, coins, intermediate_panel_path, types, *args, **kwargs):
         """
         Parameters
@@ -61,18 +120,26 @@ class BCRASMLScraper(BCRAScraper):
             contenido no está vacio.
         coins : Dict
             Diccionario que contiene los nombres de las monedas
+        stream_tables : bool
+            Si es True, la tabla de la página se lee con un extractor
+            incremental, sin armar el árbol del documento, y se deja de
+            leer al pasar las fechas de la ejecución.
         """
 
         self.coins = coins
         self.intermediate_panel_path = intermediate_panel_path
         self.types = types
+        self.schema = None
+        self.stream_tables = bool(kwargs.get('stream_tables'))
         super(BCRASMLScraper, self)\
             .__init__(url, *args, **kwargs)
 
     def fetch_contents(self, start_date, end_date, intermediate_panel_data, fetched_contents):
         """
-        Función que a traves de un loop llama a un método
-        y regresa un diccionario con el html de cada moneda.
+        Descarga una vez la página de cada moneda, que tiene toda la
+        serie, y regresa un diccionario con cada moneda como clave y como
+        valor un diccionario con cada fecha como clave y el html de la
+        moneda como valor.
 
         Parameters
         ----------
@@ -81,25 +148,31 @@ class BCRASMLScraper(BCRAScraper):
         """
 
         contents = {'peso_uruguayo': {}, 'real': {}}
-        day_count = (end_date - start_date).days + 1
-        cont = 0
-        bar = progressbar.ProgressBar(max_value=day_count, redirect_stdout=True, \
-            widgets=[progressbar.Bar('=', '[', ']'), '', progressbar.Percentage()])
-        bar.start()
-        for single_date in (start_date + timedelta(n)
-                            for n in range(day_count)):
-            if not self.day_in_fetched_contents(fetched_contents, single_date):
-                in_panel, day_content = self.day_content_in_panel(intermediate_panel_data, single_date)
-                if not in_panel:
-                    for k, v in self.coins.items():
-                        contents[k][single_date] = self.fetch_content(v)
-            else:
-                logging.warning(f'La fecha {single_date} fue descargada en el primer ciclo.')
-            cont += 1
-            bar.update(cont)
-        bar.finish()
+        dates = self.get_missing_dates(start_date, end_date, intermediate_panel_data, fetched_contents)
+        if not dates:
+            return contents
+
+        coin_contents = self.fetch_tasks(*self.get_fetch_tasks(dates))
+        for coin, content in coin_contents.items():
+            for (_, single_date), page in self.get_fetched_pages(coin, content, dates):
+                contents[coin][single_date] = page
         return contents
 
+    def get_fetch_tasks(self, dates):
+        """
+        Retorna una tupla con las monedas a descargar y la función que
+        descarga la página de cada una. La página de cada moneda tiene
+        toda la serie, por lo que se pide una sola vez y se usa para
+        todas las fechas. En el refetch se reutiliza la página pedida en
+        el primer ciclo.
+        """
+        if not dates:
+            return [], None
+        return list(self.coins.keys()), lambda coin: self.fetch_content(self.coins[coin])
+
+    def get_fetched_pages(self, coin, content, dates):
+        return [((coin, single_date), content) for single_date in dates]
+
     def empty_fetched_contents(self):
         return {'peso_uruguayo': {}, 'real': {}}
 
@@ -137,20 +210,19 @@ class BCRASMLScraper(BCRAScraper):
 
     def fetch_content(self, coin):
         """
-        Ingresa al navegador y utiliza la moneda
-        regresando el contenido que pertenece a la misma.
+        Envía el formulario con la moneda, por HTTP o a través del
+        navegador, regresando el contenido que pertenece a la misma.
 
         Parameters
         ----------
         coins : String
             String que contiene el nombre de la moneda
         """
-        content = ''
-        counter = 1
-        tries = self.tries
+        def fetch():
+            with self.throttled():
+                if self.transport == 'http':
+                    return self.submit_form({'moneda': coin})
 
-        while counter <= tries and not content:
-            try:
                 browser_driver = self.get_browser_driver()
                 browser_driver.get(self.url)
                 element_present = EC.presence_of_element_located(
@@ -160,27 +232,16 @@ class BCRASMLScraper(BCRAScraper):
 
                 options = element.find_elements_by_tag_name('option')
                 valid = self.validate_coin_in_configuration_file(coin, options)
-                if valid:
-                    element.send_keys(coin)
-                    content = browser_driver.page_source
-
-            except NoSuchElementException:
-                logging.warning(
-                    f'No se encontró la moneda: {coin}. Reintentando...'
-                )
-                counter = counter + 1
-            except (TimeoutException, WebDriverException):
-                if counter < tries:
-                    logging.warning(
-                        f'La conexion de internet ha fallado para la moneda {coin}. Reintentando...'
-                    )
-                    counter = counter + 1
-                else:
-                    logging.warning(
-                        f'Cantidad máxima de intentos alcanzada para la moneda {coin}'
-                    )
-                    return content
-        return content
+                if not valid:
+                    raise InvalidFormFieldError(f'No se encontró la opción {coin} en el campo moneda')
+                element.send_keys(coin)
+                return browser_driver.page_source
+
+        return self.fetch_cached(
+            {'moneda': coin},
+            lambda: self.fetch_with_retry(fetch, f'la moneda {coin}'),
+            revalidate=True,
+        )
 
     def parse_contents(self, contents, start_date, end_date, intermediate_panel_data):
         """
@@ -198,40 +259,44 @@ class BCRASMLScraper(BCRAScraper):
         end_date : date
             fecha de fin que va a tomar como referencia el scraper
         """
-        parsed_contents = {'peso_uruguayo': {}, 'real': {}}
         day_count = (end_date - start_date).days + 1
-        for single_date in (start_date + timedelta(n)
-                            for n in range(day_count)):
-            in_panel, parsed = self.day_content_in_panel(intermediate_panel_data, single_date)
-
-            if in_panel:
-                parsed_contents['peso_uruguayo'][single_date] = parsed['peso_uruguayo']
-                parsed_contents['real'][single_date] = parsed['real']
-            else:
-                for coin in self.coins.keys():
-                    if contents[coin]:
-                        parsed = self.parse_content(contents[coin][single_date], coin, single_date)
-                        preprocess_dict = {}
-                        preprocess_dict = self.preprocess_rows([parsed])
-                        for d in preprocess_dict:
-                            for k, v in self.types[d['coin']].items():
-                                if d['indice_tiempo'] not in parsed_contents[coin].keys():
-                                    parsed_contents[coin][d['indice_tiempo']] = {}
-                                parsed_contents[coin][d['indice_tiempo']][v] = d[k]
-                                parsed_contents[coin][d['indice_tiempo']]['indice_tiempo'] = d['indice_tiempo']
-
-                                if d['indice_tiempo'] not in intermediate_panel_data[coin].keys():
-                                    intermediate_panel_data[coin][d['indice_tiempo']] = {}
-                                intermediate_panel_data[coin][d['indice_tiempo']][v] = d[k]
-                                intermediate_panel_data[coin][d['indice_tiempo']]['indice_tiempo'] = d['indice_tiempo']
-
-        return parsed_contents, intermediate_panel_data
+        pages = (
+            ((coin, single_date), contents[coin][single_date])
+            for single_date in (start_date + timedelta(n)
+                                for n in range(day_count))
+            if not self.day_content_in_panel(intermediate_panel_data, single_date)[0]
+            for coin in self.coins.keys()
+            if contents[coin]
+        )
+        return self.parse_pages(pages, start_date, end_date, intermediate_panel_data)
+
+    def parse_page(self, task, content):
+        coin, single_date = task
+        return self.parse_content(content, coin, single_date)
+
+    def preprocess_pages(self, rows):
+        return self.preprocess_rows(rows)
+
+    def merge_page(self, parsed_contents, intermediate_panel_data, task, row):
+        coin, _ = task
+        columns = self.get_schema().get_columns(row['coin'])
+        if not columns:
+            return
+        day = row['indice_tiempo']
+        record = Record(
+            get_record_schema([v for _, v in columns] + ['indice_tiempo']),
+            [row[k] for k, _ in columns] + [day]
+        )
+        parsed_contents[coin][day] = record
+        intermediate_panel_data[coin][day] = record
 
     def parse_content(self, content, coin, single_date):
         """
         Retorna un iterable con el contenido scrapeado cuyo formato
         posee la moneda, el indice de tiempo, y los tipo de cambio
         correspondientes a la moneda.
+        La tabla se recorre una sola vez por documento con parse_table, y
+        cada fecha es una búsqueda en el diccionario de filas.
 
         Parameters
         ----------
@@ -244,49 +309,95 @@ class BCRASMLScraper(BCRAScraper):
         end_date : date
             fecha de fin que va a tomar como referencia el scraper
         """
-        soup = BeautifulSoup(content, "html.parser")
         parsed = self.empty_parsed_contents(single_date, coin)
-        try:
-            table = soup.find('table')
+        headers_rows, rows = self.parse_document(content, self.parse_table)
 
-            if not table:
+        day = single_date.strftime("%d/%m/%Y")
+        if day not in rows:
+            return parsed
+
+        cols = rows[day]
+        for headers in headers_rows:
+            try:
+                values = {headers[i]: cols[i] for i in range(1, 5)}
+            except IndexError:
                 return parsed
+            parsed['coin'] = coin
+            parsed['indice_tiempo'] = single_date
+            parsed.update(values)
 
-            head = table.find('thead')
+        return parsed
 
-            if not head:
-                return parsed
+    def parse_table(self, content):
+        """
+        Recorre una vez la tabla de la página de una moneda y retorna una
+        tupla con los encabezados de cada fila del thead y un diccionario
+        con cada fecha como clave y los valores de su fila como valor.
+
+        Parameters
+        ----------
+        content: str
+            Html de la moneda
+        """
+        headers_rows, rows = [], {}
+        if not isinstance(content, str):
+            return headers_rows, rows
 
-            body = table.find('tbody')
+        if self.stream_tables:
+            return stream_table(content, self.date_window)
 
-            if not body:
-                return parsed
+        parser = self.html_parser
+        document = parser.parse(content)
+        table = parser.find(document, 'table')
 
-            head_rows = head.find_all('tr')
+        if parser.is_empty(table):
+            return headers_rows, rows
 
-            day = single_date.strftime("%d/%m/%Y")
-            for header in head_rows:
-                headers = header.find_all('th')
+        head = parser.find(table, 'thead')
 
-                if body.find('td', text=day):
-                    row = body.find('td', text=day).parent
-                    cols = row.find_all('td')
-                    parsed['coin'] = coin
-                    parsed['indice_tiempo'] = single_date
-                    parsed[headers[1].text] = cols[1].text.strip()
-                    parsed[headers[2].text] = cols[2].text.strip()
-                    parsed[headers[3].text] = cols[3].text.strip()
-                    parsed[headers[4].text] = cols[4].text.strip()
+        if parser.is_empty(head):
+            return headers_rows, rows
 
-            return parsed
-        except:
-            return parsed
+        body = parser.find(table, 'tbody')
+
+        if parser.is_empty(body):
+            return headers_rows, rows
+
+        headers_rows = [
+            [parser.get_text(header) for header in parser.find_all(head_row, 'th')]
+            for head_row in parser.find_all(head, 'tr')
+        ]
+        for row in parser.find_all(body, 'tr'):
+            cols = parser.find_all(row, 'td')
+            for col in cols:
+                day = parser.get_string(col)
+                if day and DATE_PATTERN.fullmatch(day):
+                    rows.setdefault(day, [parser.get_text(c).strip() for c in cols])
+                    break
+
+        return headers_rows, rows
+
+    def get_extraction_settings(self):
+        settings = super(BCRASMLScraper, self).get_extraction_settings()
+        settings['stream_tables'] = self.stream_tables
+        return settings
+
+    def get_schema(self, types=None):
+        """
+        Retorna el esquema de columnas compilado para los tipos de
+        cambio, por defecto los del scraper. El esquema se compila una
+        sola vez por configuración.
+        """
+        types = self.types if types is None else types
+        if self.schema is None or self.schema.types is not types:
+            self.schema = SMLSchema(types)
+        return self.schema
 
     def empty_parsed_contents(self, single_date, coin):
         parsed = {}
         parsed['coin'] = coin
         parsed['indice_tiempo'] = single_date
-        for k in self.types.get(coin).keys():
+        for k, _ in self.get_schema().get_columns(coin):
             parsed[k] = ''
         return parsed
         
@@ -306,38 +417,21 @@ class BCRASMLScraper(BCRAScraper):
         ----------
         rows : list
         """
-        preprocessed_rows = []
-
-        for row in rows:
-            preprocessed_row = {}
-
-            for k in row.keys():
-                if k != 'coin':
-                    if k == 'indice_tiempo':
-                        if type(row[k]) == str:
-                            if '/' in row[k]:
-                                _ = row[k].split('/')
-                                preprocessed_date = date.fromisoformat(
-                                    '-'.join([_[2], _[1], _[0]])
-                                )
-                            else:
-                                preprocessed_date = date.fromisoformat(row[k])
-                        else:
-                            preprocessed_date = row[k]
-                        preprocessed_row['indice_tiempo'] = preprocessed_date
-                    else:
-                        if row[k]:
-                            preprocessed_row[k] = (
-                                Decimal((row[k]).replace(',', '.'))
-                                if isinstance(row[k], str)
-                                else row[k]
-                            )
-                        else:
-                            preprocessed_row[k] = row[k]
-                else:
-                    preprocessed_row[k] = row[k]
+        preprocessed_rows = normalize_rows(
+            rows, skip=('coin', 'indice_tiempo'), blank=''
+        )
 
-            preprocessed_rows.append(preprocessed_row)
+        for preprocessed_row in preprocessed_rows:
+            if type(preprocessed_row.get('indice_tiempo')) == str:
+                if '/' in preprocessed_row['indice_tiempo']:
+                    _ = preprocessed_row['indice_tiempo'].split('/')
+                    preprocessed_row['indice_tiempo'] = date.fromisoformat(
+                        '-'.join([_[2], _[1], _[0]])
+                    )
+                else:
+                    preprocessed_row['indice_tiempo'] = date.fromisoformat(
+                        preprocessed_row['indice_tiempo']
+                    )
 
         return preprocessed_rows
 
@@ -371,7 +465,7 @@ class BCRASMLScraper(BCRAScraper):
         ----------
         parsed_by_currency: lista de diccionarios por día de una moneda.
         """
-        df = pd.DataFrame(parsed.values()).set_index("indice_tiempo")
+        df = records_to_frame(parsed.values()).set_index("indice_tiempo")
         df.sort_index(inplace=True)
         df_panel = df.stack([-1], dropna=False).reset_index()
         df_panel["coin"] = coin
@@ -416,21 +510,14 @@ class BCRASMLScraper(BCRAScraper):
         """
         df_panel.columns = ['indice_tiempo', 'coin', 'type',
                             'value']
-        df_pivot_coin = df_panel[df_panel.coin == coin].pivot_table(
-            index="indice_tiempo",
-            columns=["type"],
-            values="value",
-            aggfunc=sum,
-            dropna=False
-        )
-        df_pivot_coin = df_pivot_coin.replace([0], [None])
+        df_pivot_coin = self.pivot_panel(df_panel[df_panel.coin == coin], ["type"], "value")
         df_pivot_coin.reset_index(inplace=True)
         df_pivot_coin['indice_tiempo'] = pd.to_datetime(df_pivot_coin['indice_tiempo'], format="%Y-%m-%d", errors='ignore', infer_datetime_format=True)
         # Se pasa primero a datetime y después a date porque si se trata de pasar directo a date rompe.
         df_pivot_coin['indice_tiempo'] = df_pivot_coin['indice_tiempo'].dt.date
         df_pivot_coin['index'] = df_pivot_coin['indice_tiempo']
         df_pivot_coin.set_index(['index'], inplace=True)
-        parsed_by_currency = df_pivot_coin.to_dict(orient="index")
+        parsed_by_currency = frame_to_records(df_pivot_coin)
         return parsed_by_currency
 
     def write_intermediate_panel(self, rows, intermediate_panel_path):
@@ -467,14 +554,14 @@ class BCRASMLScraper(BCRAScraper):
         self.write_intermediate_panel(rows, self.intermediate_panel_path)
 
     def create_intermediate_panel_dataframe(self):
-        intermediate_panel_dataframe = pd.read_csv(
-            self.intermediate_panel_path,
-            converters={
+        intermediate_panel_dataframe = self.read_panel_csv(
+            {
                 'serie_tiempo': lambda _: _,
                 'coin': lambda _: str(_),
                 'type': lambda _: str(_),
                 'value': lambda _: Decimal(_) if _ else None
-            }
+            },
+            'value'
         )
         return intermediate_panel_dataframe
 
@@ -2,19 +2,17 @@ from csv import DictWriter
 from datetime import date, datetime, timedelta
 from decimal import Decimal
 from functools import reduce
-import logging
-import re
 
-from bs4 import BeautifulSoup
 from pandas import pandas as pd
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
-import progressbar
 
-from bcra_scraper.exceptions import InvalidConfigurationError
+from bcra_scraper.exceptions import InvalidConfigurationError, InvalidFormFieldError
+from bcra_scraper.normalize import normalize_rows
+from bcra_scraper.records import Record, frame_to_records, get_record_schema, records_to_frame
 from bcra_scraper.scraper_base import BCRAScraper
+from bcra_scraper.schema import TCESchema
 
 
 class BCRATCEScraper(BCRAScraper):
@@ -32,6 +30,8 @@ class BCRATCEScraper(BCRAScraper):
         Diccionario que contiene las monedas que serán utilizadas
     entities : Dict
         Diccionario que contiene el nombre de los bancos
+    schema : TCESchema
+        Esquema de columnas compilado a partir de entities
 
     Methods
     -------
@@ -55,6 +55,10 @@ class BCRATCEScraper(BCRAScraper):
         y los devuelve en un iterable
     """
 
+    source = 'tce'
+
+    document_parser = 'parse_entity_table'
+
     def __init__(self, url, coins, entities, intermediate_panel_path, *args, **kwargs):
         """
         Parameters
@@ -70,6 +74,7 @@ class BCRATCEScraper(BCRAScraper):
         """
         self.coins = coins
         self.entities = entities
+        self.schema = None
         self.intermediate_panel_path = intermediate_panel_path
         super(BCRATCEScraper, self)\
             .__init__(url, *args, **kwargs)
@@ -90,27 +95,21 @@ class BCRATCEScraper(BCRAScraper):
             Diccionario que contiene los nombres de las monedas
         """
         contents = {'dolar': {}, 'euro': {}}
-        day_count = (end_date - start_date).days + 1
-        cont = 0
-        bar = progressbar.ProgressBar(max_value=day_count, redirect_stdout=True,
-                                      widgets=[progressbar.Bar('=', '[', ']'), '', progressbar.Percentage()])
-        bar.start()
-        for single_date in (start_date + timedelta(n)
-                            for n in range(day_count)):
-            if not self.day_in_fetched_contents(fetched_contents, single_date):
-                in_panel, day_content = self.day_content_in_panel(intermediate_panel_data, single_date)
-                if not in_panel:
-                    for k, v in self.coins.items():
-                        fetched = self.fetch_content(single_date, v)
-                        contents[k][single_date] = fetched
-            else:
-                logging.warning(f'La fecha {single_date} fue descargada en el primer ciclo.')
-            cont += 1
-            bar.update(cont)
-        bar.finish()
+        dates = self.get_missing_dates(start_date, end_date, intermediate_panel_data, fetched_contents)
+        fetched_tasks = self.fetch_tasks(*self.get_fetch_tasks(dates))
+        for (coin, single_date), content in fetched_tasks.items():
+            contents[coin][single_date] = content
 
         return contents
 
+    def get_fetch_tasks(self, dates):
+        """
+        Retorna una tupla con las tuplas (moneda, fecha) a descargar y la
+        función que descarga la página de cada una.
+        """
+        tasks = [(k, single_date) for single_date in dates for k in self.coins.keys()]
+        return tasks, lambda task: self.fetch_content(task[1], self.coins[task[0]])
+
     def empty_fetched_contents(self):
         return {'dolar': {}, 'euro': {}}
 
@@ -152,8 +151,8 @@ class BCRATCEScraper(BCRAScraper):
 
     def fetch_content(self, single_date, coin):
         """
-        Ingresa al navegador y utiliza la moneda
-        regresando el contenido que pertenece a la misma.
+        Envía el formulario con la moneda y la fecha, por HTTP o a través
+        del navegador, regresando el contenido que pertenece a la misma.
 
         Parameters
         ----------
@@ -162,12 +161,14 @@ class BCRATCEScraper(BCRAScraper):
         coin : String
             String que contiene el nombre de la moneda
         """
-        content = ''
-        counter = 1
-        tries = self.tries
+        def fetch():
+            with self.throttled():
+                if self.transport == 'http':
+                    return self.submit_form({
+                        'moneda': coin,
+                        'fecha': single_date.strftime("%d/%m/%Y"),
+                    })
 
-        while counter <= tries and not content:
-            try:
                 browser_driver = self.get_browser_driver()
                 browser_driver.get(self.url)
                 element_present = EC.presence_of_element_located(
@@ -178,36 +179,25 @@ class BCRATCEScraper(BCRAScraper):
 
                 options = element.find_elements_by_tag_name('option')
                 valid = self.validate_coin_in_configuration_file(coin, options)
-
-                if valid:
-                    element.send_keys(coin)
-                    browser_driver.execute_script(
-                        'document.getElementsByName("fecha")\
-                        [0].removeAttribute("readonly")')
-                    elem = browser_driver.find_element_by_name('fecha')
-                    elem.send_keys(single_date.strftime("%d/%m/%Y"))
-                    submit_button = browser_driver.find_element_by_class_name(
-                        'btn-primary')
-                    submit_button.click()
-                    content = browser_driver.page_source
-
-            except NoSuchElementException:
-                logging.warning(
-                    f'No se encontró la moneda: {coin}. Reintentando...'
-                )
-                counter = counter + 1
-            except (TimeoutException, WebDriverException):
-                if counter < tries:
-                    logging.warning(
-                        f'La conexion de internet ha fallado para la moneda {coin}. Reintentando...'
-                    )
-                    counter = counter + 1
-                else:
-                    logging.warning(
-                        f'Cantidad máxima de intentos alcanzada para la moneda {coin}'
-                    )
-                    return content
-        return content
+                if not valid:
+                    raise InvalidFormFieldError(f'No se encontró la opción {coin} en el campo moneda')
+
+                element.send_keys(coin)
+                browser_driver.execute_script(
+                    'document.getElementsByName("fecha")\
+                    [0].removeAttribute("readonly")')
+                elem = browser_driver.find_element_by_name('fecha')
+                elem.send_keys(single_date.strftime("%d/%m/%Y"))
+                submit_button = browser_driver.find_element_by_class_name(
+                    'btn-primary')
+                submit_button.click()
+                return browser_driver.page_source
+
+        return self.fetch_cached(
+            {'moneda': coin, 'fecha': single_date},
+            lambda: self.fetch_with_retry(fetch, f'la moneda {coin} en la fecha {single_date}'),
+            single_date,
+        )
 
     def get_intermediate_panel_data_from_parsed(self, parsed):
         """
@@ -241,15 +231,11 @@ class BCRATCEScraper(BCRAScraper):
         parsed_by_currency: lista de diccionarios por día de una moneda.
         """
 
-        def create_multi_index_column(field_title):
-            """Crea multi index desarmando el título de un campo."""
-            tc, ars, coin, entity, channel, flow, hour = field_title.split("_")
-            return (coin, entity, channel, flow, hour)
-
-        df = pd.DataFrame(parsed.values()).set_index("indice_tiempo")
+        schema = self.get_schema()
+        df = records_to_frame(parsed.values()).set_index("indice_tiempo")
         df.sort_index(inplace=True)
         df.columns = pd.MultiIndex.from_tuples(
-            [create_multi_index_column(col) for col in df.columns])
+            [schema.get_panel_key(col) for col in df.columns])
         df_panel = df.stack([-5, -4, -3, -2, -1], dropna=False).reset_index()
         df_panel.columns = ["indice_tiempo", "coin",
                             "entity", "channel", "flow", "hour", "value"]
@@ -298,30 +284,30 @@ class BCRATCEScraper(BCRAScraper):
         df_panel: dataframe con los datos del panel intermedio.
         coin : string con el nombre de la moneda.
         """
-        def create_field_title(col_multi_index, coin):
-            """Convierte columnas muli index a nombre de campo plano."""
-            entity, channel, flow, hour = col_multi_index
-            field_title = "tc_ars_{coin}_{entity}_{channel}_{flow}_{hour}".format(
-                coin=coin,
-                entity=entity,
-                channel=channel,
-                flow=flow,
-                hour=hour
-            )
-            return field_title
-
+        schema = self.get_schema()
         df_panel.columns = ['indice_tiempo', 'moneda', 'entidad_bancaria',
                             'canal', 'flujo', 'hora', 'valor']
-        df_pivot_coin = df_panel[df_panel.moneda == coin].pivot_table(
-            index="indice_tiempo",
-            columns=["entidad_bancaria", "canal", "flujo", "hora"],
-            values="valor",
-            aggfunc=sum,
-            dropna=False
+        df_panel_coin = df_panel[df_panel.moneda == coin]
+        panel_keys = schema.get_panel_keys(coin)
+        df_panel_coin = df_panel_coin[pd.MultiIndex.from_frame(
+            df_panel_coin[['entidad_bancaria', 'canal', 'flujo', 'hora']]
+        ).isin(list(panel_keys))]
+        if df_panel_coin.empty:
+            # La tabla pivot de un panel vacío pierde el nombre del índice
+            return {}
+        df_pivot_coin = self.pivot_panel(
+            df_panel_coin,
+            ["entidad_bancaria", "canal", "flujo", "hora"],
+            "valor"
         )
-        df_pivot_coin = df_pivot_coin.replace([0], [None])
-        flatten_columns = [create_field_title(
-            col, coin) for col in df_pivot_coin.columns]
+        # La tabla pivot agrega todas las combinaciones de niveles,
+        # incluso las de canales deshabilitados.
+        df_pivot_coin = df_pivot_coin[[
+            col for col in df_pivot_coin.columns if col in panel_keys
+        ]]
+        flatten_columns = [
+            schema.get_column((coin, *col)) for col in df_pivot_coin.columns
+        ]
         df_pivot_coin.columns = flatten_columns
         df_pivot_coin.reset_index(inplace=True)
         df_pivot_coin['indice_tiempo'] = pd.to_datetime(df_pivot_coin['indice_tiempo'], format="%Y-%m-%d", errors='ignore', infer_datetime_format=True)
@@ -329,7 +315,7 @@ class BCRATCEScraper(BCRAScraper):
         df_pivot_coin['indice_tiempo'] = df_pivot_coin['indice_tiempo'].dt.date
         df_pivot_coin['index'] = df_pivot_coin['indice_tiempo']
         df_pivot_coin.set_index(['index'], inplace=True)
-        parsed_by_currency = df_pivot_coin.to_dict(orient="index")
+        parsed_by_currency = frame_to_records(df_pivot_coin)
         return parsed_by_currency
 
     def write_intermediate_panel(self, rows, intermediate_panel_path):
@@ -373,11 +359,11 @@ class BCRATCEScraper(BCRAScraper):
         self.write_intermediate_panel(rows, self.intermediate_panel_path)
 
     def create_intermediate_panel_dataframe(self):
-        intermediate_panel_dataframe = pd.read_csv(
-            self.intermediate_panel_path,
-            converters={
+        intermediate_panel_dataframe = self.read_panel_csv(
+            {
                 'valor': lambda _: Decimal(_) if _ else None
-            }
+            },
+            'valor'
         )
         return intermediate_panel_dataframe
 
@@ -416,26 +402,28 @@ class BCRATCEScraper(BCRAScraper):
         entities : Dict
             Diccionario que contiene el nombre de los bancos
         """
-        parsed_contents = {'dolar': {}, 'euro': {}}
         day_count = (end_date - start_date).days + 1
-        for single_date in (start_date + timedelta(n)
-                            for n in range(day_count)):
-            in_panel, parsed = self.day_content_in_panel(intermediate_panel_data, single_date)
-            if in_panel:
-                parsed_contents['dolar'][single_date] = parsed['dolar']
-                parsed_contents['euro'][single_date] = parsed['euro']
-            else:
-                for k in self.coins:
-                    if contents[k]:
-                        day_content = contents[k][single_date]
-                        parsed = self.parse_content(
-                            day_content, single_date, k, self.entities)
-                        preprocess_dict = {}
-                        preprocess_dict = self.preprocess_rows([parsed])
-                        for d in preprocess_dict:
-                            parsed_contents[k][single_date] = d
-                            intermediate_panel_data[k][single_date] = d
-        return parsed_contents, intermediate_panel_data
+        pages = (
+            ((k, single_date), contents[k][single_date])
+            for single_date in (start_date + timedelta(n)
+                                for n in range(day_count))
+            if not self.day_content_in_panel(intermediate_panel_data, single_date)[0]
+            for k in self.coins
+            if contents[k]
+        )
+        return self.parse_pages(pages, start_date, end_date, intermediate_panel_data)
+
+    def parse_page(self, task, content):
+        coin, single_date = task
+        return self.parse_content(content, single_date, coin, self.entities)
+
+    def preprocess_pages(self, rows):
+        return self.preprocess_rows(rows)
+
+    def merge_page(self, parsed_contents, intermediate_panel_data, task, row):
+        coin, single_date = task
+        parsed_contents[coin][single_date] = row
+        intermediate_panel_data[coin][single_date] = row
 
     def parse_content(self, content, single_date, coin, entities):
         """
@@ -455,104 +443,106 @@ class BCRATCEScraper(BCRAScraper):
         entities : Dict
             Diccionario que contiene el nombre de los bancos
         """
-        soup = BeautifulSoup(content, "html.parser")
+        cells, rows = self.parse_document(content, self.parse_entity_table)
+        schema = self.get_schema(entities)
         parsed = self.get_parsed(single_date, coin, entities)
         try:
-            table = soup.find(
-                class_='table table-BCRA table-bordered table-hover ' +
-                'table-responsive'
-            )
-
-            if not table:
-                return parsed
-
-            body = table.find('tbody')
-
-            if not body:
-                return parsed
-
-            for k, v in entities.items():
-                if body.find('td', text=re.compile(re.escape(v.get('name')))): 
-                    row = body.find(
-                        'td', text=re.compile(re.escape(v.get('name')))).parent
-                    cols = row.find_all('td')
-                    parsed[
-                        'indice_tiempo'
-                    ] = single_date
-                    for hour in ['11', '13', '15']:
-                        parsed = self.parse_hour(
-                            v, k, hour, coin, parsed, cols)
+            matchers = schema.get_matchers()
+            entity_rows = self.find_entity_rows(cells, matchers)
+            for entity, _, _ in matchers:
+                if entity not in entity_rows:
+                    continue
+                cols = rows[entity_rows[entity]]
+                parsed['indice_tiempo'] = single_date
+                for column, index in schema.get_entity_columns(entity, coin):
+                    parsed[column] = cols[index]
             return parsed
-        except:
+        except Exception:
             return parsed
 
-    def parse_hour(self, config, entity, hour, coin, parsed, cols):
-        mapping_values = {
-            'mostrador_compra_11': 1,
-            'mostrador_compra_13': 5,
-            'mostrador_compra_15': 9,
-            'electronico_compra_11': 3,
-            'electronico_compra_13': 7,
-            'electronico_compra_15': 11,
-            'mostrador_venta_11': 2,
-            'mostrador_venta_13': 6,
-            'mostrador_venta_15': 10,
-            'electronico_venta_11': 4,
-            'electronico_venta_13': 8,
-            'electronico_venta_15': 12
-        }
-        config = config['coins'].get(coin)
-        for k in config[hour]['channels'].keys():
-            for f in ['compra', 'venta']:
-                parsed[
-                    f'tc_ars_{coin}_{entity}_{k}_{f}_{hour}hs'
-                ] =\
-                    (cols[mapping_values[f'{k}_{f}_{hour}']].text.strip())
-        return parsed
+    def parse_entity_table(self, content):
+        """
+        Recorre una vez la tabla de entidades y retorna una tupla con una
+        lista de las celdas que tienen un único texto, cada una con ese
+        texto y el índice de su fila, y una lista con los textos de las
+        celdas de cada fila. Si la página no tiene la tabla retorna dos
+        listas vacías.
+
+        Parameters
+        ----------
+        content: str
+            Html de la moneda
+        """
+        parser = self.html_parser
+        document = parser.parse(content)
+        cells, rows = [], []
+        table = parser.find(
+            document, None,
+            class_='table table-BCRA table-bordered table-hover ' +
+            'table-responsive'
+        )
+        if parser.is_empty(table):
+            return cells, rows
+
+        body = parser.find(table, 'tbody')
+        if parser.is_empty(body):
+            return cells, rows
+
+        # Se guardan las filas recorridas para que sus ids no se reutilicen
+        row_nodes, row_indexes = [], {}
+        for cell in parser.find_all(body, 'td'):
+            text = parser.get_string(cell)
+            if text is None:
+                continue
+            row = parser.get_parent(cell)
+            if id(row) not in row_indexes:
+                row_indexes[id(row)] = len(rows)
+                row_nodes.append(row)
+                rows.append([parser.get_text(col).strip() for col in parser.find_all(row, 'td')])
+            cells.append((text, row_indexes[id(row)]))
+        return cells, rows
+
+    def get_schema(self, entities=None):
+        """
+        Retorna el esquema de columnas compilado para la configuración de
+        entidades, por defecto la del scraper. El esquema se compila una
+        sola vez por configuración.
+        """
+        entities = self.entities if entities is None else entities
+        if self.schema is None or self.schema.entities is not entities:
+            self.schema = TCESchema(entities)
+        return self.schema
+
+    def find_entity_rows(self, cells, matchers):
+        """
+        Recorre una vez las celdas de la tabla y retorna un diccionario
+        con la clave de cada entidad encontrada y el índice de la fila de
+        la primera celda que contiene su nombre.
+        """
+        rows = {}
+        pending = list(matchers)
+        for text, row in cells:
+            for entity, _, pattern in pending:
+                if pattern.search(text):
+                    rows[entity] = row
+            pending = [matcher for matcher in pending if matcher[0] not in rows]
+            if not pending:
+                break
+        return rows
 
     def get_parsed(self, day, coin, entities):
-        parsed = {}
-        for k in entities.keys():
-            parsed[
-                'indice_tiempo'
-            ] = day
-            parsed[
-                f'tc_ars_{coin}_{k}_mostrador_compra_11hs'
-            ] = ''
-            parsed[
-                f'tc_ars_{coin}_{k}_mostrador_compra_13hs'
-            ] = ''
-            parsed[
-                f'tc_ars_{coin}_{k}_mostrador_compra_15hs'
-            ] = ''
-            parsed[
-                f'tc_ars_{coin}_{k}_electronico_compra_11hs'
-            ] = ''
-            parsed[
-                f'tc_ars_{coin}_{k}_electronico_compra_13hs'
-            ] = ''
-            parsed[
-                f'tc_ars_{coin}_{k}_electronico_compra_15hs'
-            ] = ''
-            parsed[
-                f'tc_ars_{coin}_{k}_mostrador_venta_11hs'
-            ] = ''
-            parsed[
-                f'tc_ars_{coin}_{k}_mostrador_venta_13hs'
-            ] = ''
-            parsed[
-                f'tc_ars_{coin}_{k}_mostrador_venta_15hs'
-            ] = ''
-            parsed[
-                f'tc_ars_{coin}_{k}_electronico_venta_11hs'
-            ] = ''
-            parsed[
-                f'tc_ars_{coin}_{k}_electronico_venta_13hs'
-            ] = ''
-            parsed[
-                f'tc_ars_{coin}_{k}_electronico_venta_15hs'
-            ] = ''
-        return parsed
+        """
+        Retorna el registro vacío del día para la moneda, con la fecha y
+        un string vacío en cada columna habilitada. Los registros de la
+        moneda comparten el esquema con el orden de las columnas.
+        """
+        if not entities:
+            return {}
+        columns = self.get_schema(entities).get_columns(coin)
+        return Record(
+            get_record_schema(['indice_tiempo'] + columns),
+            [day] + [''] * len(columns)
+        )
 
     def _preprocess_rows(self, parsed):
         parsed['dolar'] = self.preprocess_rows(
@@ -570,35 +560,15 @@ class BCRATCEScraper(BCRAScraper):
         ----------
         rows : list
         """
-        preprocessed_rows = []
-
-        for row in rows:
-            preprocessed_row = {}
-
-            for k in row.keys():
-                if k == 'indice_tiempo':
-                    if type(row[k]) == str:
-                        if '/' in row[k]:
-                            _ = row[k].split('/')
-                            preprocessed_date = date.fromisoformat(
-                                '-'.join([_[2], _[1], _[0]])
-                            )
-                        else:
-                            preprocessed_date = row[k]
-                    else:
-                        preprocessed_date = row[k]
-                    preprocessed_row['indice_tiempo'] = preprocessed_date
-                else:
-                    if row[k] == '':
-                        preprocessed_row[k] = None
-                    else:
-                        preprocessed_row[k] = (
-                            Decimal((row[k]).replace(',', '.'))
-                            if isinstance(row[k], str)
-                            else row[k]
-                        )
-
-            preprocessed_rows.append(preprocessed_row)
+        preprocessed_rows = normalize_rows(rows, skip=('indice_tiempo',))
+
+        for preprocessed_row in preprocessed_rows:
+            if type(preprocessed_row.get('indice_tiempo')) == str:
+                if '/' in preprocessed_row['indice_tiempo']:
+                    _ = preprocessed_row['indice_tiempo'].split('/')
+                    preprocessed_row['indice_tiempo'] = date.fromisoformat(
+                        '-'.join([_[2], _[1], _[0]])
+                    )
 
         return preprocessed_rows
 
@@ -0,0 +1,75 @@
+from concurrent.futures import Future
+import threading
+
+
+class SingleFlight:
+    """
+    Agrupa los pedidos concurrentes de una misma clave: el primero hace
+    el trabajo y los demás esperan y reciben el mismo resultado. Los
+    resultados que cumplen `keep` se recuerdan, de modo que los pedidos
+    posteriores de la misma clave no vuelven a hacer el trabajo.
+
+    Attributes
+    ----------
+    keep : Callable
+        Función que recibe un resultado e indica si se debe recordar
+    """
+
+    def __init__(self, keep=None):
+        self.keep = keep or (lambda result: True)
+        self.calls = {}
+        self.results = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, fn):
+        """
+        Retorna el resultado de fn para la clave. Si ya hay un pedido en
+        curso para la clave espera su resultado en lugar de llamar a fn.
+        Si fn lanza una excepción, la reciben todos los que esperaban.
+
+        Parameters
+        ----------
+        key : Hashable
+            Clave que identifica el trabajo
+        fn : Callable
+            Función sin parámetros que hace el trabajo
+        """
+        with self.lock:
+            if key in self.results:
+                return self.results[key]
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self.lock:
+                del self.calls[key]
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            del self.calls[key]
+            if self.keep(result):
+                self.results[key] = result
+        future.set_result(result)
+        return result
+
+    def forget(self, key):
+        """
+        Olvida el resultado recordado de la clave, si lo hay.
+        """
+        with self.lock:
+            self.results.pop(key, None)
+
+    def clear(self):
+        """
+        Olvida los resultados recordados.
+        """
+        with self.lock:
+            self.results.clear()
@@ -0,0 +1,248 @@
+from html.parser import HTMLParser
+
+
+VOID_TAGS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link',
+    'meta', 'param', 'source', 'track', 'wbr',
+}
+
+CHUNK_SIZE = 64 * 1024
+
+ASCII_SPACES = str.maketrans('', '', '\x20\x0a\x09\x0c\x0d')
+
+
+def collapse_whitespace(text):
+    """
+    Reduce un texto formado solo por espacios a un salto de línea, si lo
+    contiene, o a un espacio, igual que BeautifulSoup al armar el árbol.
+    Los demás textos se retornan sin cambios.
+
+    Parameters
+    ----------
+    text : str
+        Texto de un nodo
+    """
+    if not text or text.translate(ASCII_SPACES):
+        return text
+    return '\n' if '\n' in text else ' '
+
+
+class Cell:
+    """
+    Celda de una fila de la tabla, con los textos y nodos que contiene.
+
+    Attributes
+    ----------
+    tag : str
+        Etiqueta de la celda, 'td' o 'th'
+    children : list
+        Hijos de la celda: strings para los textos y listas con sus
+        propios hijos para las etiquetas
+    """
+
+    def __init__(self, tag):
+        self.tag = tag
+        self.children = []
+
+    @property
+    def text(self):
+        """
+        Texto de la celda y de todos sus descendientes.
+        """
+        return ''.join(_iter_strings(self.children))
+
+    @property
+    def string(self):
+        """
+        Texto de la celda si tiene un único texto, o None si no tiene
+        texto o tiene varios hijos, igual que el atributo string de
+        BeautifulSoup.
+        """
+        children = self.children
+        while len(children) == 1:
+            if isinstance(children[0], str):
+                return collapse_whitespace(children[0])
+            children = children[0]
+        return None
+
+
+def _iter_strings(children):
+    for child in children:
+        if isinstance(child, str):
+            yield collapse_whitespace(child)
+        else:
+            yield from _iter_strings(child)
+
+
+class TableStream(HTMLParser):
+    """
+    Extractor incremental de las filas de la primera tabla de un
+    documento. Recibe el html por partes con feed y, sin armar el árbol
+    del documento, acumula cada fila del primer thead y del primer tbody
+    de la tabla a medida que se cierra. Las tablas anidadas se ignoran.
+
+    Attributes
+    ----------
+    rows : list
+        Filas cerradas que todavía no se retiraron con pop_rows, como
+        tuplas con la sección ('thead' o 'tbody') y la lista de celdas
+    sections : Dict
+        Secciones encontradas en la tabla, con True como valor si tienen
+        algún contenido
+    done : bool
+        Indica si la tabla ya se cerró
+    """
+
+    def __init__(self):
+        super(TableStream, self).__init__(convert_charrefs=True)
+        self.rows = []
+        self.sections = {}
+        self.done = False
+        self.table_depth = 0
+        self.section = None
+        self.row = None
+        self.cell = None
+        self.nodes = []
+
+    def iter_rows(self, content, chunk_size=CHUNK_SIZE):
+        """
+        Generador que parsea el html de a partes y entrega las filas de
+        la tabla, como tuplas con la sección y la lista de celdas, a
+        medida que se cierran. Si quien lo consume deja de pedir filas,
+        el resto del documento no se parsea.
+
+        Parameters
+        ----------
+        content : str o Iterable
+            Html del documento, o sus partes a medida que se leen
+        chunk_size : int
+            Tamaño de las partes en que se divide un html recibido completo
+        """
+        chunks = content
+        if isinstance(content, str):
+            chunks = (content[i:i + chunk_size] for i in range(0, len(content), chunk_size))
+        for chunk in chunks:
+            self.feed(chunk)
+            yield from self.pop_rows()
+            if self.done:
+                return
+        self.close()
+        self._close_row()
+        yield from self.pop_rows()
+
+    def pop_rows(self):
+        """
+        Retorna las filas cerradas desde la última llamada.
+        """
+        rows, self.rows = self.rows, []
+        return rows
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == 'table':
+            self.table_depth += 1
+            return
+        if self.table_depth != 1:
+            return
+        if self.cell is not None and tag not in ('td', 'th', 'tr'):
+            node = []
+            self.nodes[-1].append(node)
+            if tag not in VOID_TAGS:
+                self.nodes.append(node)
+            return
+        if self.section is not None:
+            self.sections[self.section] = True
+        if tag in ('thead', 'tbody'):
+            self._close_row()
+            self.section = tag if tag not in self.sections else None
+            if self.section:
+                self.sections[tag] = False
+        elif tag == 'tr' and self.section:
+            self._close_row()
+            self.row = []
+        elif tag in ('td', 'th') and self.row is not None:
+            self._close_cell()
+            self.cell = Cell(tag)
+            self.nodes = [self.cell.children]
+
+    def handle_endtag(self, tag):
+        if self.done or self.table_depth == 0:
+            return
+        if tag == 'table':
+            self.table_depth -= 1
+            if self.table_depth == 0:
+                self._close_row()
+                self.section = None
+                self.done = True
+            return
+        if self.table_depth != 1:
+            return
+        if tag in ('td', 'th'):
+            self._close_cell()
+        elif tag == 'tr':
+            self._close_row()
+        elif tag in ('thead', 'tbody'):
+            self._close_row()
+            self.section = None
+        elif self.cell is not None and len(self.nodes) > 1 and tag not in VOID_TAGS:
+            self.nodes.pop()
+
+    def handle_data(self, data):
+        if self.done or self.table_depth != 1:
+            return
+        if self.section is not None:
+            self.sections[self.section] = True
+        if self.cell is None:
+            return
+        children = self.nodes[-1]
+        if children and isinstance(children[-1], str):
+            children[-1] += data
+        else:
+            children.append(data)
+
+    def _close_cell(self):
+        if self.cell is not None:
+            self.row.append(self.cell)
+            self.cell = None
+            self.nodes = []
+
+    def _close_row(self):
+        self._close_cell()
+        if self.row is not None:
+            self.rows.append((self.section, self.row))
+            self.row = None
+
+
+def iter_window_rows(dated_rows, date_window=None):
+    """
+    Generador que recibe tuplas (fecha, celdas) en orden de fecha y
+    entrega las que están dentro de la ventana de fechas. El orden,
+    ascendente o descendente, se toma de las dos primeras fechas
+    distintas, y al pasar el final de la ventana deja de leer filas.
+
+    Parameters
+    ----------
+    dated_rows : Iterable
+        Tuplas (fecha, celdas)
+    date_window : tuple
+        Fechas de inicio y de fin, inclusive. None si se leen todas las
+        filas
+    """
+    if date_window is None:
+        yield from dated_rows
+        return
+
+    start_date, end_date = date_window
+    first_date, ascending = None, None
+    for row_date, cells in dated_rows:
+        if first_date is None:
+            first_date = row_date
+        elif ascending is None and row_date != first_date:
+            ascending = row_date > first_date
+        if ascending is not None and (
+            (ascending and row_date > end_date) or (not ascending and row_date < start_date)
+        ):
+            return
+        if start_date <= row_date <= end_date:
+            yield row_date, cells
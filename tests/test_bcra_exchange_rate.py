@@ -4,8 +4,10 @@ from unittest import mock
 from unittest.mock import patch, MagicMock
 from decimal import Decimal
 
+import glob
 import io
 import json
+import os
 import pandas as pd
 
 from bs4 import BeautifulSoup
@@ -17,10 +19,15 @@ from bcra_scraper.bcra_scraper import validate_coins_key_config
 from bcra_scraper.bcra_scraper import validate_coins_key_has_values
 from bcra_scraper.exceptions import InvalidConfigurationError
 from bcra_scraper.bcra_scraper import read_config
+from bcra_scraper.cache import ExtractedDocument
+from bcra_scraper.rate_limiter import reset_rate_limiters
 
 
 class BcraExchangeRateTestCase(unittest.TestCase):
 
+    def setUp(self):
+        reset_rate_limiters()
+
     def test_html_is_valid(self):
         """Probar que el html sea valido"""
         url = ""
@@ -215,6 +222,69 @@ class BcraExchangeRateTestCase(unittest.TestCase):
             }
         ]
 
+    def test_parse_coin_from_history_index(self):
+        """Probar que la página de una moneda se parsee una sola vez para todas las fechas"""
+        url = ''
+        coins = {
+            "bolivar_venezolano": "Bolívar Venezolano"
+        }
+        content = '''
+        <table>
+            <thead><tr><td>FECHA</td><td>TIPO DE PASE</td><td>TIPO DE CAMBIO</td></tr></thead>
+            <tbody>
+            <tr>
+                <td>
+                08/04/2019</td>
+                <td>
+                0,0003030</td>
+                <td>
+                0,0132500</td>
+            </tr>
+            <tr>
+                <td>
+                09/04/2019</td>
+                <td>
+                0,0003040</td>
+                <td>
+                0,0132600</td>
+            </tr>
+            </tbody>
+        </table>
+        '''
+        scraper = BCRAExchangeRateScraper(url, coins, intermediate_panel_path=None)
+
+        with patch.object(
+            scraper,
+            'parse_coin_history',
+            wraps=scraper.parse_coin_history
+        ) as mocked_parse_coin_history:
+            parsed = [
+                scraper.parse_coin(content, single_date, 'bolivar_venezolano')
+                for single_date in [date(2019, 4, 8), date(2019, 4, 9), date(2019, 4, 10)]
+            ]
+
+        assert mocked_parse_coin_history.call_count == 1
+        assert parsed == [
+            {
+                'moneda': 'bolivar_venezolano',
+                'indice_tiempo': date(2019, 4, 8),
+                'tp_usd': '0,0003030',
+                'tc_local': '0,0132500'
+            },
+            {
+                'moneda': 'bolivar_venezolano',
+                'indice_tiempo': date(2019, 4, 9),
+                'tp_usd': '0,0003040',
+                'tc_local': '0,0132600'
+            },
+            {
+                'moneda': 'bolivar_venezolano',
+                'indice_tiempo': date(2019, 4, 10),
+                'tp_usd': '',
+                'tc_local': ''
+            },
+        ]
+
     def test_not_body_parse_coin(self):
         url = \
          "http://www.bcra.gov.ar/Publicaciones\
@@ -306,24 +376,117 @@ class BcraExchangeRateTestCase(unittest.TestCase):
 
     def test_fetch_contents(self):
 
+        coins = {
+            "bolivar_venezolano": "Bolívar Venezolano",
+            "dolar_estadounidense": "Dolar Estadounidense"
+        }
+        start_date = date(2019, 4, 22)
+        end_date = date(2019, 4, 24)
+        url = ''
+        with patch.object(
+            BCRAExchangeRateScraper,
+            'fetch_content',
+            side_effect=lambda start_date, coin: f'{coin} {start_date}'
+        ) as mocked_fetch_content:
+            scraper = BCRAExchangeRateScraper(url, coins, intermediate_panel_path=None, use_intermediate_panel=False)
+            scraper.available_dates = '19/04/2019 22/04/2019 23/04/2019 24/04/2019'
+            result = scraper.fetch_contents(start_date, end_date, {'tc_local': {}, 'tp_usd': {}}, {})
+
+        assert mocked_fetch_content.call_count == 2
+        day_contents = {
+            'bolivar_venezolano': 'Bolívar Venezolano 2019-04-22',
+            'dolar_estadounidense': 'Dolar Estadounidense 2019-04-22'
+        }
+        assert result == {
+            'tc_local': {single_date: day_contents for single_date in [
+                date(2019, 4, 22), date(2019, 4, 23), date(2019, 4, 24)
+            ]},
+            'tp_usd': {single_date: day_contents for single_date in [
+                date(2019, 4, 22), date(2019, 4, 23), date(2019, 4, 24)
+            ]},
+        }
+
+    def test_fetch_contents_from_last_available_date(self):
+        """Probar que la página se pida desde la última fecha disponible anterior a la primera que falta"""
         coins = {
             "bolivar_venezolano": "Bolívar Venezolano"
         }
-        start_date = datetime(2019, 4, 24)
-        end_date = datetime(2019, 4, 24)
         url = ''
-        content = 'foo'
         with patch.object(
             BCRAExchangeRateScraper,
             'fetch_content',
-            return_value=content
-        ):
+            return_value='foo'
+        ) as mocked_fetch_content:
             scraper = BCRAExchangeRateScraper(url, coins, intermediate_panel_path=None, use_intermediate_panel=False)
-            result = scraper.fetch_contents(start_date, end_date)
+            scraper.available_dates = '19/04/2019 22/04/2019'
+            scraper.fetch_contents(date(2019, 4, 21), date(2019, 4, 22), {'tc_local': {}, 'tp_usd': {}}, {})
 
-            assert result == {
-                'bolivar_venezolano': 'foo',
-            }
+        mocked_fetch_content.assert_called_once_with(date(2019, 4, 19), 'Bolívar Venezolano')
+
+    def test_refetch_reuses_coin_history(self):
+        """Probar que el refetch use la página de la moneda pedida en el primer ciclo"""
+        coins = {
+            "bolivar_venezolano": "Bolívar Venezolano"
+        }
+        url = 'http://www.bcra.gov.ar/PublicacionesEstadisticas/Evolucion_moneda.asp'
+        with patch.object(
+            BCRAExchangeRateScraper,
+            'submit_form',
+            return_value='foo'
+        ) as mocked_submit_form:
+            scraper = BCRAExchangeRateScraper(url, coins, intermediate_panel_path=None, transport='http')
+            contents = scraper.fetch_contents(date(2019, 4, 1), date(2019, 4, 10), {'tc_local': {}, 'tp_usd': {}}, {})
+            scraper.fetch_contents(date(2019, 4, 5), date(2019, 4, 15), {'tc_local': {}, 'tp_usd': {}}, contents)
+
+        assert mocked_submit_form.call_count == 1
+
+    def test_streaming_keeps_rows_of_coin_history_instead_of_html(self):
+        """Probar que la página reutilizada de cada moneda se retenga como filas y no como html"""
+        coins = {
+            "dolar_estadounidense": "Dólar Estadounidense"
+        }
+        url = 'http://www.bcra.gov.ar/PublicacionesEstadisticas/Evolucion_moneda.asp'
+        page = os.path.join(os.path.dirname(__file__), 'pages', 'exchange-rates', 'dolar_estadounidense.html')
+        with open(page, encoding='utf-8', newline='') as page_file:
+            html = page_file.read()
+
+        with patch.object(
+            BCRAExchangeRateScraper,
+            'submit_form',
+            return_value=html
+        ) as mocked_submit_form:
+            scraper = BCRAExchangeRateScraper(url, coins, intermediate_panel_path=None, transport='http')
+            with scraper.streaming_pass():
+                contents = scraper.fetch_contents(date(2019, 4, 1), date(2019, 4, 10), {'tc_local': {}, 'tp_usd': {}}, {})
+                scraper.fetch_contents(date(2019, 4, 5), date(2019, 4, 15), {'tc_local': {}, 'tp_usd': {}}, contents)
+
+        assert mocked_submit_form.call_count == 1
+        kept = list(scraper.single_flight.results.values())
+        assert len(kept) == 1
+        assert isinstance(kept[0][0], ExtractedDocument)
+        assert kept[0][0].rows
+        assert contents['tc_local'][date(2019, 4, 1)]['dolar_estadounidense'] is kept[0][0]
+
+    def test_run_does_not_reuse_coin_history_of_previous_run(self):
+        """Probar que una nueva ejecución pida la página de la moneda desde sus propias fechas"""
+        coins = {
+            "bolivar_venezolano": "Bolívar Venezolano"
+        }
+        url = 'http://www.bcra.gov.ar/PublicacionesEstadisticas/Evolucion_moneda.asp'
+        scraper = BCRAExchangeRateScraper(
+            url, coins, intermediate_panel_path=None, transport='http', skip_clean_last_dates=True
+        )
+        with patch.object(scraper, 'preprocess_start_date', side_effect=lambda start_date, end_date: start_date), \
+                patch.object(scraper, 'parse_from_intermediate_panel', return_value={'tc_local': {}, 'tp_usd': {}}), \
+                patch.object(scraper, 'save_intermediate_panel'), \
+                patch.object(scraper, 'parse_contents', return_value=({}, {})), \
+                patch.object(scraper, 'fetch_content', return_value='foo') as mocked_fetch_content:
+            scraper.run(date(2019, 4, 1), date(2019, 4, 10), [])
+            scraper.run(date(2019, 5, 1), date(2019, 5, 10), [])
+
+        assert [call[0][0] for call in mocked_fetch_content.call_args_list] == [
+            date(2019, 4, 1), date(2019, 5, 1)
+        ]
 
     def test_parse_contents(self):
         url = ''
@@ -415,6 +578,33 @@ class BcraExchangeRateTestCase(unittest.TestCase):
                 }
             ]
 
+    def test_preprocessed_rows_of_many_days_match_single_rows(self):
+        """Probar que convertir juntas las filas de varias fechas dé lo mismo que convertirlas de a una"""
+        values = ['0,0003040', '--------', '1.289,6300000', '', '38,5', '0,0003040']
+        rows = [
+            {
+                'moneda': 'dolar_estadounidense',
+                'indice_tiempo': f'{day:02d}/04/2019',
+                'tc_local': values[day % len(values)],
+                'tp_usd': values[(day + 1) % len(values)],
+            }
+            for day in range(1, 13)
+        ]
+        scraper = BCRAExchangeRateScraper(False, rows, intermediate_panel_path=None, use_intermediate_panel=False)
+
+        result = scraper.preprocess_rows(rows)
+
+        assert result == [scraper.preprocess_rows([row])[0] for row in rows]
+        assert [list(row) for row in result] == [list(row) for row in rows]
+        assert result[0] == {
+            'moneda': 'dolar_estadounidense',
+            'indice_tiempo': date(2019, 4, 1),
+            'tc_local': None,
+            'tp_usd': Decimal('1289.6300000'),
+        }
+        assert result[2]['tc_local'] == ''
+        assert result[2]['tp_usd'] == Decimal('38.5')
+
     def test_exchange_rates_configuration_has_url(self):
         """Validar la existencia de la clave url dentro de
         la configuración de exchange-rates"""
@@ -713,3 +903,77 @@ class BcraExchangeRateTestCase(unittest.TestCase):
         result = scraper.get_intermediate_panel_data_from_parsed(parsed)
 
         assert result == []
+
+    def test_parse_coin_history_with_lxml_matches_html_parser(self):
+        """Probar que lxml extraiga los mismos valores que html.parser en las páginas guardadas"""
+        coins = {'dolar_estadounidense': 'Dólar Estadounidense', 'euro': 'Euro'}
+        scrapers = [
+            BCRAExchangeRateScraper('', coins, intermediate_panel_path=None, html_parser=html_parser)
+            for html_parser in ['html.parser', 'lxml']
+        ]
+        pages = glob.glob(os.path.join(os.path.dirname(__file__), 'pages', 'exchange-rates', '*.html'))
+
+        assert pages
+        for page in pages:
+            with open(page, encoding='utf-8', newline='') as page_file:
+                content = page_file.read()
+            results = [scraper.parse_coin_history(content) for scraper in scrapers]
+            assert results[0] == results[1], page
+
+    def test_parse_coin_history_with_stream_matches_html_parser(self):
+        """Probar que el extractor incremental extraiga los mismos valores que html.parser en las páginas guardadas"""
+        coins = {'dolar_estadounidense': 'Dólar Estadounidense', 'euro': 'Euro'}
+        scrapers = [
+            BCRAExchangeRateScraper('', coins, intermediate_panel_path=None, stream_tables=stream_tables)
+            for stream_tables in [False, True]
+        ]
+        pages = glob.glob(os.path.join(os.path.dirname(__file__), 'pages', 'exchange-rates', '*.html'))
+
+        assert pages
+        for page in pages:
+            with open(page, encoding='utf-8', newline='') as page_file:
+                content = page_file.read()
+            results = [scraper.parse_coin_history(content) for scraper in scrapers]
+            assert results[0] == results[1], page
+
+
+    def test_parse_coin_history_from_page_without_closing_tags(self):
+        """Probar que html.parser, lxml y el extractor incremental extraigan los mismos valores de una página con celdas sin cerrar"""
+        coins = {'euro': 'Euro'}
+        page = os.path.join(os.path.dirname(__file__), 'pages', 'exchange-rates', 'euro_sin_cierres.html')
+        with open(page, encoding='utf-8', newline='') as page_file:
+            content = page_file.read()
+        scrapers = [
+            BCRAExchangeRateScraper('', coins, intermediate_panel_path=None, html_parser=html_parser)
+            for html_parser in ['html.parser', 'lxml']
+        ] + [
+            BCRAExchangeRateScraper('', coins, intermediate_panel_path=None, stream_tables=True)
+        ]
+
+        for scraper in scrapers:
+            assert scraper.parse_coin_history(content) == {
+                date(2019, 4, 1): ('1,1228000', '48,6742000'),
+                date(2019, 4, 2): ('1,1212000', '48,7731000'),
+                date(2019, 4, 3): ('1,1233000', '48,4167000'),
+                date(2019, 4, 4): ('1,1224000', '48,5093000')
+            }
+
+    def test_parse_coin_history_with_stream_in_date_window(self):
+        """Probar que el extractor incremental solo guarde las fechas de la ejecución"""
+        coins = {'dolar_estadounidense': 'Dólar Estadounidense'}
+        scraper = BCRAExchangeRateScraper('', coins, intermediate_panel_path=None, stream_tables=True)
+        scraper.date_window = (date(2019, 4, 3), date(2019, 4, 5))
+        page = os.path.join(os.path.dirname(__file__), 'pages', 'exchange-rates', 'dolar_estadounidense.html')
+        with open(page, encoding='utf-8', newline='') as page_file:
+            content = page_file.read()
+
+        history = scraper.parse_coin_history(content)
+        complete_history = BCRAExchangeRateScraper(
+            '', coins, intermediate_panel_path=None
+        ).parse_coin_history(content)
+
+        assert history
+        assert history == {
+            day: values for day, values in complete_history.items()
+            if date(2019, 4, 3) <= day <= date(2019, 4, 5)
+        }
@@ -1,10 +1,15 @@
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 import unittest
 from unittest.mock import patch, MagicMock
 from unittest import mock
+import glob
 import io
 import json
+import os
+import tempfile
+import threading
+import time
 import pandas as pd
 
 from bs4 import BeautifulSoup
@@ -15,12 +20,29 @@ from bcra_scraper.bcra_scraper import validate_url_config
 from bcra_scraper.bcra_scraper import validate_url_has_value
 from bcra_scraper.bcra_scraper import validate_libor_rates_config
 from bcra_scraper.bcra_scraper import validate_libor_rates_has_values
-from bcra_scraper.exceptions import InvalidConfigurationError
+from bcra_scraper.exceptions import InvalidConfigurationError, SiteUnavailableError
 from bcra_scraper.bcra_scraper import read_config
+from bcra_scraper.bcra_scraper import get_bool_config
+from bcra_scraper.bcra_scraper import get_scraper_options
+from bcra_scraper.scraper_base import HTMLForm
+from bcra_scraper.cache import ExtractedDocument
+from bcra_scraper.parse_pool import ParsePool
+from bcra_scraper.rate_limiter import AdaptiveRateLimiter, get_rate_limiter
+from bcra_scraper.retry import RetryPolicy
+from bcra_scraper.rate_limiter import reset_rate_limiters
+from requests.exceptions import ConnectionError
+
+
+def sleep_and_extract(context, content):
+    time.sleep(0.2)
+    return content
 
 
 class BcraLiborScraperTestCase(unittest.TestCase):
 
+    def setUp(self):
+        reset_rate_limiters()
+
     def test_get_last_business_day(self):
         """probar que la fecha obtenida sea correcta"""
         assert date(2019, 3, 15) == get_most_recent_previous_business_day(
@@ -622,6 +644,28 @@ class BcraLiborScraperTestCase(unittest.TestCase):
                 config = read_config("config_general.json", "libor")
                 validate_url_has_value(config)
 
+    def test_bool_config_values(self):
+        """Validar que las opciones booleanas solo acepten true o false"""
+        config = {'fixed_point': 'false', 'stream_tables': True, 'foo': 'no'}
+
+        assert get_bool_config(config, 'fixed_point') is False
+        assert get_bool_config(config, 'stream_tables') is True
+        assert get_bool_config(config, 'bar') is False
+        with self.assertRaises(InvalidConfigurationError):
+            get_bool_config(config, 'foo')
+        with self.assertRaises(InvalidConfigurationError):
+            get_bool_config({'fixed_point': 1}, 'fixed_point')
+
+    def test_scraper_options_from_config(self):
+        """Validar que las opciones comunes de los scrapers se lean de la configuración"""
+        options = get_scraper_options({'tries': '3', 'pool_size': 2, 'fixed_point': 'true'})
+
+        assert options['timeout'] is None
+        assert options['tries'] == 3
+        assert options['concurrency'] == 2
+        assert options['fixed_point'] is True
+        BCRALiborScraper('', {}, intermediate_panel_path=None, **options)
+
     def test_libor_configuration_has_rates(self):
         """Validar la existencia de la clave rates dentro de
         la configuración de libor"""
@@ -686,6 +730,297 @@ class BcraLiborScraperTestCase(unittest.TestCase):
             content = scraper.fetch_day_content(single_date)
             assert content['content'] == 400
 
+    def test_fetch_day_content_using_http_transport(self):
+        """Probar fetch day content enviando el formulario por HTTP"""
+        single_date = date(2019, 3, 4)
+        rates = {}
+        url = 'http://www.bcra.gov.ar/PublicacionesEstadisticas/libor.asp'
+
+        with patch.object(
+            BCRALiborScraper,
+            'submit_form',
+            return_value='foo'
+        ) as mocked_submit_form:
+            scraper = BCRALiborScraper(url, rates, intermediate_panel_path=None, transport='http')
+            content = scraper.fetch_day_content(single_date)
+
+            assert content == 'foo'
+            mocked_submit_form.assert_called_once_with({'fecha': '04/03/2019'})
+
+    def test_fetch_contents_with_bounded_concurrency(self):
+        """Probar que no haya más descargas en curso que el límite de concurrencia"""
+        rates = {}
+        url = ''
+        lock = threading.Lock()
+        in_flight = []
+        max_in_flight = []
+
+        def fetch_day_content(single_date):
+            with lock:
+                in_flight.append(single_date)
+                max_in_flight.append(len(in_flight))
+            time.sleep(0.01)
+            with lock:
+                in_flight.remove(single_date)
+            return f'{single_date}'
+
+        with patch.object(
+            BCRALiborScraper,
+            'fetch_day_content',
+            side_effect=fetch_day_content
+        ):
+            scraper = BCRALiborScraper(url, rates, intermediate_panel_path=None, transport='http', concurrency=3)
+            contents = scraper.fetch_contents(date(2019, 3, 1), date(2019, 3, 10), {}, {})
+
+        assert len(contents) == 10
+        assert contents[date(2019, 3, 4)] == '2019-03-04'
+        assert max(max_in_flight) <= 3
+
+    def test_rate_limiter_adjusts_concurrency(self):
+        """Probar que la concurrencia aumente de a uno y se reduzca a la mitad ante errores"""
+        rate_limiter = AdaptiveRateLimiter(requests_per_second=1000, max_concurrency=4)
+
+        for _ in range(6):
+            rate_limiter.release(rate_limiter.acquire())
+        assert rate_limiter.limit == 4
+
+        rate_limiter.release(rate_limiter.acquire(), overloaded=True)
+        assert rate_limiter.limit == 2
+
+    def test_rate_limiter_shared_by_host_and_parameters(self):
+        """Probar que los scrapers solo compartan el limitador si tienen los mismos parámetros"""
+        url = 'http://www.bcra.gov.ar/PublicacionesEstadisticas/libor.asp'
+        scrapers = [
+            BCRALiborScraper(url, {}, intermediate_panel_path=None, transport='http', requests_per_second=rps)
+            for rps in [5, 5, 20]
+        ]
+        rate_limiters = [scraper.get_rate_limiter() for scraper in scrapers]
+
+        assert rate_limiters[0] is rate_limiters[1]
+        assert rate_limiters[2] is not rate_limiters[0]
+        assert rate_limiters[2].bucket.rate == 20
+
+        reset_rate_limiters()
+        assert get_rate_limiter(url, requests_per_second=5, max_concurrency=1) is not rate_limiters[0]
+
+    def test_fetch_day_content_retries_with_backoff(self):
+        """Probar que los errores de conexión se reintenten esperando entre intentos"""
+        single_date = date(2019, 3, 4)
+        rates = {}
+        url = 'http://www.bcra.gov.ar/PublicacionesEstadisticas/libor.asp'
+
+        with patch.object(
+            BCRALiborScraper,
+            'submit_form',
+            side_effect=[ConnectionError(), ConnectionError(), 'foo']
+        ), patch.object(
+            RetryPolicy,
+            'get_delay',
+            return_value=0
+        ) as mocked_get_delay:
+            scraper = BCRALiborScraper(url, rates, intermediate_panel_path=None, transport='http', tries=3, backoff=2)
+            content = scraper.fetch_day_content(single_date)
+
+        assert content == 'foo'
+        assert [call[0][0] for call in mocked_get_delay.call_args_list] == [1, 2]
+        assert all(0 <= scraper.retry_policy.get_delay(2) <= 4 for _ in range(10))
+
+    def test_circuit_breaker_stops_execution(self):
+        """Probar que se interrumpa la ejecución si el sitio no responde"""
+        rates = {}
+        url = 'http://www.bcra.gov.ar/PublicacionesEstadisticas/libor.asp'
+
+        with patch.object(
+            BCRALiborScraper,
+            'submit_form',
+            side_effect=ConnectionError()
+        ) as mocked_submit_form:
+            scraper = BCRALiborScraper(url, rates, intermediate_panel_path=None, transport='http', failure_threshold=3)
+            with self.assertRaises(SiteUnavailableError):
+                scraper.fetch_contents(date(2019, 3, 1), date(2019, 3, 10), {}, {})
+
+        assert mocked_submit_form.call_count == 3
+
+        with patch.object(
+            BCRALiborScraper,
+            'submit_form',
+            return_value=''
+        ) as mocked_submit_form, \
+                patch.object(scraper, 'parse_from_intermediate_panel', return_value={}), \
+                patch.object(scraper, 'save_intermediate_panel'):
+            scraper.run(date(2019, 3, 1), date(2019, 3, 10), [])
+
+        assert mocked_submit_form.call_count > 0
+        assert not scraper.retry_policy.circuit_breaker.is_open
+
+        scraper.retry_policy.circuit_breaker.failures = 2
+        with scraper.deferred_pass():
+            assert scraper.retry_policy.circuit_breaker.failures == 0
+
+    def test_fetch_contents_retries_failed_dates_at_the_end(self):
+        """Probar que las fechas que agotaron sus intentos se reintenten al final con otra sesión"""
+        rates = {}
+        url = 'http://www.bcra.gov.ar/PublicacionesEstadisticas/libor.asp'
+        failed = []
+
+        def submit_form(values):
+            if values['fecha'] == '04/03/2019' and not failed:
+                failed.append(values['fecha'])
+                raise ConnectionError()
+            return values['fecha']
+
+        with patch.object(
+            BCRALiborScraper,
+            'submit_form',
+            side_effect=submit_form
+        ) as mocked_submit_form:
+            scraper = BCRALiborScraper(url, rates, intermediate_panel_path=None, transport='http', timeout=10)
+            http_transport = scraper.get_http_transport()
+            contents = scraper.fetch_contents(date(2019, 3, 1), date(2019, 3, 5), {}, {})
+
+        assert contents[date(2019, 3, 4)] == '04/03/2019'
+        assert mocked_submit_form.call_count == 6
+        assert scraper.deferred_tasks == []
+        assert scraper.get_http_transport() is not http_transport
+        assert scraper.timeout == 10
+
+    def test_deferred_tasks_are_retried_only_once(self):
+        """Probar que al final de la ejecución cada fecha fallida se intente una sola vez más"""
+        rates = {}
+        url = 'http://www.bcra.gov.ar/PublicacionesEstadisticas/libor.asp'
+        attempts = []
+
+        def submit_form(values):
+            attempts.append(values['fecha'])
+            if values['fecha'] == '04/03/2019':
+                raise ConnectionError()
+            return values['fecha']
+
+        with patch.object(
+            BCRALiborScraper,
+            'submit_form',
+            side_effect=submit_form
+        ), patch.object(RetryPolicy, 'get_delay', return_value=0):
+            scraper = BCRALiborScraper(url, rates, intermediate_panel_path=None, transport='http', tries=3)
+            retry_policy = scraper.retry_policy
+            contents = scraper.fetch_contents(date(2019, 3, 1), date(2019, 3, 5), {}, {})
+
+        assert contents[date(2019, 3, 4)] == ''
+        assert attempts.count('04/03/2019') == 4
+        assert scraper.retry_policy is retry_policy
+
+    def test_fetch_day_content_from_cache(self):
+        """Probar que las páginas de fechas viejas se lean del cache y la del día se vuelva a pedir"""
+        rates = {}
+        url = 'http://www.bcra.gov.ar/PublicacionesEstadisticas/libor.asp'
+
+        with tempfile.TemporaryDirectory() as cache_path, patch.object(
+            BCRALiborScraper,
+            'submit_form',
+            return_value='foo'
+        ) as mocked_submit_form:
+            scraper = BCRALiborScraper(url, rates, intermediate_panel_path=None, transport='http', cache_path=cache_path)
+
+            assert scraper.fetch_day_content(date(2019, 3, 4)) == 'foo'
+            scraper.single_flight.clear()
+            assert scraper.fetch_day_content(date(2019, 3, 4)) == 'foo'
+            assert mocked_submit_form.call_count == 1
+
+            scraper.fetch_day_content(date.today())
+            scraper.single_flight.clear()
+            scraper.fetch_day_content(date.today())
+            assert mocked_submit_form.call_count == 3
+
+    def test_fetch_day_content_stored_on_its_date_expires(self):
+        """Probar que la página guardada el mismo día de su fecha se vuelva a pedir aunque la fecha ya sea vieja"""
+        rates = {}
+        url = 'http://www.bcra.gov.ar/PublicacionesEstadisticas/libor.asp'
+        today = datetime.combine(date.today(), datetime.min.time())
+
+        def store_on(cache_path, stored_at):
+            for file_path in glob.glob(os.path.join(cache_path, '*', '*.html.gz')):
+                os.utime(file_path, (stored_at.timestamp(), stored_at.timestamp()))
+
+        with tempfile.TemporaryDirectory() as cache_path, patch.object(
+            BCRALiborScraper,
+            'submit_form',
+            return_value='foo'
+        ) as mocked_submit_form:
+            scraper = BCRALiborScraper(url, rates, intermediate_panel_path=None, transport='http', cache_path=cache_path)
+            old_date = date.today() - timedelta(days=30)
+            yesterday = date.today() - timedelta(days=1)
+
+            scraper.fetch_day_content(old_date)
+            store_on(cache_path, today - timedelta(days=30) + timedelta(hours=20))
+            scraper.single_flight.clear()
+            scraper.fetch_day_content(old_date)
+            assert mocked_submit_form.call_count == 2
+
+            store_on(cache_path, today - timedelta(days=5))
+            scraper.single_flight.clear()
+            scraper.fetch_day_content(old_date)
+            assert mocked_submit_form.call_count == 2
+
+        with tempfile.TemporaryDirectory() as cache_path, patch.object(
+            BCRALiborScraper,
+            'submit_form',
+            return_value='foo'
+        ) as mocked_submit_form:
+            scraper = BCRALiborScraper(url, rates, intermediate_panel_path=None, transport='http', cache_path=cache_path)
+
+            scraper.fetch_day_content(yesterday)
+            store_on(cache_path, today - timedelta(seconds=1))
+            scraper.single_flight.clear()
+            scraper.fetch_day_content(yesterday)
+            assert mocked_submit_form.call_count == 2
+
+    def test_concurrent_fetches_share_one_request(self):
+        """Probar que los pedidos concurrentes de la misma página compartan un único request"""
+        rates = {}
+        url = 'http://www.bcra.gov.ar/PublicacionesEstadisticas/libor.asp'
+
+        def submit_form(values):
+            time.sleep(0.05)
+            return object()
+
+        with patch.object(
+            BCRALiborScraper,
+            'submit_form',
+            side_effect=submit_form
+        ) as mocked_submit_form:
+            scraper = BCRALiborScraper(url, rates, intermediate_panel_path=None, transport='http', concurrency=4)
+            contents = scraper.fetch_tasks(
+                [1, 2, 3, 4], lambda task: scraper.fetch_day_content(date(2019, 3, 4))
+            )
+
+        assert mocked_submit_form.call_count == 1
+        assert len(set(id(content) for content in contents.values())) == 1
+        # Las páginas de una fecha no se retienen después de la descarga
+        assert not scraper.single_flight.results
+
+    def test_fill_html_form(self):
+        """Probar que el formulario se complete con los valores de las opciones"""
+        url = 'http://www.bcra.gov.ar/PublicacionesEstadisticas/Evolucion_moneda.asp'
+        content = '''
+            <form method="post" action="Evolucion_moneda_2.asp">
+                <select name="Fecha">
+                    <option value="04/03/2019">04/03/2019</option>
+                </select>
+                <select name="Moneda">
+                    <option value="0">Seleccione Moneda</option>
+                    <option value="2">Euro</option>
+                </select>
+                <input type="hidden" name="tipo" value="1">
+                <input type="submit" name="B1" value="Consultar">
+            </form>
+        '''
+        form = HTMLForm.from_content(url, content, ['Fecha', 'Moneda'])
+        data = form.fill({'Fecha': '04/03/2019', 'Moneda': 'Euro'})
+
+        assert form.action == 'http://www.bcra.gov.ar/PublicacionesEstadisticas/Evolucion_moneda_2.asp'
+        assert form.method == 'POST'
+        assert data == {'Fecha': '04/03/2019', 'Moneda': '2', 'tipo': '1', 'B1': 'Consultar'}
+
     def test_parse_from_intermediate_panel(self):
         start_date = '2019-03-15'
         end_date = '2019-03-15'
@@ -736,3 +1071,191 @@ class BcraLiborScraperTestCase(unittest.TestCase):
                     'libor_360_dias': '0.028405'
                 }
             ]
+
+    def test_parse_day_content_with_lxml_matches_html_parser(self):
+        """Probar que lxml extraiga los mismos valores que html.parser en las páginas guardadas"""
+        rates = {
+            "30": "libor_30_dias",
+            "60": "libor_60_dias",
+            "90": "libor_90_dias",
+            "180": "libor_180_dias",
+            "360": "libor_360_dias"
+        }
+        scrapers = [
+            BCRALiborScraper('', rates, intermediate_panel_path=None, html_parser=html_parser)
+            for html_parser in ['html.parser', 'lxml']
+        ]
+        pages = glob.glob(os.path.join(os.path.dirname(__file__), 'pages', 'libor', '*.html'))
+
+        assert pages
+        for page in pages:
+            with open(page, encoding='utf-8', newline='') as page_file:
+                content = page_file.read()
+            results = [
+                scraper.parse_day_content(date(2019, 3, 15), content)
+                for scraper in scrapers
+            ]
+            assert results[0] == results[1], page
+
+
+    def test_parse_day_content_from_page_without_closing_tags(self):
+        """Probar que html.parser y lxml extraigan las mismas tasas de una página con celdas sin cerrar"""
+        rates = {
+            "30": "libor_30_dias",
+            "60": "libor_60_dias",
+            "90": "libor_90_dias",
+            "180": "libor_180_dias",
+            "360": "libor_360_dias"
+        }
+        page = os.path.join(os.path.dirname(__file__), 'pages', 'libor', 'libor_2019-04-01_sin_cierres.html')
+        with open(page, encoding='utf-8', newline='') as page_file:
+            content = page_file.read()
+
+        for html_parser in ['html.parser', 'lxml']:
+            scraper = BCRALiborScraper('', rates, intermediate_panel_path=None, html_parser=html_parser)
+
+            assert scraper.parse_day_content(date(2019, 4, 1), content) == {
+                'indice_tiempo': date(2019, 4, 1),
+                '30': '2,491630',
+                '60': '2,586750',
+                '90': '2,600630',
+                '180': '2,660380',
+                '360': '2,716630'
+            }, html_parser
+
+    def test_parse_day_content_reuses_cached_rows(self):
+        """Probar que un mismo html se parsee una sola vez y que el cache descarte el documento más viejo"""
+        rates = {"30": "libor_30_dias"}
+        scraper = BCRALiborScraper('', rates, intermediate_panel_path=None)
+        scraper.parsed_documents.max_size = 2
+        pages = sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'pages', 'libor', '*.html')))
+        contents = []
+        for page in pages:
+            with open(page, encoding='utf-8', newline='') as page_file:
+                contents.append(page_file.read())
+
+        first = scraper.parse_day_content(date(2019, 3, 15), contents[0])
+        second = scraper.parse_day_content(date(2019, 3, 15), contents[0])
+
+        assert first == second
+        assert (scraper.parsed_documents.hits, scraper.parsed_documents.misses) == (1, 1)
+
+        for content in ['<table></table>', '<table><tbody></tbody></table>']:
+            scraper.parse_day_content(date(2019, 3, 15), content)
+        assert len(scraper.parsed_documents) == 2
+        scraper.parse_day_content(date(2019, 3, 15), contents[0])
+        assert (scraper.parsed_documents.hits, scraper.parsed_documents.misses) == (1, 4)
+
+    def test_fetch_contents_parses_in_process_pool(self):
+        """Probar que con parse_workers las páginas se parseen en el pool a medida que se descargan"""
+        rates = {
+            "30": "libor_30_dias",
+            "60": "libor_60_dias",
+            "90": "libor_90_dias",
+            "180": "libor_180_dias",
+            "360": "libor_360_dias"
+        }
+        pages = sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'pages', 'libor', '*.html')))
+        contents = {}
+        for n, page in enumerate(pages):
+            with open(page, encoding='utf-8', newline='') as page_file:
+                contents[date(2019, 3, 11) + timedelta(days=n)] = page_file.read()
+        start_date, end_date = min(contents), max(contents)
+
+        results = []
+        for parse_workers in [0, 2]:
+            scraper = BCRALiborScraper(
+                '', rates, intermediate_panel_path=None, skip_clean_last_dates=True,
+                transport='http', parse_workers=parse_workers
+            )
+            with scraper, \
+                    patch.object(scraper, 'parse_from_intermediate_panel', return_value={}), \
+                    patch.object(scraper, 'save_intermediate_panel'), \
+                    patch.object(scraper, 'fetch_day_content', side_effect=contents.get):
+                with patch.object(ParsePool, 'submit', autospec=True, side_effect=ParsePool.submit) as submit:
+                    results.append(scraper.run(start_date, end_date, []))
+            assert submit.call_count == (len(contents) if parse_workers else 0)
+            assert scraper.parse_pool is None
+
+        assert results[0] == results[1]
+        assert any(day['libor_30_dias'] for day in results[1].values())
+
+    def test_close_parse_pool_cancels_queued_documents(self):
+        """Probar que al cerrar el pool se cancelen los documentos que no empezaron a parsearse"""
+        pool = ParsePool('html.parser', workers=1, max_pending=8)
+        futures = [pool.submit(sleep_and_extract, str(n)) for n in range(8)]
+        futures[0].result()
+        pool.close()
+
+        assert pool.executor is None
+        assert futures[-1].cancelled()
+        assert all(future.done() for future in futures)
+        assert not pool.futures
+        for _ in range(8):
+            assert pool.pending.acquire(blocking=False)
+
+    def test_run_retains_pages_bounded_by_concurrency(self):
+        """Probar que run parsee cada página apenas llega, de modo que las páginas retenidas dependan de la concurrencia y no del rango"""
+        rates = {"30": "libor_30_dias"}
+        pages = []
+        for page in sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'pages', 'libor', '*.html'))):
+            with open(page, encoding='utf-8', newline='') as page_file:
+                pages.append(page_file.read())
+        start_date = date(2018, 1, 1)
+        end_date = start_date + timedelta(days=299)
+        lock = threading.Lock()
+        counts = {'fetched': 0, 'parsed': 0, 'retained': 0}
+        batches = []
+
+        def fetch_day_content(single_date):
+            with lock:
+                counts['fetched'] += 1
+                counts['retained'] = max(counts['retained'], counts['fetched'] - counts['parsed'])
+            return pages[single_date.toordinal() % len(pages)]
+
+        scraper = BCRALiborScraper('', rates, intermediate_panel_path=None, skip_clean_last_dates=True, concurrency=3)
+        parse_page = scraper.parse_page
+        preprocess_pages = scraper.preprocess_pages
+
+        def parse_fetched_page(single_date, content):
+            assert isinstance(content, ExtractedDocument)
+            with lock:
+                counts['parsed'] += 1
+            return parse_page(single_date, content)
+
+        def preprocess_fetched_pages(rows):
+            batches.append(len(rows))
+            return preprocess_pages(rows)
+
+        with patch.object(scraper, 'parse_from_intermediate_panel', return_value={}), \
+                patch.object(scraper, 'save_intermediate_panel'), \
+                patch.object(scraper, 'fetch_day_content', side_effect=fetch_day_content), \
+                patch.object(scraper, 'parse_page', side_effect=parse_fetched_page), \
+                patch.object(scraper, 'preprocess_pages', side_effect=preprocess_fetched_pages), \
+                patch.object(BCRALiborScraper, 'PREPROCESS_BATCH_SIZE', 16):
+            parsed = scraper.run(start_date, end_date, [])
+
+        assert list(parsed) == [start_date + timedelta(days=n) for n in range(300)]
+        assert counts['fetched'] == counts['parsed'] == 300
+        assert counts['retained'] <= 2 * 3 + 2
+        assert sum(batches) == 300
+        assert max(batches) == 16
+        assert not scraper.streaming
+
+    def test_iter_fetch_tasks_waits_for_the_consumer(self):
+        """Probar que las descargas esperen a que se consuman los contenidos"""
+        scraper = BCRALiborScraper('', {}, intermediate_panel_path=None, transport='http', concurrency=2)
+        fetched = []
+
+        def fetch(task):
+            fetched.append(task)
+            return str(task)
+
+        consumed, max_pending = 0, 0
+        for task, content in scraper.iter_fetch_tasks(list(range(20)), fetch):
+            time.sleep(0.01)
+            consumed += 1
+            max_pending = max(max_pending, len(fetched) - consumed)
+
+        assert consumed == 20
+        assert max_pending <= 5
@@ -6,22 +6,31 @@ from unittest.mock import patch, MagicMock
 from decimal import Decimal
 
 import pandas as pd
+import glob
 import io
 import json
+import os
+import tempfile
 
 from bs4 import BeautifulSoup
 
 from bcra_scraper import BCRASMLScraper
+from bcra_scraper.scraper_sml import stream_table
 from bcra_scraper.bcra_scraper import validate_url_config
 from bcra_scraper.bcra_scraper import validate_url_has_value
 from bcra_scraper.bcra_scraper import validate_coins_key_config
 from bcra_scraper.bcra_scraper import validate_coins_key_has_values
 from bcra_scraper.exceptions import InvalidConfigurationError
 from bcra_scraper.bcra_scraper import read_config
+from bcra_scraper.scraper_base import HTTPTransport
+from bcra_scraper.rate_limiter import reset_rate_limiters
 
 
 class BcraSmlScraperTestCase(unittest.TestCase):
 
+    def setUp(self):
+        reset_rate_limiters()
+
     def test_html_is_valid(self):
         """Probar que el html sea valido"""
         url = ""
@@ -103,6 +112,28 @@ class BcraSmlScraperTestCase(unittest.TestCase):
                 'real': 'foo'
             }
 
+    def test_fetch_contents_once_per_coin(self):
+        """Probar que la página de cada moneda se pida una vez entre el primer ciclo y el refetch"""
+        coins = {
+            "peso_uruguayo": "Peso Uruguayo",
+            "real": "Real"
+        }
+        url = 'http://www.bcra.gov.ar/PublicacionesEstadisticas/Tipo_de_cambio_sml.asp'
+
+        with patch.object(
+            BCRASMLScraper,
+            'submit_form',
+            side_effect=lambda values: values['moneda']
+        ) as mocked_submit_form:
+            scraper = BCRASMLScraper(url, coins, intermediate_panel_path=None, types={}, transport='http')
+            contents = scraper.fetch_contents(date(2019, 4, 1), date(2019, 4, 10), {}, scraper.empty_fetched_contents())
+            refetched = scraper.fetch_contents(date(2019, 3, 1), date(2019, 3, 10), {}, contents)
+
+        assert mocked_submit_form.call_count == 2
+        assert len(contents['real']) == 10
+        assert contents['real'][date(2019, 4, 1)] == 'Real'
+        assert refetched['peso_uruguayo'][date(2019, 3, 5)] == 'Peso Uruguayo'
+
     def test_parse_content_with_valid_content(self):
 
         start_date = datetime(2019, 4, 24)
@@ -149,6 +180,70 @@ class BcraSmlScraperTestCase(unittest.TestCase):
                 }
             ]
 
+    def test_parse_content_walks_table_once(self):
+        """Probar que la tabla de una moneda se recorra una sola vez para todas las fechas"""
+        coin = "peso_uruguayo"
+        types = {
+            "peso_uruguayo": {
+                "Tipo de cambio de Referencia": "Tipo de cambio de Referencia",
+                "Tipo de cambio URINUSCA": "Tipo de cambio URINUSCA",
+                "Tipo de cambio SML Peso Uruguayo": "Tipo de cambio SML Peso Uruguayo",
+                "Tipo de cambio SML Uruguayo Peso": "Tipo de cambio SML Uruguayo Peso"
+            }
+        }
+
+        content = '''
+        <table>
+            <thead>
+                <tr>
+                    <th>Fecha</th>
+                    <th>Tipo de cambio de Referencia</th>
+                    <th>Tipo de cambio URINUSCA</th>
+                    <th>Tipo de cambio SML Peso Uruguayo</th>
+                    <th>Tipo de cambio SML Uruguayo Peso</th>
+                </tr>
+            </thead>
+            <tbody>
+                <tr>
+                    <td>24/04/2019</td>
+                    <td>43,47830</td>
+                    <td>34,51000</td>
+                    <td>1,25990</td>
+                    <td>0,79375</td>
+                </tr>
+                <tr>
+                    <td>25/04/2019</td>
+                    <td>43,57830</td>
+                    <td>34,61000</td>
+                    <td>1,26990</td>
+                    <td>0,78375</td>
+                </tr>
+            </tbody>
+        </table>
+        '''
+
+        scraper = BCRASMLScraper('', {}, intermediate_panel_path=None, types=types)
+        with patch.object(
+            scraper,
+            'parse_table',
+            wraps=scraper.parse_table
+        ) as mocked_parse_table:
+            results = [
+                scraper.parse_content(content, coin, single_date)
+                for single_date in [date(2019, 4, 24), date(2019, 4, 25), date(2019, 4, 26)]
+            ]
+
+        assert mocked_parse_table.call_count == 1
+        assert results[1] == {
+            'coin': 'peso_uruguayo',
+            'indice_tiempo': date(2019, 4, 25),
+            'Tipo de cambio de Referencia': '43,57830',
+            'Tipo de cambio URINUSCA': '34,61000',
+            'Tipo de cambio SML Peso Uruguayo': '1,26990',
+            'Tipo de cambio SML Uruguayo Peso': '0,78375'
+        }
+        assert results[2]['Tipo de cambio de Referencia'] == ''
+
     def test_parse_content_with_non_valid_content(self):
 
         start_date = datetime(2019, 4, 11)
@@ -384,6 +479,34 @@ class BcraSmlScraperTestCase(unittest.TestCase):
                 content = scraper.fetch_content(coins)
                 assert content == "foo"
 
+    def test_fetch_content_revalidating_cached_page(self):
+        """Probar que la página de una moneda se revalide con un request condicional"""
+        coins = {}
+        url = 'http://www.bcra.gov.ar/PublicacionesEstadisticas/Tipo_de_cambio_sml.asp'
+
+        response = MagicMock()
+        response.status_code = 200
+        response.headers = {'Content-Type': 'text/html; charset=utf-8', 'ETag': '"abc"'}
+        response.text = 'foo'
+        not_modified_response = MagicMock()
+        not_modified_response.status_code = 304
+        not_modified_response.headers = {}
+
+        with tempfile.TemporaryDirectory() as cache_path, patch.object(
+            HTTPTransport,
+            '_send_form',
+            side_effect=[response, not_modified_response]
+        ) as mocked_send_form:
+            scraper = BCRASMLScraper(url, coins, intermediate_panel_path=None, types={}, transport='http', cache_path=cache_path)
+
+            assert scraper.fetch_content('Real') == 'foo'
+            scraper.single_flight.clear()
+            assert scraper.fetch_content('Real') == 'foo'
+
+        assert mocked_send_form.call_count == 2
+        assert mocked_send_form.call_args_list[0][1]['headers'] == {}
+        assert mocked_send_form.call_args_list[1][1]['headers'] == {'If-None-Match': '"abc"'}
+
     def test_fetch_content_invalid_url_patching_driver(self):
         """Probar fetch content con url invalida"""
         coins = {}
@@ -1046,3 +1169,88 @@ class BcraSmlScraperTestCase(unittest.TestCase):
         result = scraper.get_intermediate_panel_data_from_parsed(parsed)
 
         assert result == []
+
+    def test_parse_table_with_lxml_matches_html_parser(self):
+        """Probar que lxml extraiga los mismos valores que html.parser en las páginas guardadas"""
+        coins = {'peso_uruguayo': 'Peso Uruguayo', 'real': 'Real'}
+        scrapers = [
+            BCRASMLScraper('', coins, intermediate_panel_path=None, types={}, html_parser=html_parser)
+            for html_parser in ['html.parser', 'lxml']
+        ]
+        pages = glob.glob(os.path.join(os.path.dirname(__file__), 'pages', 'sml', '*.html'))
+
+        assert pages
+        for page in pages:
+            with open(page, encoding='utf-8', newline='') as page_file:
+                content = page_file.read()
+            results = [scraper.parse_table(content) for scraper in scrapers]
+            assert results[0] == results[1], page
+
+    def test_parse_table_with_stream_matches_html_parser(self):
+        """Probar que el extractor incremental extraiga los mismos valores que html.parser en las páginas guardadas"""
+        coins = {'peso_uruguayo': 'Peso Uruguayo', 'real': 'Real'}
+        scrapers = [
+            BCRASMLScraper('', coins, intermediate_panel_path=None, types={}, stream_tables=stream_tables)
+            for stream_tables in [False, True]
+        ]
+        pages = glob.glob(os.path.join(os.path.dirname(__file__), 'pages', 'sml', '*.html'))
+
+        assert pages
+        for page in pages:
+            with open(page, encoding='utf-8', newline='') as page_file:
+                content = page_file.read()
+            results = [scraper.parse_table(content) for scraper in scrapers]
+            assert results[0] == results[1], page
+
+
+    def test_parse_table_from_page_without_closing_tags(self):
+        """Probar que html.parser, lxml y el extractor incremental extraigan las mismas filas de una página con celdas sin cerrar"""
+        coins = {'real': 'Real'}
+        page = os.path.join(os.path.dirname(__file__), 'pages', 'sml', 'real_sin_cierres.html')
+        with open(page, encoding='utf-8', newline='') as page_file:
+            content = page_file.read()
+        scrapers = [
+            BCRASMLScraper('', coins, intermediate_panel_path=None, types={}, html_parser=html_parser)
+            for html_parser in ['html.parser', 'lxml']
+        ] + [
+            BCRASMLScraper('', coins, intermediate_panel_path=None, types={}, stream_tables=True)
+        ]
+
+        for scraper in scrapers:
+            head_rows, body_rows = scraper.parse_table(content)
+
+            assert [cell.strip() for cell in head_rows[0]] == [
+                'Fecha',
+                'Tipo de cambio de Referencia',
+                'Tipo de cambio PTAX',
+                'Tipo de cambio SML Peso Real',
+                'Tipo de cambio SML Real Peso'
+            ]
+            assert body_rows == {
+                '01/04/2019': ['01/04/2019', '43,35330', '3,84520', '11,27440', '0,08869'],
+                '02/04/2019': ['02/04/2019', '43,44500', '3,86880', '11,22950', '0,08905'],
+                '03/04/2019': ['03/04/2019', '43,12830', '3,84870', '11,21240', '0,08918'],
+                '04/04/2019': ['04/04/2019', '', '3,87250', '', '']
+            }
+
+    def test_parse_table_with_stream_stops_after_date_window(self):
+        """Probar que el extractor incremental solo guarde las fechas de la ejecución y deje de leer al pasarlas"""
+        coins = {'peso_uruguayo': 'Peso Uruguayo'}
+        page = os.path.join(os.path.dirname(__file__), 'pages', 'sml', 'peso_uruguayo.html')
+        with open(page, encoding='utf-8', newline='') as page_file:
+            content = page_file.read()
+        read = []
+
+        def chunks():
+            for line in content.splitlines(keepends=True):
+                read.append(line)
+                yield line
+
+        headers_rows, rows = stream_table(chunks(), (date(2019, 4, 2), date(2019, 4, 3)))
+        complete_headers_rows, complete_rows = BCRASMLScraper(
+            '', coins, intermediate_panel_path=None, types={}
+        ).parse_table(content)
+
+        assert headers_rows == complete_headers_rows
+        assert rows == {day: complete_rows[day] for day in ['02/04/2019', '03/04/2019']}
+        assert len(read) < len(content.splitlines())
@@ -1,4 +1,8 @@
 from datetime import datetime, date
+import glob
+import json
+import os
+import tempfile
 import unittest
 from decimal import Decimal
 from unittest.mock import patch, MagicMock
@@ -7,10 +11,19 @@ import pandas as pd
 from bs4 import BeautifulSoup
 
 from bcra_scraper import BCRATCEScraper
+from bcra_scraper.exceptions import InvalidConfigurationError
+from bcra_scraper.browser import BrowserDriverLifecycle, BrowserDriverPool
+from bcra_scraper.bcra_scraper import write_file
+from bcra_scraper.normalize import from_fixed_point
+from bcra_scraper.records import records_to_frame
+from bcra_scraper.rate_limiter import reset_rate_limiters
 
 
 class BcraTceScraperTestCase(unittest.TestCase):
 
+    def setUp(self):
+        reset_rate_limiters()
+
     def test_html_is_valid(self):
         """Probar que el html sea valido"""
         url = ""
@@ -101,6 +114,122 @@ class BcraTceScraperTestCase(unittest.TestCase):
                 }
             ]
 
+    def test_fetch_contents_using_browser_pool(self):
+        coins = {
+            "dolar": "DOLAR",
+            "euro": "EURO"
+        }
+        start_date = date(2019, 4, 22)
+        end_date = date(2019, 4, 24)
+        url = ''
+        entities = {"galicia": "BANCO DE GALICIA Y BUENOS AIRES S.A.U."}
+        drivers = []
+
+        def create_browser_driver():
+            driver = MagicMock()
+            drivers.append(driver)
+            return driver
+
+        scraper = BCRATCEScraper(url, coins, entities, intermediate_panel_path=None, transport='browser', pool_size=3)
+
+        def fetch_content(single_date, coin):
+            assert scraper.get_browser_driver() in drivers
+            return f'{coin} {single_date}'
+
+        with patch.object(
+            scraper,
+            '_create_browser_driver',
+            side_effect=create_browser_driver
+        ), patch.object(
+            scraper,
+            'fetch_content',
+            side_effect=fetch_content
+        ):
+            result = scraper.fetch_contents(start_date, end_date, {}, scraper.empty_fetched_contents())
+
+        assert len(drivers) <= 3
+        assert result == {
+            'dolar': {
+                date(2019, 4, 22): 'DOLAR 2019-04-22',
+                date(2019, 4, 23): 'DOLAR 2019-04-23',
+                date(2019, 4, 24): 'DOLAR 2019-04-24',
+            },
+            'euro': {
+                date(2019, 4, 22): 'EURO 2019-04-22',
+                date(2019, 4, 23): 'EURO 2019-04-23',
+                date(2019, 4, 24): 'EURO 2019-04-24',
+            }
+        }
+
+    def test_recycle_browser_driver_after_max_pages(self):
+        """Probar que el navegador se reinicie después de cargar la cantidad máxima de páginas"""
+        coins = {}
+        url = ''
+        entities = {}
+        drivers = []
+
+        def create_browser_driver():
+            driver = MagicMock(spec=['quit'])
+            drivers.append(driver)
+            return driver
+
+        scraper = BCRATCEScraper(url, coins, entities, intermediate_panel_path=None, max_pages_per_driver=2)
+
+        with patch.object(
+            scraper,
+            '_create_browser_driver',
+            side_effect=create_browser_driver
+        ):
+            with scraper:
+                used = [scraper.get_browser_driver() for _ in range(5)]
+
+        assert used == [drivers[0], drivers[0], drivers[1], drivers[1], drivers[2]]
+        assert all(driver.quit.call_count == 1 for driver in drivers)
+
+    def test_browser_pool_recycles_driver_on_release(self):
+        """Probar que el pool reemplace el navegador que debe reiniciarse"""
+        drivers = []
+
+        def create_browser_driver():
+            driver = MagicMock(spec=['quit'])
+            drivers.append(driver)
+            return driver
+
+        lifecycle = BrowserDriverLifecycle(create_browser_driver, max_pages=1)
+        pool = BrowserDriverPool(lifecycle.create, 1, lifecycle=lifecycle)
+
+        with pool.driver() as driver:
+            lifecycle.count_page(driver)
+        with pool.driver() as new_driver:
+            pass
+
+        assert new_driver is not driver
+        assert driver.quit.call_count == 1
+        assert pool.drivers == [new_driver]
+
+    def test_browser_rss_is_sampled_with_cached_pids(self):
+        """Probar que la memoria del navegador se mida cada algunas páginas reusando los pids"""
+        driver = MagicMock(spec=['quit'])
+        lifecycle = BrowserDriverLifecycle(
+            lambda: driver, max_pages=None, max_rss_mb=100,
+            rss_check_pages=3, rss_check_seconds=3600
+        )
+
+        with patch('bcra_scraper.browser.register_driver'), \
+                patch('bcra_scraper.browser.reap_orphan_drivers'), \
+                patch('bcra_scraper.browser.get_driver_pid', return_value=10), \
+                patch('bcra_scraper.browser.is_process_alive', return_value=True), \
+                patch('bcra_scraper.browser.get_descendant_pids', return_value=[11, 12]) as descendants, \
+                patch('bcra_scraper.browser.get_driver_rss_mb', return_value=50) as rss:
+            lifecycle.create()
+            for _ in range(9):
+                lifecycle.count_page(driver)
+                assert not lifecycle.should_recycle(driver)
+
+        assert rss.call_count == 3
+        assert all(call[0][1] == [10, 11, 12] for call in rss.call_args_list)
+        assert descendants.call_count == 1
+
     def test_parse_contents(self):
         url = ''
         start_date = datetime(2019, 4, 22)
@@ -685,6 +814,240 @@ class BcraTceScraperTestCase(unittest.TestCase):
             }
         ]
 
+    def test_parse_content_with_precompiled_matchers(self):
+        """Probar que los matchers de las entidades se compilen una sola vez"""
+        coin = "dolar"
+        channels = {'channels': {'mostrador': True, 'electronico': True}}
+        entities = {
+            "galicia": {
+                "name": "BANCO DE GALICIA Y BUENOS AIRES S.A.U.",
+                "coins": {"dolar": {"11": channels, "13": channels, "15": channels}}
+            },
+            "nacion": {
+                "name": "BANCO DE LA NACION ARGENTINA",
+                "coins": {"dolar": {"11": channels, "13": channels, "15": channels}}
+            }
+        }
+        cells = ''.join(f'<td>{value},000</td>' for value in range(1, 13))
+        content = f'''
+            <table class="table table-BCRA table-bordered table-hover table-responsive">
+            <tbody>
+            <tr><td><b>Entidades Financieras</b></td></tr>
+            <tr><td>BANCO DE LA NACION ARGENTINA</td>{cells}</tr>
+            <tr><td>BANCO DE GALICIA Y BUENOS AIRES S.A.U.</td>{cells}</tr>
+            </tbody></table>
+        '''
+
+        scraper = BCRATCEScraper('', {}, entities, intermediate_panel_path=None)
+        result = scraper.parse_content(content, date(2019, 4, 22), coin, entities)
+        matchers = scraper.get_schema(entities).get_matchers()
+        scraper.parse_content(content, date(2019, 4, 23), coin, entities)
+
+        assert scraper.get_schema(entities).get_matchers() is matchers
+        assert result['indice_tiempo'] == date(2019, 4, 22)
+        assert result['tc_ars_dolar_galicia_mostrador_compra_11hs'] == '1,000'
+        assert result['tc_ars_dolar_nacion_electronico_venta_15hs'] == '12,000'
+        assert result['tc_ars_dolar_nacion_mostrador_venta_13hs'] == '6,000'
+
+    def test_schema_shared_by_parse_panel_and_header(self):
+        """Probar que el parseo, el panel y el encabezado usen las mismas columnas"""
+        enabled = {"channels": {"mostrador": True, "electronico": True}}
+        disabled = {"channels": {"mostrador": False, "electronico": True}}
+        entities = {
+            "nacion": {
+                "name": "BANCO DE LA NACION ARGENTINA",
+                "coins": {"dolar": {"11": enabled, "13": disabled, "15": enabled}}
+            }
+        }
+        scraper = BCRATCEScraper('', {}, entities, intermediate_panel_path=None)
+        schema = scraper.get_schema()
+
+        parsed = scraper.get_parsed(date(2019, 4, 22), 'dolar', entities)
+        header = schema.get_header('dolar')
+
+        assert scraper.get_schema(entities) is schema
+        assert list(parsed) == ['indice_tiempo'] + schema.get_columns('dolar')
+        assert set(parsed) == set(header)
+        assert len(header) == 11
+        assert 'tc_ars_dolar_nacion_mostrador_compra_13hs' not in header
+        assert schema.get_panel_key('tc_ars_dolar_nacion_mostrador_venta_11hs') == (
+            'dolar', 'nacion', 'mostrador', 'venta', '11hs'
+        )
+        assert schema.get_column(('dolar', 'nacion', 'mostrador', 'venta', '11hs')) == (
+            'tc_ars_dolar_nacion_mostrador_venta_11hs'
+        )
+
+    def test_schema_ignores_unknown_channels(self):
+        """Probar que un canal que no está en la página no tenga columna en el parseo ni en el encabezado"""
+        hours = {"channels": {"mostrador": True, "web": True, "electronico": False}}
+        entities = {
+            "nacion": {
+                "name": "BANCO DE LA NACION ARGENTINA",
+                "coins": {"dolar": {"11": hours, "13": hours, "15": hours}}
+            }
+        }
+        scraper = BCRATCEScraper('', {}, entities, intermediate_panel_path=None)
+        schema = scraper.get_schema()
+
+        parsed = scraper.get_parsed(date(2019, 4, 22), 'dolar', entities)
+        header = schema.get_header('dolar')
+        columns = schema.get_entity_columns('nacion', 'dolar')
+
+        assert header == ['indice_tiempo'] + schema.get_columns('dolar')
+        assert list(parsed) == header
+        assert len(header) == 7
+        assert not any('_web_' in column for column in header)
+        assert [column for column, _ in columns] == header[1:]
+
+    def test_schema_rejects_malformed_entity_config(self):
+        """Probar que una entidad sin canales configurados sea un error de configuración"""
+        entities = {
+            "nacion": {
+                "name": "BANCO DE LA NACION ARGENTINA",
+                "coins": {"dolar": {"11": {"mostrador": True}}}
+            }
+        }
+        scraper = BCRATCEScraper('', {}, entities, intermediate_panel_path=None)
+        schema = scraper.get_schema()
+
+        with self.assertRaises(InvalidConfigurationError):
+            schema.get_columns('dolar')
+        with self.assertRaises(InvalidConfigurationError):
+            schema.get_entity_columns('nacion', 'dolar')
+        with self.assertRaises(InvalidConfigurationError):
+            scraper.get_schema({"nacion": {"name": "NACION"}}).get_columns('dolar')
+        assert schema.get_columns('euro') == []
+
+    def test_parse_from_intermediate_panel_skips_disabled_channels(self):
+        """Probar que los canales deshabilitados no se lean del panel intermedio"""
+        enabled = {"channels": {"mostrador": True, "electronico": True}}
+        disabled = {"channels": {"mostrador": False, "electronico": True}}
+        entities = {
+            "nacion": {
+                "name": "BANCO DE LA NACION ARGENTINA",
+                "coins": {"dolar": {"11": enabled, "13": disabled, "15": enabled}}
+            }
+        }
+        df_panel = pd.DataFrame([
+            {
+                'indice_tiempo': '2019-04-22', 'moneda': 'dolar',
+                'entidad_bancaria': 'nacion', 'canal': channel,
+                'flujo': 'compra', 'hora': '13hs', 'valor': Decimal('41.5')
+            }
+            for channel in ['mostrador', 'electronico']
+        ])
+
+        with patch.object(
+            BCRATCEScraper,
+            'read_intermediate_panel_dataframe',
+            return_value=df_panel
+        ):
+            scraper = BCRATCEScraper('', {}, entities, intermediate_panel_path=None)
+            parsed = scraper.parse_from_intermediate_panel()
+
+        assert parsed['dolar'][date(2019, 4, 22)] == {
+            'indice_tiempo': date(2019, 4, 22),
+            'tc_ars_dolar_nacion_electronico_compra_13hs': Decimal('41.5')
+        }
+
+    def test_parse_from_intermediate_panel_with_fixed_point(self):
+        """Probar que con fixed_point se lean del panel los mismos valores, con el mismo texto"""
+        hours = {"11": {"channels": {"mostrador": True, "electronico": True}}}
+        entities = {
+            "nacion": {
+                "name": "BANCO DE LA NACION ARGENTINA",
+                "coins": {"dolar": hours, "euro": hours}
+            }
+        }
+        values = {
+            ('dolar', 'mostrador'): ['41.500', '41.250', '0.000', ''],
+            ('dolar', 'electronico'): ['41.55', '-0.05', '41.60', '41.60'],
+            ('euro', 'mostrador'): ['47.0000100', '', '47.0000000', '0.0'],
+        }
+        rows = [
+            {
+                'indice_tiempo': f'2019-04-{day + 22}', 'moneda': coin,
+                'entidad_bancaria': 'nacion', 'canal': channel,
+                'flujo': 'compra', 'hora': '11hs', 'valor': value
+            }
+            for (coin, channel), series in values.items()
+            for day, value in enumerate(series)
+        ]
+
+        with tempfile.TemporaryDirectory() as panel_dir:
+            panel_path = os.path.join(panel_dir, 'panel.csv')
+            scrapers = [
+                BCRATCEScraper('', {}, entities, intermediate_panel_path=panel_path, fixed_point=fixed_point)
+                for fixed_point in [False, True]
+            ]
+            scrapers[0].write_intermediate_panel(rows, panel_path)
+            with patch('bcra_scraper.scraper_base.from_fixed_point', wraps=from_fixed_point) as convert:
+                results = [scraper.parse_from_intermediate_panel() for scraper in scrapers]
+                assert convert.call_count == 2
+
+            rows.append(dict(rows[0], indice_tiempo='2019-04-26', valor='41.5'))
+            scrapers[0].write_intermediate_panel(rows, panel_path)
+            with patch('bcra_scraper.scraper_base.from_fixed_point', wraps=from_fixed_point) as convert:
+                fallback = scrapers[1].parse_from_intermediate_panel()
+                # Solo la serie de euro se sigue leyendo con punto fijo
+                assert convert.call_count == 1
+
+        as_text = lambda parsed: {
+            coin: {
+                day: {column: str(value) for column, value in row.items()}
+                for day, row in days.items()
+            }
+            for coin, days in parsed.items()
+        }
+        assert results[1] == results[0]
+        assert as_text(results[1]) == as_text(results[0])
+        dolar = results[1]['dolar'][date(2019, 4, 23)]
+        assert str(dolar['tc_ars_dolar_nacion_mostrador_compra_11hs']) == '41.250'
+        assert str(dolar['tc_ars_dolar_nacion_electronico_compra_11hs']) == '-0.05'
+        assert results[1]['dolar'][date(2019, 4, 24)]['tc_ars_dolar_nacion_mostrador_compra_11hs'] is None
+        assert str(results[1]['euro'][date(2019, 4, 22)]['tc_ars_euro_nacion_mostrador_compra_11hs']) == '47.0000100'
+        assert str(fallback['dolar'][date(2019, 4, 26)]['tc_ars_dolar_nacion_mostrador_compra_11hs']) == '41.5'
+
+    def test_parsed_days_share_record_schema(self):
+        """Probar que los días parseados compartan el esquema y se escriban como diccionarios"""
+        hours = {"11": {"channels": {"mostrador": True, "electronico": False}}}
+        entities = {
+            "nacion": {
+                "name": "BANCO DE LA NACION ARGENTINA",
+                "coins": {"dolar": hours}
+            }
+        }
+        scraper = BCRATCEScraper('', {}, entities, intermediate_panel_path=None)
+        days = [
+            scraper.get_parsed(day, 'dolar', entities)
+            for day in ['22/04/2019', '23/04/2019']
+        ]
+        for day, value in zip(days, ['41,500', '']):
+            day['tc_ars_dolar_nacion_mostrador_compra_11hs'] = value
+            day['tc_ars_dolar_nacion_mostrador_venta_11hs'] = value
+
+        with self.assertRaises(KeyError):
+            days[0]['tc_ars_dolar_nacion_electronico_compra_11hs'] = ''
+
+        rows = scraper.preprocess_rows(days)
+        assert rows[0].schema is rows[1].schema
+        assert rows[0] == {
+            'indice_tiempo': date(2019, 4, 22),
+            'tc_ars_dolar_nacion_mostrador_compra_11hs': Decimal('41.500'),
+            'tc_ars_dolar_nacion_mostrador_venta_11hs': Decimal('41.500'),
+        }
+        assert records_to_frame(rows).columns.tolist() == list(rows[0])
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            output_path = os.path.join(output_dir, 'tce.csv')
+            write_file(list(rows[0]), rows, output_path)
+            with open(output_path) as output:
+                assert output.read().splitlines() == [
+                    'indice_tiempo,tc_ars_dolar_nacion_mostrador_compra_11hs,tc_ars_dolar_nacion_mostrador_venta_11hs',
+                    '2019-04-22,41.500,41.500',
+                    '2019-04-23,,',
+                ]
+
     def test_parse_content_not_table(self):
 
         start_date = datetime(2019, 4, 22)
@@ -1599,3 +1962,76 @@ class BcraTceScraperTestCase(unittest.TestCase):
                 'electronico_venta_15hs': Decimal('0.0')
             }
         ]
+
+    def test_parse_content_with_lxml_matches_html_parser(self):
+        """Probar que lxml extraiga los mismos valores que html.parser en las páginas guardadas"""
+        config_path = os.path.join(os.path.dirname(__file__), '..', 'config_general.json.sample')
+        with open(config_path) as config_file:
+            entities = json.load(config_file)['tce']['entities']
+        scrapers = [
+            BCRATCEScraper('', {}, entities, intermediate_panel_path=None, html_parser=html_parser)
+            for html_parser in ['html.parser', 'lxml']
+        ]
+        pages = glob.glob(os.path.join(os.path.dirname(__file__), 'pages', 'tce', '*.html'))
+
+        assert pages
+        for page in pages:
+            with open(page, encoding='utf-8', newline='') as page_file:
+                content = page_file.read()
+            for coin in ['dolar', 'euro']:
+                results = [
+                    scraper.parse_content(content, date(2019, 4, 22), coin, entities)
+                    for scraper in scrapers
+                ]
+                assert results[0] == results[1], page
+
+    def test_parse_content_from_page_without_closing_tags(self):
+        """Probar que html.parser y lxml extraigan los mismos valores de una página con celdas sin cerrar"""
+        config_path = os.path.join(os.path.dirname(__file__), '..', 'config_general.json.sample')
+        with open(config_path) as config_file:
+            entities = json.load(config_file)['tce']['entities']
+        page = os.path.join(os.path.dirname(__file__), 'pages', 'tce', 'dolar_2019-04-23_sin_cierres.html')
+        with open(page, encoding='utf-8', newline='') as page_file:
+            content = page_file.read()
+        values = {
+            'galicia': [
+                '42,550', '44,450', '42,600', '44,400',
+                '42,650', '44,550', '42,700', '44,500',
+                '42,700', '44,600', '42,750', '44,550'
+            ],
+            'bna': [
+                '42,700', '44,300', '', '',
+                '42,750', '44,350', '', '',
+                '42,800', '44,400', '', ''
+            ],
+            'santander': [
+                '42,400', '44,500', '42,450', '44,450',
+                '42,500', '44,600', '42,550', '44,550',
+                '42,550', '44,650', '42,600', '44,600'
+            ],
+            'itau': [
+                '42,300', '44,700', '', '',
+                '42,350', '44,750', '', '',
+                '42,400', '44,800', '', ''
+            ],
+        }
+        channels = [
+            f'{channel}_{flow}_{hour}'
+            for hour in ['11hs', '13hs', '15hs']
+            for channel in ['mostrador', 'electronico']
+            for flow in ['compra', 'venta']
+        ]
+
+        for html_parser in ['html.parser', 'lxml']:
+            scraper = BCRATCEScraper('', {}, entities, intermediate_panel_path=None, html_parser=html_parser)
+            result = scraper.parse_content(content, date(2019, 4, 23), 'dolar', entities)
+
+            assert result['indice_tiempo'] == date(2019, 4, 23)
+            for entity, entity_values in values.items():
+                assert [
+                    result[f'tc_ars_dolar_{entity}_{channel}'] for channel in channels
+                ] == entity_values, html_parser
+            assert not any(
+                value for key, value in result.items()
+                if key != 'indice_tiempo' and key.split('_')[3] not in values
+            ), html_parser